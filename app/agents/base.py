@@ -1,13 +1,126 @@
 from abc import ABC, abstractmethod
+import time
 import numpy as np
+from typing import Callable, Dict, List, Optional
+from app.agents.solver import empty_cells, solve
 
 class BaseAgent(ABC):
+    # 探索統計のフック (エージェント, 統計) 。add_stats_hook で登録する。
+    # 登録が無ければ publish_stats は何もしない（計測を無効にしているときの負荷は0）
+    stats_hooks: List[Callable[["BaseAgent", dict], None]] = []
+
+    # 局面解析に対応するか。対応するエージェントは analyze(board) で
+    # 手番側から見た (最善手, 打てる列ごとの評価値) を返す
+    supports_analysis = False
+
     def __init__(self, name: str = "BaseAgent"):
         self.name = name
+        # 直近の get_action の探索情報 (到達深さ、シミュレーション回数、経過時間など)
+        self.search_info: dict = {}
+        # 直近の get_action でルートの各列に割いた探索量（MCTS の訪問回数）。自己対局の学習データ用で、
+        # 探索量を出せないエージェントや、定跡・読み切りで打った場合は None
+        self.root_visits: Optional[Dict[int, int]] = None
+        # 探索の途中経過を受け取るコールバック（WebSocketへの配信用）。
+        # get_action の間だけ設定され、エージェントをプロセス間で受け渡すときは None にしておく
+        self.on_progress: Optional[Callable[[dict], None]] = None
+        self._last_progress = 0.0
+        # 探索の前に引く定跡 (OpeningBook)。登録された局面では探索せずに定跡手を返す
+        self.opening_book = None
+        # 空きマスがこの数以下になったら探索の代わりに終盤ソルバーで読み切る（0で無効）
+        self.solver_threshold = 0
+        # 1手あたりの思考時間 (ミリ秒)。対応するエージェントが設定する
+        self.time_budget_ms: Optional[int] = None
+        # ディスパッチャの1手の制限時間の期限 (time.perf_counter() の値)。get_action の間だけ設定される
+        self.move_deadline: Optional[float] = None
 
     @abstractmethod
     def get_action(self, board: np.ndarray, valid_moves: list) -> int:
         """
         現在の盤面と合法手を受け取り、選択した列（int）を返す。
         """
-        pass
\ No newline at end of file
+        pass
+
+    def book_move(self, state) -> Optional[int]:
+        """定跡に登録された局面ならその手を返し、search_info に定跡手であることを記録する"""
+        if self.opening_book is None:
+            return None
+        start = time.perf_counter()
+        move = self.opening_book.lookup(state)
+        if move is not None:
+            self.search_info = {"book": True, "elapsed_ms": (time.perf_counter() - start) * 1000}
+        return move
+
+    def solver_move(self, state) -> Optional[int]:
+        """
+        空きマスが solver_threshold 以下なら終局まで読み切った最善手を返し、
+        search_info に勝敗の結果を記録する。それより多ければ None。
+        読み切りに使うのは、思考時間と1手の制限時間の短い方の半分まで。
+        読み切れなければ None を返し、残りの時間で通常の探索をさせる
+        """
+        if empty_cells(state) > self.solver_threshold:
+            return None
+        now = time.perf_counter()
+        limits = []
+        if self.time_budget_ms:
+            limits.append(self.time_budget_ms / 1000)
+        if self.move_deadline is not None:
+            limits.append(self.move_deadline - now)
+        result = solve(state, deadline=now + min(limits) / 2 if limits else None)
+        if result is None:
+            return None
+        (move, _), self.search_info = result
+        return move
+
+    def ponder(self, board: np.ndarray, deadline: float, stop: Callable[[], bool]) -> int:
+        """
+        相手の手番の局面 board で、相手の応手に備えて探索の状態（探索木や置換表）を温めておく（先読み）。
+        deadline (time.perf_counter() の値) を過ぎるか stop() が真になったら戻り、行った探索量
+        （シミュレーション回数やノード数）を返す。対応しないエージェントは何もしない。
+        """
+        return 0
+
+    # 途中経過を通知する最短の間隔（秒）
+    PROGRESS_INTERVAL = 0.2
+
+    def report_progress(self, info: dict, force: bool = False):
+        """探索の途中経過（現時点の最善手、シミュレーション回数や深さ）を通知する"""
+        if self.on_progress is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self._last_progress < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self.on_progress(info)
+
+    @staticmethod
+    def add_stats_hook(hook: Callable[["BaseAgent", dict], None]):
+        BaseAgent.stats_hooks.append(hook)
+
+    @staticmethod
+    def remove_stats_hook(hook: Callable[["BaseAgent", dict], None]):
+        BaseAgent.stats_hooks.remove(hook)
+
+    def publish_stats(self, rows: int, cols: int, search_info: Optional[dict] = None):
+        """
+        直近の get_action / analyze の統計（search_info に盤面サイズと種類を加えたもの）をフックに渡す。
+        探索をワーカープロセスで行った場合は、戻ってきたエージェントまたは search_info を使って
+        このプロセスから呼ぶ。
+        """
+        if not BaseAgent.stats_hooks:
+            return
+        info = self.search_info if search_info is None else search_info
+        stats = {"agent": self.kind, "rows": rows, "cols": cols, **info}
+        for hook in BaseAgent.stats_hooks:
+            hook(self, stats)
+
+    @property
+    def kind(self) -> str:
+        """統計の集計単位にするエージェントの種類 ("minimax", "mcts" など)"""
+        return type(self).__name__.replace("Agent", "").lower()
+
+    def memory_estimate(self) -> int:
+        """
+        探索のために保持している状態（置換表や探索木）のおおよそのバイト数。
+        セッションストアがメモリ上限を超えたときの追い出しに使う。
+        """
+        return 0
@@ -0,0 +1,62 @@
+from typing import Optional
+
+from app.agents.base import BaseAgent
+from app.agents.random_agent import RandomAgent
+from app.agents.minimax_agent import MinimaxAgent
+from app.agents.mcts_agent import MCTSAgent
+from app.agents.opening_book import book_for
+from app.schemas import AgentType, GameConfig
+
+
+def create_agent(agent_type: AgentType, config: GameConfig) -> Optional[BaseAgent]:
+    """
+    設定からエージェントを作る。Humanはエージェントを持たないので None。
+    対局のセッションのほか、局面解析ではワーカー側でまとめごとに新しく作るのに使う。
+    使えないエージェント（学習済みの重みが無い NeuralMCTS など）は ValueError
+    """
+    if agent_type == AgentType.HUMAN:
+        return None
+
+    book = book_for(config.rows, config.cols) if config.use_opening_book else None
+    agent = None
+    if agent_type == AgentType.RANDOM:
+        agent = RandomAgent()
+    elif agent_type == AgentType.MINIMAX:
+        agent = MinimaxAgent(
+            depth=config.minimax_depth,
+            time_budget_ms=config.time_budget_ms,
+            tt_size=config.minimax_tt_size,
+            workers=config.minimax_workers,
+            opening_book=book,
+            solver_threshold=config.solver_threshold,
+        )
+    elif agent_type == AgentType.MCTS:
+        agent = MCTSAgent(
+            simulation_limit=config.mcts_simulations,
+            parallel=config.mcts_parallel,
+            workers=config.mcts_workers,
+            rollout_batch=config.mcts_rollout_batch,
+            rave=config.mcts_rave,
+            heavy_playouts=config.mcts_heavy_playouts,
+            time_budget_ms=config.time_budget_ms,
+            opening_book=book,
+            solver_threshold=config.solver_threshold,
+        )
+    elif agent_type == AgentType.NEURAL:
+        # torch の読み込みは重いので、使うときだけ読み込む（ワーカープロセスには読み込ませない）
+        try:
+            from app.agents.neural_agent import NeuralMCTSAgent
+            from app.agents.network import model_path
+        except ImportError:
+            raise ValueError("Neural agent requires PyTorch")
+        # 未学習のネットワークでは弱い手しか打てないため、学習済みの重みが無ければ対局させない
+        if model_path() is None:
+            raise ValueError("Neural agent requires trained network weights (set MIRAI_NN_MODEL)")
+        agent = NeuralMCTSAgent(
+            simulation_limit=config.neural_simulations,
+            batch_size=config.neural_batch_size,
+            time_budget_ms=config.time_budget_ms,
+            opening_book=book,
+            solver_threshold=config.solver_threshold,
+        )
+    return agent
@@ -0,0 +1,146 @@
+"""
+方策・価値ネットワークのまとめ推論サービス。
+
+探索（NeuralMCTSAgent）は葉の局面を submit して結果を待つ。サービスのスレッドがキューから
+要求を集め、max_batch_size 件たまるか、最初の要求から max_wait_ms 経つまで待ってから
+1回の順伝播で評価する。同じプロセスで並行して動いている探索（別の対局を含む）の要求も
+同じバッチに入るため、CPU でも1局面ずつ評価するより大幅に安くなる。
+
+サービスはプロセスに1つ (get_inference_service)。設定は環境変数で行う:
+- MIRAI_NN_MODEL: 重みファイル（app.agents.network.load_model を参照）
+- MIRAI_NN_UNTRAINED: 1 なら重みファイルが無いときに未学習のネットワークで代用する（arena での動作確認用）
+- MIRAI_NN_BATCH: 1回の順伝播の最大局面数（既定 64）
+- MIRAI_NN_WAIT_MS: バッチがたまるのを待つ最大時間（既定 2ms）
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from app.agents.network import PolicyValueNet, load_model
+
+# (列ごとの事前確率, 手番側から見た価値)
+Evaluation = Tuple[np.ndarray, float]
+
+
+class InferenceService:
+    def __init__(self, model: PolicyValueNet, max_batch_size: int = 64, max_wait_ms: float = 2.0):
+        self.model = model.eval()
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Optional[Tuple[np.ndarray, np.ndarray, Future]]]" = queue.Queue()
+        self._closed = False
+        self.batches = 0  # 順伝播の回数
+        self.positions = 0  # 評価した局面数
+        self._thread = threading.Thread(target=self._run, name="inference", daemon=True)
+        self._thread.start()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.positions / self.batches if self.batches else 0.0
+
+    def submit(self, planes: np.ndarray, legal: np.ndarray) -> "Future[Evaluation]":
+        """
+        planes: network.encode の入力, legal: 打てる列の bool 配列。
+        打てない列の確率は 0 にして正規化した方策を返す。
+        """
+        if self._closed:
+            raise RuntimeError("Inference service is closed")
+        future: "Future[Evaluation]" = Future()
+        self._queue.put((planes, legal, future))
+        return future
+
+    def evaluate(self, requests: List[Tuple[np.ndarray, np.ndarray]]) -> List[Evaluation]:
+        """複数の局面をまとめて投入し、すべての結果を待つ"""
+        futures = [self.submit(planes, legal) for planes, legal in requests]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._forward(batch)
+            if stop:
+                return
+
+    def _forward(self, batch: List[Tuple[np.ndarray, np.ndarray, Future]]):
+        # 盤面サイズが違う局面は同じテンソルにできないので、サイズごとに順伝播する
+        groups: Dict[Tuple[int, ...], List[Tuple[np.ndarray, np.ndarray, Future]]] = {}
+        for item in batch:
+            groups.setdefault(item[0].shape, []).append(item)
+        for items in groups.values():
+            try:
+                with torch.inference_mode():
+                    x = torch.from_numpy(np.stack([planes for planes, _, _ in items]))
+                    logits, values = self.model(x)
+                    logits, values = logits.numpy(), values.numpy()
+            except Exception as e:
+                for _, _, future in items:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.positions += len(items)
+            for (_, legal, future), row, value in zip(items, logits, values):
+                future.set_result((_masked_softmax(row, legal), float(value)))
+
+
+def _masked_softmax(logits: np.ndarray, legal: np.ndarray) -> np.ndarray:
+    masked = np.where(legal, logits, -np.inf)
+    exp = np.exp(masked - masked.max())
+    return exp / exp.sum()
+
+
+# --- プロセス内で共有するサービス ---
+
+_service: Optional[InferenceService] = None
+_service_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_inference_service() -> InferenceService:
+    """
+    このプロセスのサービス（初回に作る）。fork した子プロセスには親のスレッドが無いため、
+    プロセスが変わっていれば作り直す。
+    """
+    global _service, _service_pid
+    with _lock:
+        if _service is None or _service_pid != os.getpid():
+            _service = InferenceService(
+                load_model(allow_untrained=os.environ.get("MIRAI_NN_UNTRAINED") == "1"),
+                max_batch_size=int(os.environ.get("MIRAI_NN_BATCH", 64)),
+                max_wait_ms=float(os.environ.get("MIRAI_NN_WAIT_MS", 2.0)),
+            )
+            _service_pid = os.getpid()
+        return _service
+
+
+def shutdown_inference_service():
+    global _service
+    with _lock:
+        service, _service = _service, None
+    if service is not None and _service_pid == os.getpid():
+        service.close()
@@ -1,167 +1,550 @@
 import numpy as np
-import math
 import random
-import copy
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
 from app.agents.base import BaseAgent
-from app.core.game import Connect4Game, Player
-
-class MCTSNode:
-    def __init__(self, state, parent=None, action=None):
-        self.state = state  # 盤面の状態 (np.ndarray)
-        self.parent = parent
-        self.action = action  # このノードに到達するために打った手
-        self.children = []
-        self.visits = 0
-        self.value = 0  # 勝利: +1, 敗北: -1, 引き分け: 0
-        self.untried_actions = self._get_legal_actions(state)
-
-    def _get_legal_actions(self, board):
-        """盤面から合法手（列番号）のリストを取得"""
-        return [c for c in range(board.shape[1]) if board[0][c] == 0]
-
-    def is_fully_expanded(self):
-        return len(self.untried_actions) == 0
-
-    def best_child(self, c_param=1.414):
-        """UCB1スコアに基づいて最も有望な子ノードを選択"""
-        choices_weights = [
-            (child.value / child.visits) + c_param * math.sqrt((2 * math.log(self.visits) / child.visits))
-            for child in self.children
-        ]
-        return self.children[np.argmax(choices_weights)]
+from app.agents.mcts_tree import DRAW, WIN, SearchTree, orientation_of
+from app.agents.opening_book import OpeningBook
+from app.agents.solver import empty_cells
+from app.core.game import BitBoard, Player, line_windows
+from app.schemas import ParallelMode
+from app.workers import default_workers, get_executor, in_worker, reset_executor
+
 
 class MCTSAgent(BaseAgent):
-    def __init__(self, simulation_limit=1000):
+    C_PARAM = 1.414  # UCB1 の探索項の係数
+    PONDER_CHUNK = 64  # 先読みで打ち切りを確認する間隔（シミュレーション回数）
+    supports_analysis = True
+
+    def __init__(self, simulation_limit=1000, reuse_tree=True,
+                 parallel: ParallelMode = ParallelMode.NONE, workers: Optional[int] = None,
+                 leaf_batch_size: int = 8, rollout_batch: int = 1,
+                 time_budget_ms: Optional[int] = None, seed: Optional[int] = None,
+                 opening_book: Optional[OpeningBook] = None, solver_threshold: int = 0,
+                 rave: bool = False, rave_k: float = 500, heavy_playouts: bool = False):
         """
         simulation_limit: 1手を選択するために行うシミュレーション回数
+        reuse_tree: 前回の探索木のうち、実際に進んだ局面の部分木を次の手番で再利用する
+        parallel: 並列化の方式（ParallelMode）
+        workers: 並列時に処理を分割するワーカー数（Noneならプールのワーカー数）
+        leaf_batch_size: Leaf並列で1ワーカーに渡すロールアウト数
+        rollout_batch: 1回のシミュレーションで葉から同時に行うロールアウト数。
+                       2以上ならNumPyでまとめて対局し、平均報酬を逆伝播する
+        time_budget_ms: 1手あたりの思考時間 (ミリ秒)。指定時は simulation_limit の代わりに
+                        期限まで反復を続ける
+        seed: 一括ロールアウト用の乱数生成器のシード（再現性が必要な対戦評価用）。
+              逐次のロールアウトは random モジュールを使うため、そちらは呼び出し側でシードを設定する
+        opening_book: 探索の前に引く定跡
+        solver_threshold: 空きマスがこの数以下になったらロールアウトの代わりに終局まで読み切る（0で無効）
+        rave: 選択で、子の平均報酬に AMAF 統計（その手をシミュレーション中に後で打った回の報酬）を混ぜる
+        rave_k: RAVE の等価パラメータ。子の訪問回数がこの程度になると AMAF の重みが半分まで下がる
+        heavy_playouts: 逐次ロールアウトで、即勝ちの手があれば打ち、相手の即勝ちがあれば塞ぐ
+                        （rollout_batch > 1 や Leaf並列の一括ロールアウトはランダムのまま）
         """
         super().__init__(name=f"MCTS(sims={simulation_limit})")
         self.simulation_limit = simulation_limit
+        self.reuse_tree = reuse_tree
+        self.parallel = ParallelMode(parallel)
+        self.workers = workers or default_workers()
+        self.leaf_batch_size = leaf_batch_size
+        self.rollout_batch = max(rollout_batch, 1)
+        self.time_budget_ms = time_budget_ms
+        self._rng = np.random.default_rng(seed)
+        self._tree: Optional[SearchTree] = None  # 前回の探索木（自分の手を打った後の局面がルート）
+        self._tree_shape = None  # 前回の探索木の盤面サイズ
+        self._max_depth: Optional[int] = 0  # 直近の探索で選択が到達した最大の深さ
+        self.opening_book = opening_book
+        self.solver_threshold = solver_threshold
+        self.rave = rave
+        self.rave_k = rave_k
+        self.heavy_playouts = heavy_playouts
+
+    def reset(self):
+        """保持している探索木を破棄する"""
+        self._tree = None
+
+    def memory_estimate(self) -> int:
+        return self._tree.memory_bytes() if self._tree is not None else 0
+
+    @property
+    def uses_process_pool(self) -> bool:
+        """探索自体がプロセスプールを使うか（プールのワーカー内ではさらにプールを作らず逐次探索する）"""
+        return self.parallel != ParallelMode.NONE and self.workers > 1 and not in_worker()
 
     def get_action(self, board: np.ndarray, valid_moves: list) -> int:
-        # ルートノードの作成
-        root = MCTSNode(state=board.copy())
-        
-        # プレイヤーの特定（現在の手番）
-        # Connect4Gameロジックでは、手番プレイヤーはboardからは自明ではないため、
-        # 盤面の駒数をカウントして推定します（先攻P1=1, 後攻P2=-1）
-        p1_pieces = np.sum(board == Player.P1)
-        p2_pieces = np.sum(board == Player.P2)
-        current_player = Player.P1 if p1_pieces == p2_pieces else Player.P2
-
-        for _ in range(self.simulation_limit):
-            node = self._tree_policy(root, current_player)
-            reward = self._default_policy(node.state, current_player) # シミュレーション実行
-            self._backup(node, reward)
-
-        # 最も訪問回数が多い手を選択（頑健な選択）
-        best_child_node = root.best_child(c_param=0) # 探索項なしで純粋な評価
-        return best_child_node.action
-
-    def _tree_policy(self, node: MCTSNode, root_player):
+        start = time.perf_counter()
+        deadline = start + self.time_budget_ms / 1000 if self.time_budget_ms else None
+
+        # 手番プレイヤーは盤面の駒数から推定します（先攻P1=1, 後攻P2=-1）
+        state = BitBoard.from_array(board)
+        self._max_depth = 0
+        self.root_visits = None
+
+        move = self.book_move(state)
+        if move is None:
+            move = self.solver_move(state)
+        if move is not None:
+            self._tree = None  # 定跡・読み切りの間は木を育てないので、探索に戻るときは新しい木にする
+            return move
+
+        if self.parallel == ParallelMode.ROOT and self.uses_process_pool:
+            try:
+                action, simulations = self._root_parallel_action(state, deadline)
+                self._max_depth = None  # 木はワーカー側にしか無いため分からない
+                self._record_search(start, simulations, simulations * self.rollout_batch)
+                return action
+            except BrokenProcessPool:
+                reset_executor() # ワーカーが落ちた場合は逐次探索で続行
+
+        # 探索木の作成（前回の木に現局面があればそこから先を引き継ぐ）
+        tree = self._find_subtree(state) if self.reuse_tree else None
+        if tree is None:
+            tree = self._new_tree(self.simulation_limit + 1)
+            tree.root = tree.add(state)
+
+        # 引き継いだ訪問回数の分だけ今回のシミュレーションを減らす
+        simulations = max(self.simulation_limit - int(tree.visits[tree.root]), 1)
+        tree.reserve(simulations)
+        if self.parallel == ParallelMode.LEAF and self.uses_process_pool:
+            try:
+                done = self._leaf_parallel_search(tree, state, simulations, deadline)
+                rollouts = done  # Leaf並列では1回 = 1ロールアウトとして数えている
+            except BrokenProcessPool:
+                reset_executor()
+                done = self._search(tree, state, simulations, deadline)
+                rollouts = done * self.rollout_batch
+        else:
+            done = self._search(tree, state, simulations, deadline)
+            rollouts = done * self.rollout_batch
+
+        edge = self._best_edge(tree)
+        action = state.canonical_move(int(tree.edge_action[edge]))
+        self.root_visits = self._root_visits(tree, state)
+
+        # 自分の手を打った後の局面から辿れる部分だけを次回用に残す
+        if self.reuse_tree:
+            self._tree = tree.extract(int(tree.edge_child[edge]))
+            self._tree_shape = (state.rows, state.cols)
+        self._record_search(start, done, rollouts)
+        return action
+
+    def ponder(self, board: np.ndarray, deadline: float, stop: Callable[[], bool]) -> int:
+        """
+        前回残した木（自分の手を打った後の局面がルート）を育てておく。相手がどの手を打っても、
+        次の get_action はその局面の部分木を引き継ぎ、訪問済みの分だけシミュレーションが減る。
+        木を再利用しない設定、Root並列（木がワーカー側にしか無い）、次の手を読み切りで打つ局面では何もしない。
+        """
+        if not self.reuse_tree or (self.parallel == ParallelMode.ROOT and self.uses_process_pool):
+            return 0
+        state = BitBoard.from_array(board)
+        if empty_cells(state) - 1 <= self.solver_threshold:
+            return 0
+        tree = self._find_subtree(state)
+        if tree is None:
+            tree = self._new_tree(self.PONDER_CHUNK + 1)
+            tree.root = tree.add(state)
+        self._max_depth = 0
+        done = 0
+        while not tree.terminal[tree.root] and not stop() and time.perf_counter() < deadline:
+            tree.reserve(self.PONDER_CHUNK)
+            done += self._search(tree, state, self.PONDER_CHUNK)
+        self._tree = tree
+        self._tree_shape = (state.rows, state.cols)
+        return done
+
+    def analyze(self, board: np.ndarray) -> Tuple[Optional[int], Dict[int, float]]:
+        """
+        手番側から見た、打てる列ごとの評価値（平均報酬 -1〜1）と最善手（最多訪問）を返す（局面解析用）。
+        解析は1局面ずつ独立に行うため、探索木の再利用や並列探索は使わない。
+        """
+        start = time.perf_counter()
+        deadline = start + self.time_budget_ms / 1000 if self.time_budget_ms else None
+        state = BitBoard.from_array(board)
+        tree = self._new_tree(self.simulation_limit + 1)
+        tree.root = tree.add(state)
+        self._max_depth = 0
+        done = self._search(tree, state, self.simulation_limit, deadline) if not tree.terminal[tree.root] else 0
+        self._record_search(start, done, done * self.rollout_batch)
+        visits = {}
+        scores = {}
+        for action, child in tree.children(tree.root):
+            col = state.canonical_move(action)
+            visits[col] = int(tree.visits[child])
+            if visits[col]:
+                scores[col] = float(tree.value[child]) / visits[col]
+        if state.is_symmetric():
+            # 展開しなかった鏡像の手は、対応する手と同じ評価値
+            for col, score in list(scores.items()):
+                scores.setdefault(state.cols - 1 - col, score)
+        if not visits:
+            return None, scores
+        return max(visits, key=visits.get), scores
+
+    def _search(self, tree: SearchTree, root_state: BitBoard, simulations: int,
+                deadline: Optional[float] = None) -> int:
+        """
+        tree.root（局面は root_state）から simulations 回（deadline 指定時は期限まで、最低1回）反復し、
+        実行した回数を返す。
+        """
+        root_player = root_state.current_player
+        orientations = [] if self.rave else None
+        done = 0
+        while (done < simulations) if deadline is None else (done == 0 or time.perf_counter() < deadline):
+            path, state = self._tree_policy(tree, root_state, orientations)
+            if len(path) > self._max_depth:
+                self._max_depth = len(path) - 1
+            reward = self._default_policy(tree, path[-1], state, root_player) # シミュレーション実行
+            tree.backup(path, reward)
+            if orientations is not None:
+                self._backup_amaf(tree, root_state, path, orientations, state, reward)
+            done += 1
+            if self.on_progress is not None and done % 64 == 0:
+                self._report_progress(tree, root_state, done)
+        return done
+
+    @staticmethod
+    def _root_visits(tree: SearchTree, state: BitBoard) -> Dict[int, int]:
+        """ルートの列ごとの訪問回数。左右対称な局面では、展開しなかった鏡像の列も同じ回数にする"""
+        visits = {}
+        for action, child in tree.children(tree.root):
+            visits[state.canonical_move(action)] = int(tree.visits[child])
+        if state.is_symmetric():
+            for col, n in list(visits.items()):
+                visits.setdefault(state.cols - 1 - col, n)
+        return visits
+
+    def _best_edge(self, tree: SearchTree) -> int:
+        """探索後にルートで選ぶ辺（探索項なしの平均報酬が最も高い手）"""
+        return tree.select(tree.root, c_param=0)
+
+    def _report_progress(self, tree: SearchTree, root_state: BitBoard, simulations: int):
+        children = tree.children(tree.root)
+        if children:
+            action, _ = max(children, key=lambda item: tree.visits[item[1]])
+            self.report_progress({"best_move": root_state.canonical_move(action), "simulations": simulations})
+
+    def _record_search(self, start: float, simulations: int, rollouts: int):
+        self.search_info = {
+            "simulations": simulations,
+            "rollouts": rollouts,
+            "max_depth": self._max_depth,
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    # --- Parallel Search ---
+
+    def _root_parallel_action(self, state: BitBoard, deadline: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Root並列化: 各ワーカーが同じ局面から独立に木を育て、
+        ルート直下の訪問回数・価値を合算して最も訪問された手を選ぶ。
+        木はワーカー側にしか無いため、この方式では木の再利用は行わない。
+        (選んだ手, 全ワーカーの合計シミュレーション回数) を返す。
+        """
+        self._tree = None
+        executor = get_executor()
+        share, extra = divmod(self.simulation_limit, self.workers)
+        # 期限はプロセスをまたいで共有できないため、残り時間として渡す
+        budget = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+        futures = [
+            executor.submit(_root_parallel_worker, state, share + (1 if i < extra else 0),
+                            random.getrandbits(64), budget, self.rave, self.rave_k, self.heavy_playouts,
+                            self.rollout_batch)
+            for i in range(self.workers)
+        ]
+        visits: Dict[int, int] = {}
+        values: Dict[int, float] = {}
+        simulations = 0
+        for future in futures:
+            stats, done = future.result()
+            simulations += done
+            for action, (n, v) in stats.items():
+                visits[action] = visits.get(action, 0) + n
+                values[action] = values.get(action, 0) + v
+        self.root_visits = visits
+        # 訪問回数が同じなら平均価値の高い手
+        return max(visits, key=lambda a: (visits[a], values[a] / visits[a])), simulations
+
+    def _leaf_parallel_search(self, tree: SearchTree, root_state: BitBoard, simulations: int,
+                              deadline: Optional[float] = None) -> int:
+        """
+        Leaf並列化: 選択・展開はこのプロセスで行い、選ばれた葉からのロールアウトを
+        workers * leaf_batch_size 回まとめてワーカーに配って、合計をまとめて逆伝播する。
+        実行したロールアウト回数を返す。
+        """
+        executor = get_executor()
+        root_player = root_state.current_player
+        orientations = [] if self.rave else None
+        batch = self.workers * self.leaf_batch_size
+        done = 0
+        while (done < simulations) if deadline is None else (done == 0 or time.perf_counter() < deadline):
+            path, state = self._tree_policy(tree, root_state, orientations)
+            if len(path) > self._max_depth:
+                self._max_depth = len(path) - 1
+            if tree.terminal[path[-1]]:
+                # 終局ノードはロールアウト不要
+                reward = self._default_policy(tree, path[-1], state, root_player)
+                tree.backup(path, reward)
+                if orientations is not None:
+                    self._backup_amaf(tree, root_state, path, orientations, state, reward)
+                done += 1
+                continue
+            count = batch if deadline is not None else min(batch, simulations - done)
+            share, extra = divmod(count, self.workers)
+            futures = [
+                executor.submit(_rollout_worker, state, root_player, share + (1 if i < extra else 0),
+                                random.getrandbits(64))
+                for i in range(self.workers) if share + (1 if i < extra else 0) > 0
+            ]
+            total = sum(future.result() for future in futures)
+            tree.backup(path, total, count)
+            if orientations is not None:
+                # ロールアウトの手順はワーカー側にしか無いため、木の中の手だけで AMAF を更新する
+                self._backup_amaf(tree, root_state, path, orientations, state, total, count)
+            done += count
+            if self.on_progress is not None:
+                self._report_progress(tree, root_state, done)
+        return done
+
+    # --- Tree Search ---
+
+    def _find_subtree(self, state: BitBoard) -> Optional[SearchTree]:
+        """
+        前回残した木（自分の手を打った後の局面がルート）から現局面のノードを探し、
+        そこから辿れる部分を詰めた木を返す。見つからなければ None。
+        """
+        tree, self._tree = self._tree, None
+        if tree is None or self._tree_shape != (state.rows, state.cols):
+            return None
+        node = tree.find(state)
+        if node is None:
+            return None
+        # 辺の手は正規形の向きで持っているため、左右反転した局面に到達していてもそのまま使える
+        return tree.extract(node)
+
+    def _new_tree(self, capacity: int) -> SearchTree:
+        return SearchTree(capacity, amaf=self.rave)
+
+    def _tree_policy(self, tree: SearchTree, root_state: BitBoard,
+                     orientations: Optional[List[int]] = None) -> Tuple[List[int], BitBoard]:
         """
         Selection & Expansion:
-        未展開の行動があれば展開し、そうでなければUCBに従って子を選択して降りる。
-        """
-        current_player = root_player
-        
-        # 深さを追跡してプレイヤーを切り替える必要があるが、
-        # 簡易的にノードの深さで判定
-        
-        while not self._is_terminal(node.state):
-            if not node.is_fully_expanded():
-                return self._expand(node)
-            else:
-                node = node.best_child()
-        return node
-
-    def _expand(self, node: MCTSNode):
-        action = node.untried_actions.pop()
-        next_state = self._get_next_state(node.state, action)
-        child_node = MCTSNode(next_state, parent=node, action=action)
-        node.children.append(child_node)
-        return child_node
-
-    def _default_policy(self, state: np.ndarray, root_player):
+        未展開の辺があれば展開し、そうでなければUCBに従って子を選択して降りる。
+        辿った経路（ルートから葉までのノード）と、葉の局面（root_state に経路の手を打ったコピー）を返す。
+        辺の手は正規形の向きなので、その局面の向きに直して打つ。
+        orientations を渡すと、経路の各局面の向き（AMAF の逆伝播用）を詰め直す。
+        """
+        state = root_state.copy()
+        node = tree.root
+        path = [node]
+        if orientations is not None:
+            orientations.clear()
+            orientations.append(orientation_of(state))
+        rave_k = self.rave_k if self.rave else 0
+        terminal, first_edge, expanded_count = tree.terminal, tree.first_edge, tree.expanded
+        while not terminal[node]:
+            start = int(first_edge[node])
+            if start < 0:
+                tree.create_edges(node, state)
+                start = int(tree.first_edge[node])
+            expanded = int(expanded_count[node])
+            if expanded < tree.edge_total[node]:
+                edge = start + expanded
+                col = state.canonical_move(int(tree.edge_action[edge]))
+                state.play(col)
+                child = tree.node_for(state, col)  # 別の手順で既に作ったノードがあれば共有する
+                # ノードの追加で配列が広がっていることがあるため、tree から引き直す
+                tree.edge_child[edge] = child
+                tree.expanded[node] = expanded + 1
+                path.append(child)
+                if orientations is not None:
+                    orientations.append(orientation_of(state))
+                return path, state
+            edge = tree.select(node, self.C_PARAM, rave_k)
+            state.play(state.canonical_move(int(tree.edge_action[edge])))
+            node = int(tree.edge_child[edge])
+            path.append(node)
+            if orientations is not None:
+                orientations.append(orientation_of(state))
+        return path, state
+
+    @staticmethod
+    def _backup_amaf(tree: SearchTree, root_state: BitBoard, path: List[int], orientations: List[int],
+                     state: BitBoard, reward: float, count: int = 1):
+        """
+        state はシミュレーション後の局面（root_state のコピーに打ち進めたもの）で、
+        ルートから打った手順は root_state より後の moves になる
+        """
+        moves = state.moves[len(root_state.moves):]
+        tree.backup_amaf(path, orientations, moves, state.cols, reward, count)
+
+    def _default_policy(self, tree: SearchTree, node: int, state: BitBoard, root_player):
         """
         Simulation (Rollout):
-        ゲーム終了までランダムに手を打ち続ける。
+        葉の局面 state からゲーム終了までランダムに手を打ち続ける。
         Rootプレイヤーが勝てば +1, 負ければ -1
+        rollout_batch > 1 の場合は、その回数分の平均報酬を返す
         """
-        current_state = state.copy()
-        
-        # 現在の盤面での手番を推定
-        p1_c = np.sum(current_state == Player.P1)
-        p2_c = np.sum(current_state == Player.P2)
-        current_player = Player.P1 if p1_c == p2_c else Player.P2
-
-        # ゲーム終了までループ
-        while True:
-            if self._check_win(current_state, Player.P1):
-                return 1 if root_player == Player.P1 else -1
-            if self._check_win(current_state, Player.P2):
-                return 1 if root_player == Player.P2 else -1
-            
-            valid_moves = [c for c in range(current_state.shape[1]) if current_state[0][c] == 0]
-            if not valid_moves:
-                return 0 # Draw
-            
-            # ランダムに行動
-            action = random.choice(valid_moves)
-            self._apply_move(current_state, action, current_player)
-            
-            # プレイヤー交代
-            current_player = Player.P2 if current_player == Player.P1 else Player.P1
-
-    def _backup(self, node: MCTSNode, reward):
-        """Backpropagation"""
-        while node is not None:
-            node.visits += 1
-            # 階層ごとに手番が入れ替わるため、報酬の視点を反転させる
-            # ノードの親から見て、その手が良かったかどうか
-            node.value += reward
-            reward = -reward # 相手にとっての報酬は逆になる
-            node = node.parent
-
-    # --- Utility Functions (Lightweight Game Logic for Speed) ---
-    # Gameクラスを直接使うと重いので、Numpy操作だけで完結させる
-
-    def _get_next_state(self, board, action):
-        next_board = board.copy()
-        p1_c = np.sum(board == Player.P1)
-        p2_c = np.sum(board == Player.P2)
-        player = Player.P1 if p1_c == p2_c else Player.P2
-        self._apply_move(next_board, action, player)
-        return next_board
-
-    def _apply_move(self, board, col, player):
-        for r in range(board.shape[0] - 1, -1, -1):
-            if board[r][col] == 0:
-                board[r][col] = player
-                return
-
-    def _is_terminal(self, board):
-        return self._check_win(board, Player.P1) or \
-               self._check_win(board, Player.P2) or \
-               len([c for c in range(board.shape[1]) if board[0][c] == 0]) == 0
-
-    def _check_win(self, board, player):
-        # game.pyのロジックを高速化のために流用推奨
-        # ここでは実装簡略化のため、game.pyと同じロジックが必要
-        rows, cols = board.shape
-        # Horizontal
-        for r in range(rows):
-            for c in range(cols - 3):
-                if np.all(board[r, c:c+4] == player): return True
-        # Vertical
-        for r in range(rows - 3):
-            for c in range(cols):
-                if np.all(board[r:r+4, c] == player): return True
-        # Diagonals
-        for r in range(rows - 3):
-            for c in range(cols - 3):
-                if all(board[r+i][c+i] == player for i in range(4)): return True
-        for r in range(rows - 3):
-            for c in range(3, cols):
-                if all(board[r+i][c-i] == player for i in range(4)): return True
-        return False
\ No newline at end of file
+        terminal = tree.terminal[node]
+        if terminal == WIN:
+            # 直前に打ったプレイヤーの勝ち
+            winner = Player.P2 if state.current_player == Player.P1 else Player.P1
+        elif terminal == DRAW:
+            winner = None
+        elif self.rollout_batch > 1:
+            winners = batched_playouts(state, self.rollout_batch, self._rng)
+            return float(np.mean(winners)) * root_player
+        elif self.heavy_playouts:
+            winner = tactical_playout(state)
+        else:
+            winner = random_playout(state)
+        if winner is None:
+            return 0
+        return 1 if winner == root_player else -1
+
+
+def random_playout(state: BitBoard) -> Optional[int]:
+    """
+    state から終局までランダムに手を打ち、勝者を返す（引き分けは None）。state は書き換える。
+    勝敗は直前の石を通るラインだけで判定する。
+    """
+    while True:
+        mover = state.current_player
+        action = random.choice(state.valid_moves())
+        state.play(action)
+        if state.wins_at(action):
+            return mover
+        if state.is_full():
+            return None # Draw
+
+
+def tactical_playout(state: BitBoard) -> Optional[int]:
+    """
+    random_playout と同じだが、即勝ちの手があれば打ち、無ければ相手の即勝ちの列を塞ぐ
+    （塞ぐ列が複数ならその中からランダム）。state は書き換える。
+    """
+    while True:
+        mover = state.current_player
+        opponent = Player.P2 if mover == Player.P1 else Player.P1
+        moves = state.valid_moves()
+        for col in moves:
+            if state.is_winning_move(col):
+                state.play(col)
+                return mover
+        blocks = [col for col in moves if state.is_winning_move(col, opponent)]
+        state.play(random.choice(blocks or moves))
+        if state.is_full():
+            return None # Draw
+
+
+def batched_playouts(state: BitBoard, k: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    state から k 局のランダム対局を同時に進め、各局の勝者 (1, -1, 引き分けは 0) を返す。
+    全局が1手ずつ揃って進むので手番は共通で、盤面が埋まるのも同じ手数目になる。
+    各手では合法な列の中から一様に1列を選び、対局中の局だけを詰めた配列で勝敗を判定する。
+    """
+    if state.cols * state.stride <= 64:
+        return _batched_playouts_bits(state, k, rng)
+    return _batched_playouts_windows(state, k, rng)
+
+
+def _batched_playouts_bits(state: BitBoard, k: int, rng: np.random.Generator) -> np.ndarray:
+    """盤面が64ビットに収まる場合: 各局のビットボードを uint64 配列で持ち、シフト&ANDで一括判定する"""
+    rows, cols, stride = state.rows, state.cols, state.stride
+    plies = rows * cols - sum(state.heights)
+    player = int(state.current_player)
+    to_move = 0 if player == Player.P1 else 1
+
+    winners = np.zeros(k, dtype=np.int8)
+    game = np.arange(k)  # 対局中の局の元の番号
+    heights = np.tile(np.array(state.heights, dtype=np.int64), (k, 1))
+    mover = np.full(k, state.masks[to_move], dtype=np.uint64)
+    waiting = np.full(k, state.masks[1 - to_move], dtype=np.uint64)
+    col_base = np.arange(cols, dtype=np.uint64) * np.uint64(stride)
+    shifts = [(np.uint64(s), np.uint64(2 * s)) for s in (1, stride, stride - 1, stride + 1)]
+    one = np.uint64(1)
+    noise = rng.random((plies, k, cols))
+
+    for ply in range(plies):
+        n = game.size
+        lanes = np.arange(n)
+        # 合法な列にだけ乱数を割り当て、最大のものを選ぶ
+        choice = np.argmax(np.where(heights < rows, noise[ply, :n], -1.0), axis=1)
+        h = heights[lanes, choice]
+        heights[lanes, choice] = h + 1
+        mover = mover | (one << (col_base[choice] + h.astype(np.uint64)))
+
+        won = np.zeros(n, dtype=bool)
+        for s, s2 in shifts:
+            m = mover & (mover >> s)
+            won |= (m & (m >> s2)) != 0
+        if won.any():
+            winners[game[won]] = player
+            keep = ~won
+            game, heights, mover, waiting = game[keep], heights[keep], mover[keep], waiting[keep]
+            if not game.size:
+                break
+        mover, waiting = waiting, mover
+        player = -player
+
+    return winners
+
+
+def _batched_playouts_windows(state: BitBoard, k: int, rng: np.random.Generator) -> np.ndarray:
+    """大きな盤面用: マス配列を持ち、置いた石を含む4マスのウィンドウだけをまとめて調べる"""
+    rows, cols = state.rows, state.cols
+    n_cells = rows * cols
+    windows, cell_windows = line_windows(rows, cols)
+    plies = n_cells - sum(state.heights)
+    player = int(state.current_player)
+
+    winners = np.zeros(k, dtype=np.int8)
+    game = np.arange(k)
+    cells = np.zeros((k, n_cells + 1), dtype=np.int8)  # 末尾は常に空のダミーマス
+    cells[:, :n_cells] = state.to_array().ravel()
+    heights = np.tile(np.array(state.heights, dtype=np.intp), (k, 1))
+    noise = rng.random((plies, k, cols))
+
+    for ply in range(plies):
+        n = game.size
+        lanes = np.arange(n)
+        choice = np.argmax(np.where(heights < rows, noise[ply, :n], -1.0), axis=1)
+        h = heights[lanes, choice]
+        heights[lanes, choice] = h + 1
+        pos = (rows - 1 - h) * cols + choice
+        cells[lanes, pos] = player
+
+        lines = cells[lanes[:, None, None], windows[cell_windows[pos]]]
+        won = (lines == player).all(axis=2).any(axis=1)
+        if won.any():
+            winners[game[won]] = player
+            keep = ~won
+            game, cells, heights = game[keep], cells[keep], heights[keep]
+            if not game.size:
+                break
+        player = -player
+
+    return winners
+
+
+# --- Process Pool Workers (ワーカープロセス側で実行される) ---
+
+def _root_parallel_worker(state: BitBoard, simulations: int, seed: int,
+                          budget: Optional[float] = None, rave: bool = False, rave_k: float = 500,
+                          heavy_playouts: bool = False,
+                          rollout_batch: int = 1) -> Tuple[Dict[int, Tuple[int, float]], int]:
+    # fork したワーカーは乱数状態が同一になるため、タスクごとに種を与える
+    random.seed(seed)
+    deadline = None if budget is None else time.perf_counter() + budget
+    agent = MCTSAgent(simulation_limit=simulations, reuse_tree=False, rollout_batch=rollout_batch,
+                      rave=rave, rave_k=rave_k, heavy_playouts=heavy_playouts)
+    tree = agent._new_tree(simulations + 1)
+    tree.root = tree.add(state)
+    done = agent._search(tree, state, max(simulations, 1), deadline)
+    return {state.canonical_move(action): (int(tree.visits[child]), float(tree.value[child]))
+            for action, child in tree.children(tree.root)}, done
+
+
+def _rollout_worker(state: BitBoard, root_player: int, count: int, seed: int) -> int:
+    winners = batched_playouts(state, count, np.random.default_rng(seed))
+    return int(np.sum(winners)) * root_player
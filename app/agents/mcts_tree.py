@@ -0,0 +1,374 @@
+"""
+MCTS の探索木（置換を共有するDAG）のコンパクトな表現。
+
+ノードごとのPythonオブジェクトは作らず、統計と辺を事前確保した NumPy 配列 (struct-of-arrays) に持つ。
+盤面もノードには持たず、選択のたびにルートの局面から手を打ち直して再構成する。
+
+- ノード: 訪問回数, 価値の合計, 正規形のハッシュ, 最初の辺, 辺の数, 展開済みの辺の数, 終局の種類
+- 辺: 手（正規形の向きの列）, 行き先のノード（未展開は -1）,
+  RAVE を使う場合は AMAF 統計（その手を後で打ったシミュレーションの回数と報酬の合計）,
+  PUCT を使う場合は事前確率（方策ネットワークの出力）
+- 置換表: 正規形のハッシュ -> ノード（オープンアドレス法の配列）
+
+同じ局面（左右反転を含む）に別の手順で到達した場合は同じノードを共有するため、
+木ではなくDAGになる。手番は石の数で決まるので、どの親から見てもノードの手番は同じ。
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.game import BitBoard, Player
+
+# 終局の種類
+ONGOING = 0
+WIN = 1  # このノードへ手を打ったプレイヤーの勝ち
+DRAW = 2
+
+# 局面の向き（AMAF の逆伝播で、実際の列を辺の手に直すため）
+ORIENT_NORMAL = 0
+ORIENT_MIRRORED = 1  # 正規形は左右反転した向き
+ORIENT_SYMMETRIC = 2  # 左右対称（辺は左半分だけ）
+
+_EMPTY_SLOT = -1
+
+
+class SearchTree:
+    """
+    配列は足りなくなったら2倍に広げる。容量は探索前に reserve で確保しておくと、
+    探索中の再確保が起きない（1回のシミュレーションで増えるノードは高々1つ）。
+    """
+
+    def __init__(self, capacity: int = 1024, amaf: bool = False, priors: bool = False):
+        capacity = max(capacity, 16)
+        self.size = 0  # ノード数
+        self.edge_count = 0
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.value = np.zeros(capacity, dtype=np.float64)  # このノードへ手を打ったプレイヤー視点の報酬の合計
+        self.key = np.zeros(capacity, dtype=np.uint64)
+        self.first_edge = np.full(capacity, -1, dtype=np.int32)  # -1: 辺を未作成
+        self.edge_total = np.zeros(capacity, dtype=np.int8)
+        self.expanded = np.zeros(capacity, dtype=np.int8)  # 行き先を作成済みの辺の数（先頭から）
+        self.terminal = np.zeros(capacity, dtype=np.int8)
+        self.edge_action = np.zeros(capacity * 4, dtype=np.int8)
+        self.edge_child = np.full(capacity * 4, -1, dtype=np.int32)
+        # AMAF 統計（辺の手を打つプレイヤー視点）。RAVE を使わないときは確保しない
+        self.amaf_visits = np.zeros(capacity * 4, dtype=np.int32) if amaf else None
+        self.amaf_value = np.zeros(capacity * 4, dtype=np.float64) if amaf else None
+        # 辺の事前確率。PUCT を使わないときは確保しない
+        self.prior = np.zeros(capacity * 4, dtype=np.float32) if priors else None
+        self._slots = np.full(_table_size(capacity), _EMPTY_SLOT, dtype=np.int32)
+        self._slot_mask = len(self._slots) - 1
+        self.root = -1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def memory_bytes(self) -> int:
+        arrays = (self.visits, self.value, self.key, self.first_edge, self.edge_total, self.expanded,
+                  self.terminal, self.edge_action, self.edge_child, self.amaf_visits, self.amaf_value, self.prior,
+                  self._slots)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    @property
+    def has_amaf(self) -> bool:
+        return self.amaf_visits is not None
+
+    @property
+    def has_priors(self) -> bool:
+        return self.prior is not None
+
+    # --- 確保 ---
+
+    def reserve(self, nodes: int):
+        """ノードをあと nodes 個追加しても再確保が起きないようにする"""
+        needed = self.size + nodes
+        if needed > len(self.visits):
+            self._grow_nodes(needed)
+
+    def _grow_nodes(self, capacity: int):
+        old = len(self.visits)
+        capacity = max(capacity, old * 2)
+        for name in ("visits", "value", "key", "edge_total", "expanded", "terminal"):
+            setattr(self, name, _resized(getattr(self, name), capacity, 0))
+        self.first_edge = _resized(self.first_edge, capacity, -1)
+        if _table_size(capacity) > len(self._slots):
+            self._rehash(_table_size(capacity))
+
+    def _grow_edges(self, capacity: int):
+        capacity = max(capacity, len(self.edge_action) * 2)
+        self.edge_action = _resized(self.edge_action, capacity, 0)
+        self.edge_child = _resized(self.edge_child, capacity, -1)
+        if self.has_amaf:
+            self.amaf_visits = _resized(self.amaf_visits, capacity, 0)
+            self.amaf_value = _resized(self.amaf_value, capacity, 0)
+        if self.has_priors:
+            self.prior = _resized(self.prior, capacity, 0)
+
+    def _rehash(self, size: int):
+        self._slots = np.full(size, _EMPTY_SLOT, dtype=np.int32)
+        self._slot_mask = size - 1
+        for node in range(self.size):
+            self._insert(int(self.key[node]), node)
+
+    # --- 置換表 ---
+
+    def _insert(self, key: int, node: int):
+        slots, mask = self._slots, self._slot_mask
+        i = key & mask
+        while slots[i] != _EMPTY_SLOT:
+            i = (i + 1) & mask
+        slots[i] = node
+
+    def find(self, state: BitBoard) -> Optional[int]:
+        """局面（左右反転を含む）のノード。無ければ None"""
+        key = state.canonical_hash
+        slots, keys, mask = self._slots, self.key, self._slot_mask
+        i = key & mask
+        while True:
+            node = int(slots[i])
+            if node == _EMPTY_SLOT:
+                return None
+            if int(keys[node]) == key:
+                return node
+            i = (i + 1) & mask
+
+    def add(self, state: BitBoard, action: Optional[int] = None) -> int:
+        """
+        局面のノードを追加して番号を返す。action は直前に打った列（勝敗判定用、ルートは None）
+        """
+        if self.size == len(self.visits):
+            self._grow_nodes(self.size + 1)
+        node = self.size
+        self.size += 1
+        key = state.canonical_hash
+        self.key[node] = key
+        if action is not None and state.wins_at(action):
+            self.terminal[node] = WIN
+        elif action is None and (state.has_won(Player.P1) or state.has_won(Player.P2)):
+            self.terminal[node] = WIN
+        elif state.is_full():
+            self.terminal[node] = DRAW
+        self._insert(key, node)
+        return node
+
+    def node_for(self, state: BitBoard, action: Optional[int] = None) -> int:
+        node = self.find(state)
+        return node if node is not None else self.add(state, action)
+
+    # --- 辺 ---
+
+    def create_edges(self, node: int, state: BitBoard):
+        """node の局面 state の手（左右対称なら片側だけ）を、正規形の向きで辺にする"""
+        moves = state.distinct_moves()
+        start = self.edge_count
+        if start + len(moves) > len(self.edge_action):
+            self._grow_edges(start + len(moves))
+        for i, col in enumerate(moves):
+            self.edge_action[start + i] = state.canonical_move(col)
+        self.edge_count += len(moves)
+        self.first_edge[node] = start
+        self.edge_total[node] = len(moves)
+
+    def expand_all(self, node: int, state: BitBoard, priors: Optional[np.ndarray] = None):
+        """
+        辺と、すべての辺の行き先のノードをまとめて作る（PUCT 用。未訪問の子も選択の候補にするため）。
+        priors は列ごとの事前確率（この局面の実際の向き）。左右対称な局面では鏡像の列の分も足す。
+        """
+        self.create_edges(node, state)
+        start = int(self.first_edge[node])
+        moves = state.distinct_moves()
+        symmetric = state.is_symmetric()
+        self.reserve(len(moves))
+        for i, col in enumerate(moves):
+            if priors is not None:
+                mirror = state.cols - 1 - col
+                p = priors[col] + priors[mirror] if symmetric and mirror != col else priors[col]
+                self.prior[start + i] = p
+            state.play(col)
+            self.edge_child[start + i] = self.node_for(state, col)
+            state.undo()
+        self.expanded[node] = len(moves)
+
+    def children(self, node: int) -> List[Tuple[int, int]]:
+        """作成済みの (正規形の向きの手, 子ノード) のリスト"""
+        start = int(self.first_edge[node])
+        if start < 0:
+            return []
+        end = start + int(self.expanded[node])
+        return list(zip(self.edge_action[start:end].tolist(), self.edge_child[start:end].tolist()))
+
+    def select(self, node: int, c_param: float, rave_k: float = 0) -> int:
+        """
+        展開済みの辺から UCB1 が最大のものを選び、辺の番号を返す。
+        rave_k > 0 なら平均報酬を AMAF の平均と混ぜる (RAVE)。重みは β = sqrt(k / (3n + k)) で、
+        子の訪問回数 n が k に比べて少ないうちは AMAF を、増えるにつれて自身の平均を重視する。
+        """
+        start = int(self.first_edge[node])
+        end = start + int(self.expanded[node])
+        kids = self.edge_child[start:end]
+        # 子は高々列数なので、NumPy の演算を重ねるより値を取り出して Python で計算する方が速い
+        visits = self.visits[kids].tolist()
+        values = self.value[kids].tolist()
+        if rave_k > 0 and self.has_amaf:
+            amaf_visits = self.amaf_visits[start:end].tolist()
+            amaf_values = self.amaf_value[start:end].tolist()
+        else:
+            amaf_visits = None
+        explore = 2 * math.log(int(self.visits[node]))
+        best, best_score = 0, -math.inf
+        for i, (n, w) in enumerate(zip(visits, values)):
+            q = w / n
+            if amaf_visits is not None and amaf_visits[i]:
+                beta = math.sqrt(rave_k / (3 * n + rave_k))
+                q = (1 - beta) * q + beta * amaf_values[i] / amaf_visits[i]
+            score = q + c_param * math.sqrt(explore / n) if c_param else q
+            if score > best_score:
+                best, best_score = i, score
+        return start + best
+
+    def select_puct(self, node: int, c_puct: float) -> int:
+        """
+        PUCT (Q + c_puct * P * sqrt(N) / (1 + n)) が最大の辺を返す。expand_all 済みの node で呼ぶ。
+        未訪問の子の Q は、親の平均を手番側から見た値で代用する。
+        """
+        start = int(self.first_edge[node])
+        end = start + int(self.expanded[node])
+        kids = self.edge_child[start:end]
+        visits = self.visits[kids].tolist()
+        values = self.value[kids].tolist()
+        priors = self.prior[start:end].tolist()
+        parent = int(self.visits[node])
+        fpu = -float(self.value[node]) / parent if parent else 0.0
+        explore = c_puct * math.sqrt(max(parent, 1))
+        best, best_score = 0, -math.inf
+        for i, (n, w, p) in enumerate(zip(visits, values, priors)):
+            q = w / n if n else fpu
+            score = q + explore * p / (1 + n)
+            if score > best_score:
+                best, best_score = i, score
+        return start + best
+
+    # --- 逆伝播 ---
+
+    def virtual_loss(self, path: List[int], amount: int = 1):
+        """
+        評価待ちの経路に仮の負けを足し、並行して選ぶ他の経路が同じ葉に集まらないようにする
+        （amount=-1 で取り消す）。経路の各ノードへ手を打ったプレイヤーから見た負けとして数える。
+        """
+        nodes = np.array(path)
+        self.visits[nodes] += amount
+        self.value[nodes[1:]] -= amount
+
+    def backup(self, path: List[int], reward: float, count: int = 1):
+        """
+        path はルートから葉までのノード。reward はルートの手番側から見た報酬の合計。
+        ルートへ手を打ったのは相手なので、深さが偶数のノードには符号を反転して足す。
+        """
+        nodes = np.array(path)
+        self.visits[nodes] += count
+        self.value[nodes[1::2]] += reward
+        self.value[nodes[0::2]] -= reward
+
+    def backup_amaf(self, path: List[int], orientations: List[int], moves: List[int], cols: int,
+                    reward: float, count: int = 1):
+        """
+        AMAF 統計の逆伝播。moves はルートから終局までに打った列（この局の実際の向き）で、
+        path[d] の局面では moves[d] から打たれている。path[d] の辺のうち、手番側がそれ以降に
+        打った列 (moves[d], moves[d + 2], ...) に当たるものへ報酬を足す。
+        orientations[d] は path[d] の局面の向き（ORIENT_*）で、辺の手（正規形の向き）に直すのに使う。
+        """
+        later = [0, 0]  # 深さの偶奇ごとの、それ以降に打たれた列のビットマスク
+        masks = [0] * len(path)
+        for d in range(len(moves) - 1, -1, -1):
+            later[d & 1] |= 1 << moves[d]
+            if d < len(path):
+                masks[d] = later[d & 1]
+        for d, node in enumerate(path):
+            start = int(self.first_edge[node])
+            if start < 0 or not masks[d]:
+                continue
+            mask = masks[d]
+            orientation = orientations[d]
+            if orientation == ORIENT_MIRRORED:
+                mask = _mirror_columns(mask, cols)
+            elif orientation == ORIENT_SYMMETRIC:
+                mask |= _mirror_columns(mask, cols)
+            actions = self.edge_action[start:start + int(self.edge_total[node])].tolist()
+            hits = [start + i for i, a in enumerate(actions) if mask >> a & 1]
+            if hits:
+                self.amaf_visits[hits] += count
+                # 辺の手を打つのは path[d] の手番側。ルート (d=0) の手番側から見た報酬をその視点に直す
+                self.amaf_value[hits] += reward if d % 2 == 0 else -reward
+
+    # --- 再利用 ---
+
+    def extract(self, node: int) -> "SearchTree":
+        """node から辿れる部分だけを詰めた新しい木（node がルート）を返す"""
+        order = [node]
+        index = {node: 0}
+        for current in order:
+            start = int(self.first_edge[current])
+            if start < 0:
+                continue
+            for child in self.edge_child[start:start + int(self.expanded[current])].tolist():
+                if child not in index:
+                    index[child] = len(order)
+                    order.append(child)
+
+        old = np.asarray(order)
+        tree = SearchTree(len(order), amaf=self.has_amaf, priors=self.has_priors)
+        tree.size = len(order)
+        for name in ("visits", "value", "key", "edge_total", "expanded", "terminal"):
+            getattr(tree, name)[:tree.size] = getattr(self, name)[old]
+
+        # 辺はノードの順に詰め直す（未展開の辺も残す）
+        totals = self.edge_total[old].astype(np.int64)
+        has_edges = self.first_edge[old] >= 0
+        totals[~has_edges] = 0
+        tree.edge_count = int(totals.sum())
+        if tree.edge_count > len(tree.edge_action):
+            tree._grow_edges(tree.edge_count)
+        starts = np.concatenate(([0], np.cumsum(totals)[:-1]))
+        tree.first_edge[:tree.size] = np.where(has_edges, starts, -1)
+        for new, (src, count) in enumerate(zip(self.first_edge[old].tolist(), totals.tolist())):
+            if count:
+                dst = int(starts[new])
+                tree.edge_action[dst:dst + count] = self.edge_action[src:src + count]
+                if self.has_amaf:
+                    tree.amaf_visits[dst:dst + count] = self.amaf_visits[src:src + count]
+                    tree.amaf_value[dst:dst + count] = self.amaf_value[src:src + count]
+                if self.has_priors:
+                    tree.prior[dst:dst + count] = self.prior[src:src + count]
+                children = self.edge_child[src:src + count]
+                tree.edge_child[dst:dst + count] = [index[c] if c >= 0 else -1 for c in children.tolist()]
+        for new in range(tree.size):
+            tree._insert(int(tree.key[new]), new)
+        tree.root = 0
+        return tree
+
+
+def orientation_of(state: BitBoard) -> int:
+    if state.mirrored:
+        return ORIENT_MIRRORED
+    return ORIENT_SYMMETRIC if state.is_symmetric() else ORIENT_NORMAL
+
+
+def _mirror_columns(mask: int, cols: int) -> int:
+    """列のビットマスクを左右反転する"""
+    mirrored = 0
+    for c in range(cols):
+        if mask >> c & 1:
+            mirrored |= 1 << (cols - 1 - c)
+    return mirrored
+
+
+def _table_size(capacity: int) -> int:
+    """置換表のスロット数（ノード数の2倍以上の2の冪。埋まり具合を半分以下に保つ）"""
+    return 1 << max(2 * capacity - 1, 1).bit_length()
+
+
+def _resized(array: np.ndarray, capacity: int, fill) -> np.ndarray:
+    grown = np.full(capacity, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
@@ -1,23 +1,101 @@
 import numpy as np
 import random
-import math
+import time
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, Tuple
 from app.agents.base import BaseAgent
-from app.core.game import Player
+from app.agents.evaluation import WindowEvaluator, mirror_symmetric, score_position
+from app.agents.opening_book import OpeningBook
+from app.agents.transposition import (
+    ENTRY_BYTES as TT_ENTRY_BYTES, EXACT, LOWER, UPPER, SharedTranspositionTable, TranspositionTable,
+)
+from app.core.game import BitBoard, Player
+from app.workers import get_executor, in_worker, reset_executor
+
+class SearchTimeout(Exception):
+    """思考時間切れで探索を打ち切るための例外"""
+    pass
 
 class MinimaxAgent(BaseAgent):
-    def __init__(self, depth: int = 4):
+    WIN_SCORE = 10000000000000
+    INF = WIN_SCORE * 10  # PVSのnull window (α, α+1) を作るため整数で扱う
+    HELPER_GRACE = 0.05  # Lazy SMP: 主探索の終了後に補助探索が戻るのを待つ時間（秒）
+    supports_analysis = True
+
+    def __init__(self, depth: int = 4, time_budget_ms: Optional[int] = None, tt_size: int = 1 << 18,
+                 opening_book: Optional[OpeningBook] = None, solver_threshold: int = 0, workers: int = 1):
+        """
+        depth: 探索深さ
+        time_budget_ms: 1手あたりの思考時間 (ミリ秒)。指定時は深さ1から反復深化し、
+                        期限までに完了した最も深い探索の結果を返す（depth は使わない）
+        tt_size: 置換表のスロット数の上限（0で無効）。置換表は同じ対局の get_action 間で使い回す
+        opening_book: 探索の前に引く定跡
+        solver_threshold: 空きマスがこの数以下になったら評価関数を使わず終局まで読み切る（0で無効）
+        workers: 2以上なら Lazy SMP で並列に探索する。プロセスプールのワーカーが同じ局面を
+                 手の並べ方と開始深さを変えて反復深化し、共有メモリ上の置換表を通じて結果を共有する。
+                 最も深く完了した探索の結果を返す
+        """
         super().__init__(name=f"Minimax(depth={depth})")
         self.depth = depth
+        self.time_budget_ms = time_budget_ms
         self.ROW_COUNT = 0
         self.COLUMN_COUNT = 0
+        self.ai_piece = Player.P1
+        self._deadline = None
+        self.workers = max(workers, 1)
+        self.tt = None
+        if tt_size > 0:
+            # Lazy SMP は置換表の共有が前提なので、並列探索するときは共有メモリ上に作る
+            self.tt = SharedTranspositionTable(tt_size) if self.uses_process_pool else TranspositionTable(tt_size)
+        self.nodes = 0  # 直近の探索で訪れたノード数
+        self._killers = []  # 手数(ply)ごとのキラー手 [最新, 1つ前]
+        self._history = [[], []]  # [P1, P2] 列ごとのヒストリースコア
+        self._evaluator = None
+        self._tt_stats = (0, 0)  # 探索開始時点の置換表の (参照回数, ヒット数)
+        # Lazy SMP: 補助探索の番号（0は主探索）と、共有置換表の打ち切り指示を見るか
+        self._helper_index = 0
+        self._stoppable = False
+        self._order_noise = None
+        self._stop: Optional[Callable[[], bool]] = None  # 先読みの打ち切り指示
+        self._pondered = False  # 先読みで置換表の世代を次の探索の分まで進めてある
+        self._mirror = True  # 左右反転した局面を置換表で同じ局面として扱うか（_begin_search で盤面から決める）
+        self.opening_book = opening_book
+        self.solver_threshold = solver_threshold
+
+    @property
+    def uses_process_pool(self) -> bool:
+        """Lazy SMP でプロセスプールを使うか（プールのワーカー内では逐次探索する）"""
+        return self.workers > 1 and not in_worker()
+
+    def memory_estimate(self) -> int:
+        if isinstance(self.tt, SharedTranspositionTable):
+            return self.tt.nbytes
+        return len(self.tt) * TT_ENTRY_BYTES if self.tt is not None else 0
 
     def get_action(self, board: np.ndarray, valid_moves: list) -> int:
-        self.ROW_COUNT, self.COLUMN_COUNT = board.shape
-        
-        # アルファベータ法で探索を実行
-        # alpha: maxプレイヤーが保証されている最小スコア
-        # beta: minプレイヤーが保証されている最大スコア
-        col, minimax_score = self.minimax(board, self.depth, -math.inf, math.inf, True)
+        if self.opening_book is not None or self.solver_threshold > 0:
+            position = BitBoard.from_array(board)
+            move = self.book_move(position)
+            if move is None:
+                move = self.solver_move(position)
+            if move is not None:
+                return move
+        state = self._begin_search(board)
+
+        # PVS (negamax) で探索を実行
+        # alpha: 手番側が保証されている最小スコア
+        # beta: 相手が手番側に許す最大スコア
+        start = time.perf_counter()
+        deadline = start + self.time_budget_ms / 1000 if self.time_budget_ms else None
+        if self.uses_process_pool and isinstance(self.tt, SharedTranspositionTable):
+            col, depth = self._lazy_smp(board, state, deadline)
+        elif deadline is not None:
+            col, depth = self._iterative_deepening(state, deadline)
+        else:
+            col, score = self.negamax(state, self.depth, -self.INF, self.INF)
+            depth = self.depth
+        self._record_search(start, depth)
         
         # 万が一有効な手が見つからない場合（通常はないが安全策）
         if col is None:
@@ -25,145 +103,300 @@ class MinimaxAgent(BaseAgent):
             
         return col
 
-    def minimax(self, board: np.ndarray, depth: int, alpha: float, beta: float, maximizingPlayer: bool):
-        valid_locations = self.get_valid_locations(board)
-        is_terminal = self.is_terminal_node(board)
-
-        # ベースケース：深さ制限到達 または ゲーム終了
-        if depth == 0 or is_terminal:
-            if is_terminal:
-                if self.check_win_static(board, Player.P1): # AI (Assume P1 is AI for simplicity logic here, adjusted below)
-                    return (None, 10000000000000)
-                elif self.check_win_static(board, Player.P2):
-                    return (None, -10000000000000)
-                else: # Draw
-                    return (None, 0)
-            else: # 深さ0
-                return (None, self.score_position(board, Player.P1)) # AI視点のスコア
-
-        if maximizingPlayer:
-            value = -math.inf
-            column = random.choice(valid_locations)
-            for col in valid_locations:
-                row = self.get_next_open_row(board, col)
-                b_copy = board.copy()
-                b_copy[row][col] = Player.P1 # AIの手をシミュレーション
-                new_score = self.minimax(b_copy, depth - 1, alpha, beta, False)[1]
-                
-                if new_score > value:
-                    value = new_score
-                    column = col
-                alpha = max(alpha, value)
-                if alpha >= beta:
-                    break # Beta Cutoff
-            return column, value
-
-        else: # Minimizing Player (Opponent)
-            value = math.inf
-            column = random.choice(valid_locations)
-            for col in valid_locations:
-                row = self.get_next_open_row(board, col)
-                b_copy = board.copy()
-                b_copy[row][col] = Player.P2 # 相手の手をシミュレーション
-                new_score = self.minimax(b_copy, depth - 1, alpha, beta, True)[1]
-                
-                if new_score < value:
-                    value = new_score
-                    column = col
-                beta = min(beta, value)
+    def analyze(self, board: np.ndarray) -> Tuple[Optional[int], Dict[int, float]]:
+        """
+        手番側から見た、打てる列ごとの評価値と最善手を返す（局面解析用）。
+        各列を打った後の局面を depth - 1 手まで通常の窓で探索するため、get_action より重い。
+        time_budget_ms は使わず、常に depth まで探索する。
+        """
+        state = self._begin_search(board)
+        start = time.perf_counter()
+        piece = state.current_player
+        scores: Dict[int, float] = {}
+        for col in self._order_moves(state, state.valid_moves(), None, 0):
+            row = state.play(col)
+            self._evaluator.place(row, col, piece)
+            scores[col] = -self.negamax(state, self.depth - 1, -self.INF, self.INF, 1, col)[1]
+            self._evaluator.remove(row, col, piece)
+            state.undo()
+        self._record_search(start, self.depth)
+        best = max(scores, key=scores.get) if scores else None
+        return best, scores
+
+    def _begin_search(self, board: np.ndarray, ai_piece: Optional[int] = None) -> BitBoard:
+        """ai_piece: 評価関数の視点（省略時は手番側。先読みでは相手の手番の局面を自分の視点で探索する）"""
+        self.ROW_COUNT, self.COLUMN_COUNT = board.shape
+
+        # 探索用の状態: 手の適用/取り消しと勝敗判定はビットボード、
+        # 葉の評価は石を置く/戻すたびに差分更新する評価器
+        state = BitBoard.from_array(board)
+        ai_piece = state.current_player if ai_piece is None else ai_piece
+        # 評価が左右対称な盤面（列数が奇数）でだけ、左右反転した局面を同じ局面として扱う
+        self._mirror = mirror_symmetric(state.cols)
+        if self.tt is not None and self._helper_index:
+            self.tt.refresh()  # 共有置換表の世代は主探索が進める
+        elif self.tt is not None:
+            # 評価値はAI視点の評価関数から作っているため、担当する手番が変わったら使えない
+            if ai_piece != self.ai_piece:
+                self.tt.clear()
+                self._pondered = False
+            if self._pondered:
+                # 先読みの結果は次の探索と同じ世代で書いてあるので、古い世代として置き換えさせない
+                self._pondered = False
+            else:
+                self.tt.new_search()
+            self._tt_stats = (self.tt.probes, self.tt.hits)
+        self.ai_piece = ai_piece
+        self._evaluator = WindowEvaluator(board, self.ai_piece)
+
+        # 手の並べ替え用の統計は1回の探索ごとに作り直す
+        self.nodes = 0
+        self._killers = [[None, None] for _ in range(self.ROW_COUNT * self.COLUMN_COUNT + 1)]
+        self._history = [[0] * self.COLUMN_COUNT, [0] * self.COLUMN_COUNT]
+        return state
+
+    def ponder(self, board: np.ndarray, deadline: float, stop: Callable[[], bool]) -> int:
+        """
+        相手の手番の局面を反復深化して、相手の各応手の後の局面を置換表に入れておく。
+        評価は自分（直前に打った側）の視点のまま行うので、置換表は次の get_action でそのまま引ける。
+        書き込みは次の get_action と同じ世代で行い、その探索で古いエントリとして置き換えられないようにする。
+        """
+        if self.tt is None:
+            return 0
+        opponent = Player.P2 if BitBoard.from_array(board).current_player == Player.P1 else Player.P1
+        state = self._begin_search(board, ai_piece=opponent)
+        self._pondered = True
+        self._stop = stop
+        try:
+            self._iterative_deepening(state, deadline)
+        finally:
+            self._stop = None
+        return self.nodes
+
+    def _record_search(self, start: float, depth: int):
+        self.search_info = {
+            "depth": depth,
+            "nodes": self.nodes,
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+        if self.tt is not None and self.tt.probes > self._tt_stats[0]:
+            probes, hits = self._tt_stats
+            self.search_info["tt_hit_rate"] = (self.tt.hits - hits) / (self.tt.probes - probes)
+
+    def _iterative_deepening(self, state: BitBoard, deadline: Optional[float],
+                             first_depth: int = 1, max_depth: Optional[int] = None):
+        """
+        first_depth から順に探索し、期限までに完了した最も深い探索の (最善手, 深さ) を返す。
+        最初の深さは期限に関係なく必ず完了させる（Lazy SMP の打ち切り指示では中断する）。
+        max_depth を省略すると空きマスの数まで深くする。
+        """
+        best_col, reached = None, 0
+        empty = self.ROW_COUNT * self.COLUMN_COUNT - sum(state.heights)
+        max_depth = empty if max_depth is None else min(max_depth, empty)
+        for depth in range(min(first_depth, max_depth), max_depth + 1):
+            self._deadline = deadline if depth > first_depth else None
+            try:
+                col, score = self.negamax(state, depth, -self.INF, self.INF)
+            except SearchTimeout:
+                break # 途中で打ち切った深さの結果は使わない
+            finally:
+                self._deadline = None
+            best_col, reached = col, depth
+            self.report_progress({"best_move": best_col, "depth": depth, "nodes": self.nodes}, force=True)
+            if abs(score) >= self.WIN_SCORE or (deadline is not None and time.perf_counter() >= deadline):
+                break # 勝敗が確定した、または時間切れ
+        return best_col, reached
+
+    def _lazy_smp(self, board: np.ndarray, state: BitBoard, deadline: Optional[float]):
+        """
+        Lazy SMP: workers - 1 個の補助探索をプロセスプールで動かし、このプロセスの主探索と
+        同じ局面を反復深化する。探索どうしは共有置換表だけでつながり、最初に最後まで探索した
+        （期限切れ、目標の深さに到達、勝敗が確定）ものが打ち切りを指示する。
+        全体で最も深く完了した探索の (最善手, 深さ) を返し、ノード数は全探索の合計にする。
+
+        補助探索は共有のプロセスプールに投入するため、プールが他の処理で埋まっていると始まらないことがある。
+        主探索が終わった時点で始まっていないものは取り消し、始まっているものも打ち切りの指示から
+        HELPER_GRACE 秒（期限があれば期限まで、の長い方）しか待たない。待ちきれなかったものの結果は使わない。
+        取り消せずに後から始まった補助探索は、世代が変わっているか打ち切り済みならすぐに戻る。
+        """
+        executor = get_executor()
+        budget = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+        target = None if deadline is not None else self.depth
+        futures = [executor.submit(_smp_helper, board, self.depth, budget, self.tt, i, self.tt.generation)
+                   for i in range(1, self.workers)]
+        self._stoppable = True
+        try:
+            best_col, reached = self._iterative_deepening(state, deadline, max_depth=target)
+        finally:
+            self._stoppable = False
+            self.tt.stop()
+        wait_until = time.perf_counter() + self.HELPER_GRACE
+        if deadline is not None:
+            wait_until = max(wait_until, deadline)
+        for future in futures:
+            if future.cancel():
+                continue  # まだ始まっていなかった
+            try:
+                col, depth, nodes = future.result(timeout=max(wait_until - time.perf_counter(), 0.0))
+            except FuturesTimeout:
+                continue  # 打ち切りの指示は出してあるので、そのうち戻る
+            except BrokenProcessPool:
+                reset_executor()  # 補助探索が無くても主探索の結果は使える
+                continue
+            self.nodes += nodes
+            if col is not None and depth > reached:
+                best_col, reached = col, depth
+        return best_col, reached
+
+    def negamax(self, state: BitBoard, depth: int, alpha: int, beta: int,
+                ply: int = 0, last_col: Optional[int] = None):
+        """
+        手番側から見た (最善手, スコア) を返す。スコアはAI視点の評価関数を手番側の符号に直したもの。
+        2手目以降は null window で探索し、αを超えたときだけ通常の窓で再探索する (PVS)。
+        """
+        self.nodes += 1
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+        if self._stoppable and not self.nodes & 255 and self.tt.stopped:
+            raise SearchTimeout() # 別の探索が先に終わった (Lazy SMP)
+        if self._stop is not None and not self.nodes & 255 and self._stop():
+            raise SearchTimeout() # 先読みの打ち切り（相手が手を打った）
+        # 直前の手で勝負がついたかは、その石を通るラインだけを見れば分かる
+        if last_col is not None and state.wins_at(last_col):
+            return (None, -self.WIN_SCORE) # 直前に打った相手の勝ち
+        valid_locations = state.valid_moves()
+        if not valid_locations: # Draw
+            return (None, 0)
+
+        # 置換表: 同じ局面（評価が左右対称なら左右反転を含む）を十分な深さで探索済みなら結果を再利用する。
+        # 表の手は正規形の向きで持つ
+        key = state.canonical_hash if self._mirror else state.hash
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = None
+        entry = self.tt.probe(key) if self.tt is not None else None
+        if entry is not None:
+            tt_depth, tt_score, tt_flag, tt_move = entry
+            if tt_move is not None and self._mirror:
+                tt_move = state.canonical_move(tt_move)
+            # ルートでは手を返す必要があるため打ち切らない
+            if tt_depth >= depth and last_col is not None:
+                if tt_flag == EXACT:
+                    return tt_move, tt_score
+                if tt_flag == LOWER:
+                    alpha = max(alpha, tt_score)
+                elif tt_flag == UPPER:
+                    beta = min(beta, tt_score)
                 if alpha >= beta:
-                    break # Alpha Cutoff
-            return column, value
+                    return tt_move, tt_score
+
+        # ベースケース：深さ制限到達
+        if depth == 0:
+            value = self._evaluator.score # AI視点のスコア（差分更新済み）
+            if state.current_player != self.ai_piece:
+                value = -value
+            if self.tt is not None:
+                self.tt.store(key, 0, value, EXACT, None)
+            return (None, value)
+
+        # すぐに勝てる手があればそれが最善
+        for col in valid_locations:
+            if state.is_winning_move(col):
+                if self.tt is not None:
+                    self.tt.store(key, depth, self.WIN_SCORE, EXACT, self._tt_move(state, col))
+                return col, self.WIN_SCORE
+
+        piece = state.current_player
+        side = 0 if piece == Player.P1 else 1
+        value = -self.INF
+        column = None
+        # 評価が左右対称なら、左右対称な局面では鏡像の手を除く（同じ値になる）
+        moves = state.distinct_moves() if self._mirror else valid_locations
+        for i, col in enumerate(self._order_moves(state, moves, tt_move, ply)):
+            row = state.play(col)
+            self._evaluator.place(row, col, piece)
+            if i == 0:
+                score = -self.negamax(state, depth - 1, -beta, -alpha, ply + 1, col)[1]
+            else:
+                score = -self.negamax(state, depth - 1, -alpha - 1, -alpha, ply + 1, col)[1]
+                if alpha < score < beta: # null window を超えたので通常の窓で再探索
+                    score = -self.negamax(state, depth - 1, -beta, -alpha, ply + 1, col)[1]
+            self._evaluator.remove(row, col, piece)
+            state.undo()
+
+            if score > value:
+                value = score
+                column = col
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                # カットを起こした手をキラー手・ヒストリーに記録
+                killers = self._killers[ply]
+                if killers[0] != col:
+                    killers[1] = killers[0]
+                    killers[0] = col
+                self._history[side][col] += depth * depth
+                break # Beta Cutoff
+
+        if self.tt is not None:
+            self.tt.store(key, depth, value, TranspositionTable.bound(value, alpha_orig, beta_orig),
+                          self._tt_move(state, column) if column is not None else None)
+        return column, value
+
+    def _tt_move(self, state: BitBoard, col: int) -> int:
+        """置換表に入れる手の向き（左右反転した局面を同じ局面として扱うときは正規形）"""
+        return state.canonical_move(col) if self._mirror else col
+
+    def _order_moves(self, state: BitBoard, moves: list, tt_move: Optional[int], ply: int) -> list:
+        """
+        αβ法の枝刈りが効くよう、良さそうな手から並べる:
+        置換表の最善手 > 相手の即勝ちを防ぐ手 > キラー手 > ヒストリー > 中央に近い列
+        """
+        opponent = Player.P2 if state.current_player == Player.P1 else Player.P1
+        killers = self._killers[ply]
+        history = self._history[0 if state.current_player == Player.P1 else 1]
+        center = (self.COLUMN_COUNT - 1) / 2
+        # Lazy SMP の補助探索は、中央からの距離に列ごとの揺らぎを加えて主探索と違う順に調べる
+        noise = self._order_noise or [0.0] * self.COLUMN_COUNT
+
+        def priority(col):
+            return (
+                col == tt_move,
+                state.is_winning_move(col, opponent),
+                col in killers,
+                history[col],
+                noise[col] - abs(col - center),
+            )
+
+        return sorted(moves, key=priority, reverse=True)
 
     # --- Helper Functions ---
 
     def score_position(self, board: np.ndarray, piece: int) -> int:
-        score = 0
-        opp_piece = Player.P2 if piece == Player.P1 else Player.P1
-
-        # Center Column Preference
-        center_array = [int(i) for i in list(board[:, self.COLUMN_COUNT // 2])]
-        center_count = center_array.count(piece)
-        score += center_count * 3
-
-        # Horizontal
-        for r in range(self.ROW_COUNT):
-            row_array = [int(i) for i in list(board[r, :])]
-            for c in range(self.COLUMN_COUNT - 3):
-                window = row_array[c:c+4]
-                score += self.evaluate_window(window, piece, opp_piece)
-
-        # Vertical
-        for c in range(self.COLUMN_COUNT):
-            col_array = [int(i) for i in list(board[:, c])]
-            for r in range(self.ROW_COUNT - 3):
-                window = col_array[r:r+4]
-                score += self.evaluate_window(window, piece, opp_piece)
-
-        # Positive Diagonal
-        for r in range(self.ROW_COUNT - 3):
-            for c in range(self.COLUMN_COUNT - 3):
-                window = [board[r+i][c+i] for i in range(4)]
-                score += self.evaluate_window(window, piece, opp_piece)
-
-        # Negative Diagonal
-        for r in range(self.ROW_COUNT - 3):
-            for c in range(self.COLUMN_COUNT - 3):
-                window = [board[r+3-i][c+i] for i in range(4)]
-                score += self.evaluate_window(window, piece, opp_piece)
-
-        return score
-
-    def evaluate_window(self, window: list, piece: int, opp_piece: int) -> int:
-        score = 0
-        if window.count(piece) == 4:
-            score += 100
-        elif window.count(piece) == 3 and window.count(0) == 1:
-            score += 5
-        elif window.count(piece) == 2 and window.count(0) == 2:
-            score += 2
-
-        if window.count(opp_piece) == 3 and window.count(0) == 1:
-            score -= 4 # 相手のリーチを阻止する優先度
-        
-        return score
-
-    def get_valid_locations(self, board):
-        valid = []
-        for col in range(self.COLUMN_COUNT):
-            if board[0][col] == 0:
-                valid.append(col)
-        return valid
-
-    def get_next_open_row(self, board, col):
-        for r in range(self.ROW_COUNT - 1, -1, -1):
-            if board[r][col] == 0:
-                return r
-    
-    def is_terminal_node(self, board):
-        return self.check_win_static(board, Player.P1) or \
-               self.check_win_static(board, Player.P2) or \
-               len(self.get_valid_locations(board)) == 0
-
-    def check_win_static(self, board, player):
-        # Game.pyのロジックと同様だが、Boardインスタンスを持たないためstaticに再定義
-        # (簡略化のためGame.pyからロジックを流用推奨だが、ここでは依存を減らすため記述)
-        rows, cols = board.shape
-        # Horizontal
-        for c in range(cols-3):
-            for r in range(rows):
-                if board[r][c] == player and board[r][c+1] == player and board[r][c+2] == player and board[r][c+3] == player:
-                    return True
-        # Vertical
-        for c in range(cols):
-            for r in range(rows-3):
-                if board[r][c] == player and board[r+1][c] == player and board[r+2][c] == player and board[r+3][c] == player:
-                    return True
-        # Diagonals
-        for c in range(cols-3):
-            for r in range(rows-3):
-                if board[r][c] == player and board[r+1][c+1] == player and board[r+2][c+2] == player and board[r+3][c+3] == player:
-                    return True
-                if board[r+3][c] == player and board[r+2][c+1] == player and board[r+1][c+2] == player and board[r][c+3] == player:
-                    return True
-        return False
\ No newline at end of file
+        """piece 視点の盤面評価（探索中は WindowEvaluator で差分更新している）"""
+        return score_position(board, piece)
+
+
+# --- Process Pool Workers (ワーカープロセス側で実行される) ---
+
+def _smp_helper(board: np.ndarray, depth: int, budget: Optional[float], tt: SharedTranspositionTable,
+                index: int, generation: int) -> Tuple[Optional[int], int, int]:
+    """
+    Lazy SMP の補助探索。奇数番は深さ2から始めて主探索より1段先を読み、手の並べ方も番号ごとに変える。
+    (最善手, 完了した深さ, ノード数) を返す。プールの待ち行列で遅れて始まり、主探索が既に
+    終わっていた（打ち切り済み、または次の探索の世代になっている）場合は何もしない。
+    """
+    deadline = None if budget is None else time.perf_counter() + budget
+    agent = MinimaxAgent(depth=depth, tt_size=0)
+    agent.tt = tt
+    agent._helper_index = index
+    agent._stoppable = True
+    rng = random.Random(index)
+    state = agent._begin_search(board)
+    if tt.generation != generation or tt.stopped:
+        return None, 0, 0
+    agent._order_noise = [rng.random() * 1.5 for _ in range(agent.COLUMN_COUNT)]
+    try:
+        col, reached = agent._iterative_deepening(state, deadline, first_depth=1 + index % 2,
+                                                  max_depth=None if budget is not None else depth)
+    finally:
+        tt.stop()
+    return col, reached, agent.nodes
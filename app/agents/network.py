@@ -0,0 +1,83 @@
+"""
+方策・価値ネットワーク (NeuralMCTSAgent 用)。
+
+入力は手番側から見た2枚の盤面 (自分の石, 相手の石)。全畳み込みなので盤面サイズに依存しない。
+- 方策: 列ごとのロジット（打てない列は呼び出し側でマスクする）
+- 価値: 手番側から見た勝ちやすさ (-1〜1)
+
+重みは環境変数 MIRAI_NN_MODEL、無ければリポジトリ直下の models/policy_value.pt から読む。
+ファイルが無い場合は読み込みに失敗する。探索の動作確認のためだけに、allow_untrained を指定すると
+固定シードで初期化した未学習のネットワークで代用する（探索は動くが弱い。APIでは使わない）。
+"""
+import os
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+from torch import nn
+
+from app.core.game import BitBoard
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "models", "policy_value.pt")
+
+
+class PolicyValueNet(nn.Module):
+    def __init__(self, channels: int = 32, layers: int = 4):
+        super().__init__()
+        body = [nn.Conv2d(2, channels, 3, padding=1), nn.ReLU()]
+        for _ in range(layers - 1):
+            body += [nn.Conv2d(channels, channels, 3, padding=1), nn.ReLU()]
+        self.body = nn.Sequential(*body)
+        self.policy_head = nn.Conv2d(channels, 1, 1)
+        self.value_head = nn.Sequential(nn.Linear(channels, channels), nn.ReLU(), nn.Linear(channels, 1), nn.Tanh())
+
+    def forward(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """x: (N, 2, rows, cols) -> 方策のロジット (N, cols), 価値 (N,)"""
+        h = self.body(x)
+        policy = self.policy_head(h).squeeze(1).amax(dim=1)  # 列ごとに行方向の最大
+        value = self.value_head(h.mean(dim=(2, 3))).squeeze(1)
+        return policy, value
+
+
+def encode(state: BitBoard) -> np.ndarray:
+    """手番側から見た (2, rows, cols) の入力。0行目が最上段（Connect4Game.board と同じ向き）"""
+    planes = np.zeros((2, state.rows, state.cols), dtype=np.float32)
+    own = state.mask_of(state.current_player)
+    occupied = state.occupied
+    for c in range(state.cols):
+        base = c * state.stride
+        for h in range(state.heights[c]):
+            bit = 1 << (base + h)
+            if occupied & bit:
+                planes[0 if own & bit else 1, state.rows - 1 - h, c] = 1
+    return planes
+
+
+def model_path() -> Optional[str]:
+    """読み込む重みファイルのパス。ファイルが無ければ None"""
+    path = os.environ.get("MIRAI_NN_MODEL") or DEFAULT_MODEL_PATH
+    return path if os.path.exists(path) else None
+
+
+def load_model(path: Optional[str] = None, allow_untrained: bool = False) -> PolicyValueNet:
+    """
+    推論用 (eval モード) のネットワーク。重みファイルが無ければ FileNotFoundError
+    （allow_untrained なら未学習のもの）
+    """
+    path = path or model_path()
+    if path is None or not os.path.exists(path):
+        if allow_untrained:
+            return _untrained_model()
+        raise FileNotFoundError(f"No trained network weights at {path or DEFAULT_MODEL_PATH} (set MIRAI_NN_MODEL)")
+    model = PolicyValueNet()
+    model.load_state_dict(torch.load(path, map_location="cpu"))
+    return model.eval()
+
+
+@lru_cache(maxsize=1)
+def _untrained_model() -> PolicyValueNet:
+    with torch.random.fork_rng():  # 呼び出し側の乱数状態は変えない
+        torch.manual_seed(0)
+        return PolicyValueNet().eval()
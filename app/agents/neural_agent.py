@@ -0,0 +1,130 @@
+"""
+方策・価値ネットワークで導く MCTS (PUCT)。
+
+ロールアウトの代わりに、葉の局面をネットワークで評価する。方策の出力を辺の事前確率にして
+PUCT で選択し、価値の出力を逆伝播する。ネットワークの評価はプロセス内の推論サービス
+(app.agents.inference) にまとめて投げるため、1回の探索の中でも batch_size 個の葉を
+virtual loss で散らして同時に評価待ちにする。サービス側で他の対局の探索の要求とも
+まとめて順伝播される。
+"""
+import time
+from typing import Optional
+
+import numpy as np
+
+from app.agents.inference import get_inference_service
+from app.agents.mcts_agent import MCTSAgent
+from app.agents.mcts_tree import WIN, SearchTree
+from app.agents.network import encode
+from app.agents.opening_book import OpeningBook
+from app.core.game import BitBoard
+
+
+class NeuralMCTSAgent(MCTSAgent):
+    C_PUCT = 1.5  # PUCT の探索項の係数
+
+    # 推論サービスをプロセス内の他の対局と共有するため、ワーカープロセスへ送らずスレッドで実行させる
+    runs_in_thread = True
+
+    def __init__(self, simulation_limit: int = 400, reuse_tree: bool = True, batch_size: int = 8,
+                 c_puct: float = C_PUCT, time_budget_ms: Optional[int] = None,
+                 opening_book: Optional[OpeningBook] = None, solver_threshold: int = 0):
+        """
+        simulation_limit: 1手を選択するために評価する葉の数
+        batch_size: 1回の探索で同時に評価待ちにする葉の数（virtual loss で別々の経路を選ぶ）
+        c_puct: PUCT の探索項の係数
+        その他は MCTSAgent と同じ
+        """
+        super().__init__(simulation_limit=simulation_limit, reuse_tree=reuse_tree, time_budget_ms=time_budget_ms,
+                         opening_book=opening_book, solver_threshold=solver_threshold)
+        self.name = f"NeuralMCTS(sims={simulation_limit})"
+        self.batch_size = max(batch_size, 1)
+        self.c_puct = c_puct
+        self._service_counts = (0, 0)  # 探索開始時のサービスの (順伝播の回数, 評価した局面数)
+
+    def _new_tree(self, capacity: int) -> SearchTree:
+        return SearchTree(capacity, priors=True)
+
+    def _best_edge(self, tree: SearchTree) -> int:
+        """最も訪問された手（PUCT では訪問回数が評価と確信度の両方を表す）"""
+        start = int(tree.first_edge[tree.root])
+        kids = tree.edge_child[start:start + int(tree.expanded[tree.root])]
+        return start + int(np.argmax(tree.visits[kids]))
+
+    def _search(self, tree: SearchTree, root_state: BitBoard, simulations: int,
+                deadline: Optional[float] = None) -> int:
+        service = get_inference_service()
+        self._service_counts = (service.batches, service.positions)
+        done = 0
+        while (done < simulations) if deadline is None else (done == 0 or time.perf_counter() < deadline):
+            pending = []  # 評価待ちの (経路, 葉の局面)
+            leaves = set()
+            # 1回に選択する経路は batch_size 本まで。すべて終局に着く（勝敗が読み切れた）木でも
+            # 評価待ちが無いまま回り続けず、外側のループで期限を確認する
+            for _ in range(self.batch_size):
+                if deadline is None and done + len(pending) >= simulations:
+                    break
+                path, state = self._tree_policy(tree, root_state)
+                if len(path) > self._max_depth:
+                    self._max_depth = len(path) - 1
+                leaf = path[-1]
+                if tree.terminal[leaf]:
+                    # 終局は評価不要。葉の手番側は直前の手で負けたか引き分け
+                    value = -1.0 if tree.terminal[leaf] == WIN else 0.0
+                    tree.backup(path, _root_reward(path, value))
+                    done += 1
+                    continue
+                if leaf in leaves:
+                    break  # virtual loss でも散らせなくなったら、たまった分だけ評価する
+                tree.virtual_loss(path)
+                leaves.add(leaf)
+                pending.append((path, state))
+            if not pending:
+                continue
+            results = service.evaluate([(encode(state), _legal(state)) for _, state in pending])
+            for (path, state), (priors, value) in zip(pending, results):
+                tree.virtual_loss(path, -1)
+                tree.expand_all(path[-1], state, priors)
+                tree.backup(path, _root_reward(path, value))
+            done += len(pending)
+            if self.on_progress is not None:
+                self._report_progress(tree, root_state, done)
+        return done
+
+    def _tree_policy(self, tree: SearchTree, root_state: BitBoard, orientations=None):
+        """
+        Selection: 辺を作っていない（評価していない）ノードか終局まで PUCT で降りる。
+        辿った経路と、葉の局面（root_state に経路の手を打ったコピー）を返す。
+        """
+        state = root_state.copy()
+        node = tree.root
+        path = [node]
+        while not tree.terminal[node] and tree.first_edge[node] >= 0:
+            edge = tree.select_puct(node, self.c_puct)
+            state.play(state.canonical_move(int(tree.edge_action[edge])))
+            node = int(tree.edge_child[edge])
+            path.append(node)
+        return path, state
+
+    def _record_search(self, start: float, simulations: int, rollouts: int):
+        service = get_inference_service()
+        batches = service.batches - self._service_counts[0]
+        positions = service.positions - self._service_counts[1]
+        self.search_info = {
+            "simulations": simulations,
+            "max_depth": self._max_depth,
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+            # 探索中にサービスが行った順伝播の平均局面数（同時に動いていた他の対局の分を含む）
+            "batch_size": positions / batches if batches else None,
+        }
+
+
+def _root_reward(path, value: float) -> float:
+    """葉の手番側から見た価値を、ルートの手番側から見た報酬にする"""
+    return value if (len(path) - 1) % 2 == 0 else -value
+
+
+def _legal(state: BitBoard) -> np.ndarray:
+    legal = np.zeros(state.cols, dtype=bool)
+    legal[state.valid_moves()] = True
+    return legal
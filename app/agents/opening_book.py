@@ -0,0 +1,178 @@
+"""
+序盤の定跡（オープニングブック）。
+
+定跡ファイルは「局面のZobristハッシュ -> 最善手」の表をハッシュ順に並べたバイナリで、
+メモリマップして二分探索で引く。ファイル全体を読み込まないため、複数のワーカープロセスで
+同じファイルを開いてもOSのページキャッシュが共有される。左右反転した局面は1つにまとめ、
+正規形 (BitBoard.canonical_hash) の向きの手を登録する。
+
+生成（深い Minimax 探索をプロセスプールで並列に実行する）:
+
+    python -m app.agents.opening_book --rows 6 --cols 7 --plies 8 --depth 8 --output books/6x7.book
+
+各手番側について「自分は定跡手、相手はあらゆる手」を打った局面を plies 手目まで列挙し、
+自分の手番の局面を探索して登録する。AIが先手でも後手でも、相手がどう打っても
+plies 手目までは定跡で応じられる。
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.game import BitBoard, Player
+
+MAGIC = b"C4BK"
+VERSION = 2  # 2: 左右反転した局面をまとめた正規形のハッシュ
+# マジック, バージョン, 行数, 列数, 件数, 登録した最大手数
+HEADER = struct.Struct("<4sHBBIH2x")
+RECORD = np.dtype([("key", "<u8"), ("move", "u1"), ("depth", "u1")])
+
+# 定跡ファイルを置くディレクトリ（ファイル名は "{rows}x{cols}.book"）
+DEFAULT_BOOK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "books")
+
+
+class OpeningBook:
+    """
+    メモリマップした定跡ファイル。pickle するとパスだけを渡し、受け取った側で開き直す
+    （エージェントごとワーカープロセスへ送っても表の中身はコピーしない）。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, rows, cols, count, max_ply = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an opening book (version {VERSION})")
+        self.rows = rows
+        self.cols = cols
+        self.max_ply = max_ply
+        self._records = np.memmap(path, dtype=RECORD, mode="r", offset=HEADER.size, shape=(count,)) \
+            if count else np.zeros(0, dtype=RECORD)
+        self._keys = self._records["key"]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __reduce__(self):
+        return (load_book, (self.path,))
+
+    def lookup(self, state: BitBoard) -> Optional[int]:
+        """定跡手。登録されていない局面、サイズ違い、打てない手なら None"""
+        if state.rows != self.rows or state.cols != self.cols or len(self._keys) == 0:
+            return None
+        key = np.uint64(state.canonical_hash)
+        i = int(np.searchsorted(self._keys, key))
+        if i >= len(self._keys) or self._keys[i] != key:
+            return None
+        move = state.canonical_move(int(self._records["move"][i]))
+        return move if state.can_play(move) else None
+
+
+@lru_cache(maxsize=None)
+def load_book(path: str) -> OpeningBook:
+    """プロセス内で1回だけ開く"""
+    return OpeningBook(path)
+
+
+def book_for(rows: int, cols: int, book_dir: Optional[str] = None) -> Optional[OpeningBook]:
+    """
+    盤面サイズに対応する定跡。ディレクトリは引数、環境変数 MIRAI_BOOK_DIR、
+    リポジトリ直下の books/ の順に探す。ファイルが無ければ None
+    """
+    book_dir = book_dir or os.environ.get("MIRAI_BOOK_DIR") or DEFAULT_BOOK_DIR
+    path = os.path.join(book_dir, f"{rows}x{cols}.book")
+    if not os.path.exists(path):
+        return None
+    return load_book(os.path.abspath(path))
+
+
+def write_book(path: str, rows: int, cols: int, entries: Dict[int, Tuple[int, int]], max_ply: int):
+    """entries: ハッシュ -> (手, 探索深さ)"""
+    records = np.zeros(len(entries), dtype=RECORD)
+    for i, (key, (move, depth)) in enumerate(sorted(entries.items())):
+        records[i] = (key, move, depth)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rows, cols, len(records), max_ply))
+        f.write(records.tobytes())
+    os.replace(tmp, path)  # 読み込み中のプロセスがあっても壊れたファイルを見せない
+
+
+# --- 生成 ---
+
+def _search_position(rows: int, cols: int, moves: List[int], depth: int) -> Tuple[int, int]:
+    """ワーカー側: 手順の局面を Minimax で探索し (正規形のハッシュ, 正規形の向きの最善手) を返す"""
+    from app.agents.minimax_agent import MinimaxAgent
+
+    state = BitBoard(rows, cols)
+    for col in moves:
+        state.play(col)
+    agent = MinimaxAgent(depth=depth)
+    move = agent.get_action(state.to_array(), state.valid_moves())
+    return state.canonical_hash, state.canonical_move(move)
+
+
+def generate_book(rows: int, cols: int, plies: int, depth: int, workers: Optional[int] = None,
+                  log=sys.stderr) -> Dict[int, Tuple[int, int]]:
+    from app.workers import default_workers, mark_worker
+
+    entries: Dict[int, Tuple[int, int]] = {}
+    with ProcessPoolExecutor(max_workers=workers or default_workers(), initializer=mark_worker) as executor:
+        for side in (Player.P1, Player.P2):
+            frontier = [[]]  # 手順のリスト
+            for ply in range(plies):
+                start = time.perf_counter()
+                # 同じ局面（左右反転を含む）に別の手順で到達したものはまとめる
+                positions: Dict[int, Tuple[List[int], BitBoard]] = {}
+                for moves in frontier:
+                    state = BitBoard(rows, cols)
+                    won = False
+                    for col in moves:
+                        state.play(col)
+                        won = state.wins_at(col)
+                    if won or state.is_full():
+                        continue
+                    positions.setdefault(state.canonical_hash, (moves, state))
+
+                if ply % 2 == (0 if side == Player.P1 else 1):
+                    # 自分の手番: 未登録の局面を探索し、定跡手だけを進める
+                    todo = [moves for key, (moves, _) in positions.items() if key not in entries]
+                    for key, move in executor.map(_search_position, [rows] * len(todo), [cols] * len(todo),
+                                                  todo, [depth] * len(todo), chunksize=8):
+                        entries[key] = (move, depth)
+                    frontier = [moves + [state.canonical_move(entries[key][0])]
+                                for key, (moves, state) in positions.items()]
+                    print(f"side {int(side):+d} ply {ply}: searched {len(todo)} positions "
+                          f"({time.perf_counter() - start:.1f}s)", file=log, flush=True)
+                else:
+                    # 相手の手番: あらゆる応手を進める
+                    frontier = [moves + [col] for moves, state in positions.values() for col in state.distinct_moves()]
+    return entries
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate an opening book with deep Minimax searches")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--plies", type=int, default=8, help="book covers positions up to this many plies")
+    parser.add_argument("--depth", type=int, default=8, help="Minimax depth for each book position")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None, help="default: books/{rows}x{cols}.book")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(DEFAULT_BOOK_DIR, f"{args.rows}x{args.cols}.book")
+    start = time.perf_counter()
+    entries = generate_book(args.rows, args.cols, args.plies, args.depth, args.workers)
+    write_book(output, args.rows, args.cols, entries, args.plies)
+    print(f"wrote {len(entries)} positions to {output} ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+終盤の完全読み（ソルバー）。
+
+空きマスが少ない局面を終局まで読み切り、手番側の勝ち・負け・引き分けと最善手を求める。
+評価関数は使わず、αβ法の negamax を置換表とビットボードの勝ち判定で行う。
+
+スコアは手番側から見て:
+- 勝ち: 勝つ手を打つ直前の空きマス数（早く勝つほど大きい）
+- 負け: 相手が勝つ手を打つ直前の空きマス数の符号を反転したもの（遅く負けるほど大きい）
+- 引き分け: 0
+
+解いた結果はプロセス内で共有するLRUキャッシュ (solution_cache) に入れる。同じワーカーで
+動いている別の対局が同じ終盤に到達したときは、読み直さずに結果を使う。
+期限を渡すと、それまでに読み切れなければ諦める（呼び出し側は通常の探索で打つ）。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.agents.transposition import EXACT, LOWER, TranspositionTable
+from app.core.game import BitBoard, Player
+
+# (最善手, スコア)
+Solution = Tuple[int, int]
+
+# 置換表のスロット数の上限。実際は空きマスの数に応じて小さくする (EndgameSolver.table_size)
+MAX_TT_SIZE = 1 << 20
+
+
+class SolverTimeout(Exception):
+    """期限までに読み切れなかった"""
+    pass
+
+
+class SolutionCache:
+    """
+    局面 -> 解のサイズ上限付きLRUキャッシュ（スレッドセーフ）。
+    左右反転した局面は同じエントリを使う（手は正規形の向きで持ち、引くときに戻す）。
+    """
+
+    def __init__(self, maxsize: int = 1 << 16):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[int, int, int], Solution]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key_of(state: BitBoard) -> Tuple[int, int, int]:
+        return state.rows, state.cols, state.canonical_key()
+
+    def get(self, state: BitBoard) -> Optional[Solution]:
+        key = self.key_of(state)
+        with self._lock:
+            solution = self._entries.get(key)
+            if solution is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        move, score = solution
+        return state.canonical_move(move), score
+
+    def put(self, state: BitBoard, solution: Solution):
+        if self.maxsize <= 0:
+            return
+        key = self.key_of(state)
+        move, score = solution
+        with self._lock:
+            self._entries[key] = (state.canonical_move(move), score)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# プロセス内の全セッション（エージェント）で共有するキャッシュ。件数は MIRAI_SOLVER_CACHE で指定する
+solution_cache = SolutionCache(int(os.environ.get("MIRAI_SOLVER_CACHE", 1 << 16)))
+
+
+def empty_cells(state: BitBoard) -> int:
+    return state.rows * state.cols - sum(state.heights)
+
+
+def describe(score: int) -> str:
+    """スコアを手番側から見た結果 ("win" / "loss" / "draw") にする"""
+    return "win" if score > 0 else "loss" if score < 0 else "draw"
+
+
+class EndgameSolver:
+    """
+    1回の読み切りに使う探索器。置換表は読み切りごとに作り直す
+    （解いた局面の結果は solution_cache に残る）。
+    deadline (time.perf_counter() の値) を過ぎたら SolverTimeout
+    """
+
+    def __init__(self, tt_size: int = MAX_TT_SIZE, deadline: Optional[float] = None):
+        self.tt = TranspositionTable(tt_size)
+        self.nodes = 0
+        self.deadline = deadline
+
+    @staticmethod
+    def table_size(empty: int) -> int:
+        """空きマスが empty の局面を読み切るのに使う置換表のスロット数（空きマス1つごとに倍、最小1024）"""
+        return min(1 << max(empty - 4, 10), MAX_TT_SIZE)
+
+    def solve(self, state: BitBoard) -> Solution:
+        """手番側の (最善手, スコア)。終局していない局面で呼ぶ。state は探索後に元に戻る"""
+        empty = empty_cells(state)
+        moves = state.valid_moves()
+        for col in moves:
+            if state.is_winning_move(col):
+                return col, empty
+
+        alpha, beta = -empty, empty
+        best_col, best = None, -empty
+        for col in self._order_moves(state, state.distinct_moves()):
+            state.play(col)
+            score = -self._negamax(state, empty - 1, -beta, -alpha)
+            state.undo()
+            if best_col is None or score > best:
+                best_col, best = col, score
+            alpha = max(alpha, score)
+        return best_col, best
+
+    def _negamax(self, state: BitBoard, empty: int, alpha: int, beta: int) -> int:
+        """
+        手番側から見たスコア。直前の手で勝負がついていない局面で呼ぶ。
+        窓 (alpha, beta) の外の値は、その方向の境界としてだけ正しい。
+        """
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & 1023 and time.perf_counter() >= self.deadline:
+            raise SolverTimeout()
+        if empty == 0:
+            return 0
+        moves = state.valid_moves()
+        for col in moves:
+            if state.is_winning_move(col):
+                return empty
+        if empty == 1:
+            return 0  # 最後の1手で勝てないので引き分け
+
+        # 相手の即勝ちの列が2つあれば防げない。1つなら、そこを塞ぐ以外は負ける
+        opponent = Player.P2 if state.current_player == Player.P1 else Player.P1
+        threats = [col for col in moves if state.is_winning_move(col, opponent)]
+        if len(threats) > 1:
+            return -(empty - 1)
+        if threats:
+            moves = threats
+        else:
+            moves = state.distinct_moves()
+
+        # 今すぐは勝てないので、最善でも次の自分の手で勝つ (空きマス empty - 2)
+        beta = min(beta, empty - 2)
+        if alpha >= beta:
+            return beta
+
+        key = state.canonical_hash  # 左右反転した局面は同じ値
+        entry = self.tt.probe(key)
+        if entry is not None:
+            _, tt_score, tt_flag, _ = entry
+            if tt_flag == EXACT:
+                return tt_score
+            if tt_flag == LOWER:
+                alpha = max(alpha, tt_score)
+            else:
+                beta = min(beta, tt_score)
+            if alpha >= beta:
+                return tt_score
+
+        alpha_orig = alpha
+        value = -empty
+        for col in self._order_moves(state, moves):
+            state.play(col)
+            score = -self._negamax(state, empty - 1, -beta, -alpha)
+            state.undo()
+            if score > value:
+                value = score
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+        self.tt.store(key, empty, value, TranspositionTable.bound(value, alpha_orig, beta), None)
+        return value
+
+    @staticmethod
+    def _order_moves(state: BitBoard, moves: list) -> list:
+        """
+        相手の勝ちマスの真下に打つ手（打つと相手がその上に置いて勝つ）は最後に回し、
+        それ以外は中央に近い列から
+        """
+        opponent = Player.P2 if state.current_player == Player.P1 else Player.P1
+        center = (state.cols - 1) / 2
+
+        def priority(col):
+            state.play(col)
+            gives_win = state.can_play(col) and state.is_winning_move(col, opponent)
+            state.undo()
+            return gives_win, abs(col - center)
+
+        return sorted(moves, key=priority)
+
+
+def solve(state: BitBoard, cache: Optional[SolutionCache] = None,
+          deadline: Optional[float] = None) -> Optional[Tuple[Solution, dict]]:
+    """
+    局面を読み切り、(最善手, スコア) と探索情報を返す。キャッシュにあれば読まない。
+    探索情報は search_info に入れる形 (solved, result, nodes, elapsed_ms, cache_hit)。
+    deadline までに読み切れなければ None
+    """
+    cache = solution_cache if cache is None else cache
+    start = time.perf_counter()
+    solution = cache.get(state)
+    hit, nodes = solution is not None, 0
+    if not hit:
+        solver = EndgameSolver(EndgameSolver.table_size(empty_cells(state)), deadline)
+        try:
+            solution = solver.solve(state)
+        except SolverTimeout:
+            return None
+        nodes = solver.nodes
+        cache.put(state, solution)
+    info = {
+        "solved": True,
+        "result": describe(solution[1]),
+        "nodes": nodes,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+        "cache_hit": hit,
+    }
+    return solution, info
@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# 評価値の種類
+EXACT = 0  # 窓内に収まった正確な値
+LOWER = 1  # βカットで打ち切った（真の値はこれ以上）
+UPPER = 2  # αを超えなかった（真の値はこれ以下）
+
+# (深さ, 評価値, 種類, 最善手)
+Entry = Tuple[int, float, int, Optional[int]]
+
+# 1スロットあたりのおおよそのメモリ使用量（バイト、dictのエントリとタプルを含む）
+ENTRY_BYTES = 280
+
+
+class TranspositionTable:
+    """
+    Zobristハッシュをキーにした、サイズ上限付きの置換表。
+
+    ハッシュの下位ビットでスロットを決め、各スロットには1局面だけを保持する。
+    衝突時の置き換えは「深さ優先 + 世代」: 新しい探索 (new_search) で書かれた
+    エントリは古い世代のものを常に置き換え、同じ世代どうしでは深く探索した方を残す。
+    スロットは使われた分だけ確保するため、小さな盤面や短い対局ではメモリを消費しない。
+    """
+
+    def __init__(self, size: int = 1 << 18):
+        # スロット数は2の冪に切り上げる（ハッシュのマスクで添字を求めるため）
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self._mask = self.size - 1
+        self._slots: Dict[int, Tuple[int, int, Entry]] = {}  # 添字 -> (ハッシュ, 世代, エントリ)
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def new_search(self):
+        """1回の get_action の開始時に呼ぶ。以前の探索のエントリを置き換え対象にする"""
+        self.generation += 1
+
+    def clear(self):
+        self._slots.clear()
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key: int) -> Optional[Entry]:
+        self.probes += 1
+        slot = self._slots.get(key & self._mask)
+        if slot is None or slot[0] != key:
+            return None
+        self.hits += 1
+        return slot[2]
+
+    def store(self, key: int, depth: int, score: float, flag: int, move: Optional[int]):
+        index = key & self._mask
+        slot = self._slots.get(index)
+        if slot is not None and slot[1] == self.generation and slot[0] != key and slot[2][0] > depth:
+            return  # 同じ探索でより深く調べた別局面を優先して残す
+        if slot is not None and slot[0] == key and move is None:
+            move = slot[2][3]  # 最善手の情報は残す
+        self._slots[index] = (key, self.generation, (depth, score, flag, move))
+
+    @staticmethod
+    def bound(score: float, alpha: float, beta: float) -> int:
+        """探索窓 (alpha, beta) に対する score の種類"""
+        if score <= alpha:
+            return UPPER
+        if score >= beta:
+            return LOWER
+        return EXACT
+
+
+class SharedTranspositionTable:
+    """
+    複数のプロセスでロックなしに共有する置換表 (Lazy SMP 用)。
+    multiprocessing.shared_memory 上に固定長のスロットを並べ、TranspositionTable と同じ
+    probe / store で読み書きする。
+
+    スロットは (ハッシュ ^ データ, データ) の uint64 2つ。別プロセスの書き込みと混ざって
+    半端な状態になったスロットは、読むときにハッシュが一致しないので単に外れとして扱われる。
+    データは 評価値 46ビット | 深さ 6ビット | 種類 2ビット | 最善手 4ビット | 世代 6ビット。
+    最善手は 0〜14 列だけを表せる（15 は「手なし」）ので、それより広い盤面では使わない
+    （GameConfig は MAX_SHARED_TT_COLS 列を超える盤面で minimax_workers > 1 を受け付けない）。
+
+    作成したプロセスが所有者で、close() で共有メモリを解放する。pickle すると名前だけを渡し、
+    受け取ったプロセスで同じ共有メモリを開く。
+    """
+
+    HEADER_BYTES = 64  # [0]: 探索の打ち切り指示, [1]: 世代
+    SCORE_BITS = 46
+    NO_MOVE = 15
+
+    def __init__(self, size: int = 1 << 18, name: Optional[str] = None):
+        from multiprocessing import shared_memory
+
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self._mask = self.size - 1
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.HEADER_BYTES + self.size * 16)
+            self._shm.buf[:self.HEADER_BYTES + self.size * 16] = bytes(self.HEADER_BYTES + self.size * 16)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self._header = np.ndarray(self.HEADER_BYTES, dtype=np.uint8, buffer=self._shm.buf)
+        self._slots = np.ndarray((self.size, 2), dtype=np.uint64, buffer=self._shm.buf, offset=self.HEADER_BYTES)
+        self.generation = int(self._header[1])
+        self.probes = 0
+        self.hits = 0
+
+    def __reduce__(self):
+        return (attach_shared_table, (self.name, self.size))
+
+    def __deepcopy__(self, memo):
+        # エージェントをコピーしても同じ共有メモリを指す（所有者は元の1つだけにする）
+        return self
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._slots[:, 1]))
+
+    @property
+    def nbytes(self) -> int:
+        return self.HEADER_BYTES + self.size * 16
+
+    def close(self):
+        """所有者なら共有メモリを解放する（他のプロセスが開いている分は、そちらが閉じるまで残る）"""
+        if self._shm is None:
+            return
+        self._header = self._slots = None
+        shm, self._shm = self._shm, None
+        shm.close()
+        if self.owner:
+            shm.unlink()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # --- 探索の制御 ---
+
+    def new_search(self):
+        """所有者が探索の開始時に呼ぶ。世代を進め、打ち切り指示を解除する"""
+        self.generation = (self.generation + 1) & 63
+        self._header[1] = self.generation
+        self._header[0] = 0
+
+    def refresh(self):
+        """所有者以外のプロセスが、探索を始める前に現在の世代を読み込む"""
+        self.generation = int(self._header[1])
+
+    def stop(self):
+        self._header[0] = 1
+
+    @property
+    def stopped(self) -> bool:
+        return bool(self._header[0])
+
+    def clear(self):
+        self._slots[:] = 0
+        self.probes = 0
+        self.hits = 0
+
+    # --- 読み書き ---
+
+    def probe(self, key: int) -> Optional[Entry]:
+        self.probes += 1
+        slot = self._slots[key & self._mask]
+        data = int(slot[1])
+        if data == 0 or int(slot[0]) ^ data != key:
+            return None
+        self.hits += 1
+        score = (data & ((1 << self.SCORE_BITS) - 1)) - (1 << (self.SCORE_BITS - 1))
+        rest = data >> self.SCORE_BITS
+        move = (rest >> 8) & 15
+        return rest & 63, score, (rest >> 6) & 3, None if move == self.NO_MOVE else move
+
+    def store(self, key: int, depth: int, score: float, flag: int, move: Optional[int]):
+        slot = self._slots[key & self._mask]
+        old = int(slot[1])
+        if old:
+            old_key = int(slot[0]) ^ old
+            old_rest = old >> self.SCORE_BITS
+            if old_key == key:
+                if move is None and (old_rest >> 8) & 15 != self.NO_MOVE:
+                    move = (old_rest >> 8) & 15  # 最善手の情報は残す
+            elif old_rest >> 12 == self.generation and old_rest & 63 > depth:
+                return  # 同じ探索でより深く調べた別局面を優先して残す
+        if move is None or move >= self.NO_MOVE:
+            move = self.NO_MOVE
+        data = (int(score) + (1 << (self.SCORE_BITS - 1))) \
+            | ((min(depth, 63) | flag << 6 | move << 8 | self.generation << 12) << self.SCORE_BITS)
+        slot[0] = key ^ data
+        slot[1] = data
+
+
+# このプロセスで開いている他プロセス所有の共有置換表（名前 -> 表）。所有者が解放した後も
+# 開いたままだとメモリが返らないため、最近使ったものだけを残す
+_attached: "OrderedDict[str, SharedTranspositionTable]" = OrderedDict()
+MAX_ATTACHED = 8
+
+
+def attach_shared_table(name: str, size: int) -> SharedTranspositionTable:
+    """共有置換表を開く（プロセス内で名前ごとに1回だけ開き、以降は使い回す）"""
+    table = _attached.get(name)
+    if table is None or table._shm is None:
+        table = _attached[name] = SharedTranspositionTable(size, name=name)
+    _attached.move_to_end(name)
+    while len(_attached) > MAX_ATTACHED:
+        _attached.popitem(last=False)[1].close()
+    return table
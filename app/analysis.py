@@ -0,0 +1,72 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from app.core.game import BitBoard, Connect4Game, Player
+from app.agents.factory import create_agent
+from app.schemas import AgentType, GameConfig
+
+# 1リクエストで受け付ける局面数の上限
+MAX_BATCH_POSITIONS = 10000
+
+# (最善手, 列ごとの評価値, 探索情報, エラー)
+ChunkResult = Tuple[Optional[int], Optional[Dict[int, float]], Optional[dict], Optional[str]]
+
+
+def parse_moves(moves: Union[str, Sequence[int]]) -> List[int]:
+    if isinstance(moves, str):
+        if not moves.isdigit() and moves:
+            raise ValueError(f"Invalid move string: {moves!r}")
+        return [int(ch) for ch in moves]
+    return [int(col) for col in moves]
+
+
+def position_from_moves(rows: int, cols: int, moves: Union[str, Sequence[int]]) -> BitBoard:
+    """初期局面から手順を再生した局面。不正な手や終局後の手があれば ValueError"""
+    game = Connect4Game(rows=rows, cols=cols)
+    for col in parse_moves(moves):
+        if game.is_terminal:
+            raise ValueError("Moves continue after the game has ended")
+        game.step(col)
+    return game.bitboard
+
+
+def position_from_board(rows: int, cols: int, board: List[List[int]]) -> BitBoard:
+    """盤面 (0行目が最上段) から局面を作る。形・値・重力・石数が不正なら ValueError"""
+    array = np.asarray(board)
+    if array.shape != (rows, cols):
+        raise ValueError(f"Board must be {rows}x{cols}")
+    if not np.isin(array, (Player.EMPTY, Player.P1, Player.P2)).all():
+        raise ValueError("Board cells must be 0, 1 or -1")
+    # 空きマスの下に石があってはいけない（各列は下から詰まっている）
+    filled = array != Player.EMPTY
+    if (~filled[1:] & filled[:-1]).any():
+        raise ValueError("Board has floating discs")
+    p1 = int(np.count_nonzero(array == Player.P1))
+    p2 = int(np.count_nonzero(array == Player.P2))
+    if p1 - p2 not in (0, 1):
+        raise ValueError("Board has an impossible number of discs")
+    return BitBoard.from_array(array)
+
+
+def check_playable(state: BitBoard):
+    if state.has_won(Player.P1) or state.has_won(Player.P2):
+        raise ValueError("Position is already won")
+    if state.is_full():
+        raise ValueError("Position is a draw (board is full)")
+
+
+def analyze_chunk(agent_type: AgentType, config: GameConfig, boards: List[np.ndarray]) -> List[ChunkResult]:
+    """
+    ワーカー側で実行する。まとめごとに新しく作ったエージェントで複数の局面を順に解析する
+    （Minimaxは置換表を局面間で使い回せる）。スレッドで並行に実行されるまとめどうしで、
+    探索状態を共有しない。
+    """
+    agent = create_agent(agent_type, config)
+    results: List[ChunkResult] = []
+    for board in boards:
+        try:
+            best, scores = agent.analyze(board)
+            results.append((best, scores, dict(agent.search_info), None))
+        except Exception as e:  # 1局面の失敗でまとめ全体を落とさない
+            results.append((None, None, None, str(e)))
+    return results
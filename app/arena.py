@@ -0,0 +1,254 @@
+"""
+エージェント設定どうしの総当たり対戦（ヘッドレス）。
+
+    python -m app.arena "minimax:depth=4" "minimax:depth=5" "mcts:simulation_limit=500" \
+        --games 40 --seed 1 --output games.jsonl --report report.json
+
+エージェントは "種類:引数=値,引数=値" で指定する（種類は random / minimax / mcts / neural、
+値はJSONとして解釈できればその型、できなければ文字列）。各組み合わせで --games 局を
+先手・後手を交互に入れ替えて対戦し、プロセスプールで並列に実行する。
+neural は学習済みの重み (MIRAI_NN_MODEL) を使う。未学習のネットワークで動作だけを確かめるときは
+MIRAI_NN_UNTRAINED=1 を指定する。
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.game import Player
+from app.agents.base import BaseAgent
+from app.agents.random_agent import RandomAgent
+from app.agents.minimax_agent import MinimaxAgent
+from app.agents.mcts_agent import MCTSAgent
+from app.simulation import play_game
+from app.workers import default_workers, mark_worker
+
+def _neural_agent(**kwargs) -> BaseAgent:
+    # torch は NeuralMCTS を使う対戦でだけ読み込む
+    from app.agents.neural_agent import NeuralMCTSAgent
+    return NeuralMCTSAgent(**kwargs)
+
+
+AGENT_TYPES = {
+    "random": RandomAgent,
+    "minimax": MinimaxAgent,
+    "mcts": MCTSAgent,
+    "neural": _neural_agent,
+}
+
+
+def parse_spec(spec: str) -> Tuple[str, Dict[str, object]]:
+    """ "mcts:simulation_limit=500,rollout_batch=8" -> ("mcts", {...}) """
+    kind, _, params = spec.partition(":")
+    if kind not in AGENT_TYPES:
+        raise ValueError(f"Unknown agent type {kind!r} (choose from {', '.join(AGENT_TYPES)})")
+    kwargs: Dict[str, object] = {}
+    for item in filter(None, params.split(",")):
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid agent parameter {item!r} in {spec!r}")
+        try:
+            kwargs[name] = json.loads(value)
+        except json.JSONDecodeError:
+            kwargs[name] = value
+    return kind, kwargs
+
+
+def make_agent(spec: str, seed: Optional[int] = None) -> BaseAgent:
+    kind, kwargs = parse_spec(spec)
+    if kind == "mcts" and seed is not None:
+        kwargs.setdefault("seed", seed)
+    return AGENT_TYPES[kind](**kwargs)
+
+
+def play_arena_game(spec_a: str, spec_b: str, a_first: bool, seed: int, rows: int, cols: int) -> dict:
+    """
+    ワーカー側で実行する1局。結果は A 視点 (1: Aの勝ち, 0.5: 引き分け, 0: Bの勝ち)。
+    time_budget_ms を使う設定は思考時間で結果が変わるため、シードを固定しても再現しない。
+    """
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+    agent_a = make_agent(spec_a, seed)
+    agent_b = make_agent(spec_b, seed + 1)
+    first, second = (agent_a, agent_b) if a_first else (agent_b, agent_a)
+    winner, moves, times = play_game(first, second, rows, cols)
+
+    a_player = Player.P1 if a_first else Player.P2
+    score = 0.5 if winner is None else (1.0 if winner == a_player else 0.0)
+    # 先手の手は偶数番目 (0, 2, ...)
+    a_times = times[0::2] if a_first else times[1::2]
+    b_times = times[1::2] if a_first else times[0::2]
+    return {
+        "a": spec_a,
+        "b": spec_b,
+        "a_first": a_first,
+        "seed": seed,
+        "score": score,
+        "moves": moves,
+        "a_move_ms": [t * 1000 for t in a_times],
+        "b_move_ms": [t * 1000 for t in b_times],
+    }
+
+
+# --- 集計 ---
+
+def elo_from_score(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected_score(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def pair_stats(scores: List[float], elo0: float, elo1: float, alpha: float, beta: float) -> dict:
+    """
+    勝敗からの Elo 差の推定 (95%信頼区間) と、H0: elo0 / H1: elo1 の SPRT。
+    LLR は1局ごとのスコアの平均と分散を使う正規近似 (GSPRT) で求める。
+    全勝・全敗・全引き分けでは分散が0になり LLR を求められないため、LLR の平均と分散は
+    1勝1敗の仮の2局を加えて求める（少ない局数で判定が確定しにくくなる方向の正則化）。
+    """
+    n = len(scores)
+    wins = sum(1 for s in scores if s == 1.0)
+    draws = sum(1 for s in scores if s == 0.5)
+    mean = sum(scores) / n
+    var = sum((s - mean) ** 2 for s in scores) / n
+    se = math.sqrt(var / n)
+    stats = {
+        "games": n,
+        "wins": wins,
+        "draws": draws,
+        "losses": n - wins - draws,
+        "score": mean,
+        "elo": elo_from_score(mean),
+        "elo_95": [elo_from_score(mean - 1.96 * se), elo_from_score(mean + 1.96 * se)],
+    }
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    prior = scores + [1.0, 0.0]
+    reg_mean = sum(prior) / len(prior)
+    reg_var = sum((s - reg_mean) ** 2 for s in prior) / len(prior)
+    llr = len(prior) * (s1 - s0) * (2 * reg_mean - s0 - s1) / (2 * reg_var)
+    stats["sprt"] = {
+        "elo0": elo0,
+        "elo1": elo1,
+        "llr": llr,
+        "bounds": [lower, upper],
+        "result": "H1" if llr >= upper else "H0" if llr <= lower else "continue",
+    }
+    return stats
+
+
+def time_stats(times_ms: List[float]) -> dict:
+    if not times_ms:
+        return {"moves": 0, "mean_ms": None, "p95_ms": None}
+    return {
+        "moves": len(times_ms),
+        "mean_ms": float(np.mean(times_ms)),
+        "p95_ms": float(np.percentile(times_ms, 95)),
+    }
+
+
+def build_report(specs: List[str], games: List[dict], elo0: float, elo1: float,
+                 alpha: float, beta: float) -> dict:
+    pairs = []
+    for i, a in enumerate(specs):
+        for b in specs[i + 1:]:
+            scores = [g["score"] for g in games if g["a"] == a and g["b"] == b]
+            if scores:
+                pairs.append({"a": a, "b": b, **pair_stats(scores, elo0, elo1, alpha, beta)})
+    agents = {}
+    for spec in specs:
+        times = [t for g in games if g["a"] == spec for t in g["a_move_ms"]]
+        times += [t for g in games if g["b"] == spec for t in g["b_move_ms"]]
+        agents[spec] = time_stats(times)
+    return {"pairs": pairs, "agents": agents}
+
+
+def print_report(report: dict, out=sys.stdout):
+    print(f"{'A':<32} {'B':<32} {'W':>4} {'D':>4} {'L':>4} {'Elo(A-B)':>18} {'SPRT':>14}", file=out)
+    for p in report["pairs"]:
+        lo, hi = p["elo_95"]
+        elo = f"{p['elo']:+.0f} [{lo:+.0f},{hi:+.0f}]"
+        sprt = f"{p['sprt']['result']} ({p['sprt']['llr']:+.2f})"
+        print(f"{p['a']:<32} {p['b']:<32} {p['wins']:>4} {p['draws']:>4} {p['losses']:>4} {elo:>18} {sprt:>14}",
+              file=out)
+    print(file=out)
+    print(f"{'Agent':<32} {'moves':>7} {'mean ms':>10} {'p95 ms':>10}", file=out)
+    for spec, t in report["agents"].items():
+        if t["moves"]:
+            print(f"{spec:<32} {t['moves']:>7} {t['mean_ms']:>10.1f} {t['p95_ms']:>10.1f}", file=out)
+
+
+def run_arena(specs: List[str], games: int, rows: int = 6, cols: int = 7, seed: int = 0,
+              workers: Optional[int] = None, output: Optional[str] = None) -> List[dict]:
+    """全ての組み合わせについて games 局ずつ対戦し、各局の結果を返す（output には1局1行のJSON）"""
+    for spec in specs:
+        parse_spec(spec)  # ワーカーに投げる前に書式を確認する
+    tasks = []
+    for i, a in enumerate(specs):
+        for b in specs[i + 1:]:
+            for k in range(games):
+                # シードは組み合わせと局番号だけで決まるので、並列度を変えても結果は同じ
+                tasks.append((a, b, k % 2 == 0, seed * 1_000_003 + len(tasks) * 2, rows, cols))
+
+    results = []
+    out = open(output, "w") if output else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers or default_workers(), initializer=mark_worker) as executor:
+            futures = [executor.submit(play_arena_game, *task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                game = future.result()
+                results.append(game)
+                if out is not None:
+                    out.write(json.dumps(game) + "\n")
+                print(f"\r{done}/{len(tasks)} games", end="", file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+    finally:
+        if out is not None:
+            out.close()
+    results.sort(key=lambda g: g["seed"])
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Round-robin arena for agent configurations")
+    parser.add_argument("agents", nargs="+", help='agent specs, e.g. "minimax:depth=5" "mcts:simulation_limit=500"')
+    parser.add_argument("--games", type=int, default=20, help="games per pair (first move alternates)")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: MIRAI_WORKERS or CPU count)")
+    parser.add_argument("--output", help="write one JSON line per game to this file")
+    parser.add_argument("--report", help="write the summary report as JSON to this file")
+    parser.add_argument("--elo0", type=float, default=0.0, help="SPRT H0 Elo difference")
+    parser.add_argument("--elo1", type=float, default=10.0, help="SPRT H1 Elo difference")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args(argv)
+    if len(args.agents) < 2:
+        parser.error("at least two agent specs are required")
+    if len(set(args.agents)) != len(args.agents):
+        parser.error("agent specs must be distinct")
+
+    start = time.perf_counter()
+    games = run_arena(args.agents, args.games, args.rows, args.cols, args.seed, args.workers, args.output)
+    report = build_report(args.agents, games, args.elo0, args.elo1, args.alpha, args.beta)
+    report["config"] = {
+        "rows": args.rows, "cols": args.cols, "games_per_pair": args.games, "seed": args.seed,
+        "elapsed_s": time.perf_counter() - start,
+    }
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
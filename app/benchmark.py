@@ -0,0 +1,419 @@
+"""
+エンジンとエージェントの性能ベンチマーク。
+
+    python -m app.benchmark --output bench.json                 # 計測して結果をJSONで保存
+    python -m app.benchmark --compare bench.json --threshold 0.1  # 保存した基準と比べ、悪化があれば終了コード1
+
+計測対象（盤面サイズ 6x7 / 7x8 / 9x9 ごと）:
+- engine: Connect4Game.step の手数/秒
+- win_check: BitBoard.wins_at の判定回数/秒
+- mcts: MCTSAgent のシミュレーション回数/秒
+- mcts_tactics: RAVE / 戦術的ロールアウトの有無ごとの、即勝ち・必須の受けの正答率 (6x7のみ)
+- minimax: MinimaxAgent のノード数/秒と、深さごとの到達時間
+- minimax_ponder: 先読みした置換表を次の手の探索が引けているか（ヒット率とノード数の比、6x7のみ）
+- api: FastAPI の TestClient 経由の /ai-move の応答時間 (6x7のみ)
+
+局面は固定シードのランダム対局から序盤〜終盤を切り出したもので、毎回同じになる。
+各計測は --repeat 回行い、最も速かった値を採用する（他プロセスの影響を減らすため）。
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.game import Connect4Game, Player
+from app.agents.mcts_agent import MCTSAgent
+from app.agents.minimax_agent import MinimaxAgent
+
+BOARD_SIZES = [(6, 7), (7, 8), (9, 9)]
+# 局面を切り出す進行度（盤面のマス数に対する手数の割合）
+PHASES = {"opening": 0.1, "middlegame": 0.35, "endgame": 0.6}
+CORPUS_SEED = 20240601
+POSITIONS_PER_PHASE = 4
+TACTICS_POSITIONS = 40
+# MCTS の設定の比較: 名前 -> MCTSAgent の引数
+MCTS_VARIANTS = {
+    "plain": {},
+    "rave": {"rave": True},
+    "heavy": {"heavy_playouts": True},
+    "rave_heavy": {"rave": True, "heavy_playouts": True},
+}
+
+# 結果1件: {"value": 数値, "unit": 単位, "higher_is_better": bool}
+Result = Dict[str, object]
+
+
+def random_game(rows: int, cols: int, rng: random.Random) -> List[int]:
+    """終局まで打ったランダム対局の手順"""
+    game = Connect4Game(rows=rows, cols=cols)
+    while not game.is_terminal:
+        game.step(rng.choice(game.get_valid_moves()))
+    return game.moves
+
+
+def build_corpus(rows: int, cols: int) -> Dict[str, List[List[int]]]:
+    """
+    進行度ごとに POSITIONS_PER_PHASE 局面の手順。その時点で終局しておらず、
+    次の1手で勝てない（探索がすぐ終わらない）局面だけを集める。
+    """
+    rng = random.Random(f"{CORPUS_SEED}-{rows}x{cols}")
+    corpus: Dict[str, List[List[int]]] = {}
+    for phase, ratio in PHASES.items():
+        ply = int(rows * cols * ratio)
+        positions = []
+        while len(positions) < POSITIONS_PER_PHASE:
+            game = Connect4Game(rows=rows, cols=cols)
+            for col in random_game(rows, cols, rng)[:ply]:
+                game.step(col)
+            if len(game.moves) < ply or game.is_terminal:
+                continue
+            state = game.bitboard
+            if any(state.is_winning_move(col) for col in state.valid_moves()):
+                continue
+            positions.append(game.moves)
+        corpus[phase] = positions
+    return corpus
+
+
+def build_tactics(rows: int, cols: int, count: int) -> List[Tuple[List[int], int]]:
+    """
+    正解の手が1つに決まる局面 (手順, 正解の列) を count 件。
+    即勝ちの列がちょうど1つある局面と、即勝ちが無く相手の即勝ちの列がちょうど1つある
+    （塞がないと負け、塞げば次の1手では負けない）局面を半数ずつ集める。
+    """
+    rng = random.Random(f"{CORPUS_SEED}-tactics-{rows}x{cols}")
+    wins: List[Tuple[List[int], int]] = []
+    blocks: List[Tuple[List[int], int]] = []
+    while len(wins) + len(blocks) < count:
+        moves = random_game(rows, cols, rng)
+        game = Connect4Game(rows=rows, cols=cols)
+        for col in moves[:rng.randrange(6, len(moves))]:
+            game.step(col)
+        state = game.bitboard
+        opponent = Player.P2 if state.current_player == Player.P1 else Player.P1
+        winning = [col for col in state.valid_moves() if state.is_winning_move(col)]
+        threats = [col for col in state.valid_moves() if state.is_winning_move(col, opponent)]
+        if len(winning) == 1 and len(wins) < count // 2:
+            wins.append((game.moves, winning[0]))
+        elif not winning and len(threats) == 1 and len(blocks) < count - count // 2:
+            # 塞いでも次に負ける局面はどの手も同じなので除く
+            state.play(threats[0])
+            safe = not any(state.is_winning_move(col) for col in state.valid_moves())
+            state.undo()
+            if safe:
+                blocks.append((game.moves, threats[0]))
+    return wins + blocks
+
+
+def replay(rows: int, cols: int, moves: List[int]) -> Connect4Game:
+    game = Connect4Game(rows=rows, cols=cols)
+    for col in moves:
+        game.step(col)
+    return game
+
+
+def best_of(repeat: int, fn: Callable[[], Tuple[float, float]]) -> Tuple[float, float]:
+    """fn() -> (処理量, 秒) を repeat 回実行し、処理量/秒が最大の回を返す"""
+    runs = [fn() for _ in range(repeat)]
+    return max(runs, key=lambda r: r[0] / r[1])
+
+
+def rate(amount: float, seconds: float, unit: str) -> Result:
+    return {"value": amount / seconds, "unit": unit, "higher_is_better": True}
+
+
+def latency(ms: float) -> Result:
+    return {"value": ms, "unit": "ms", "higher_is_better": False}
+
+
+# --- 各ベンチマーク ---
+
+def bench_engine(rows: int, cols: int, repeat: int, games: int) -> Result:
+    rng = random.Random(f"{CORPUS_SEED}-engine-{rows}x{cols}")
+    sequences = [random_game(rows, cols, rng) for _ in range(games)]
+
+    def run():
+        start = time.perf_counter()
+        for moves in sequences:
+            game = Connect4Game(rows=rows, cols=cols)
+            for col in moves:
+                game.step(col)
+        return sum(map(len, sequences)), time.perf_counter() - start
+
+    return rate(*best_of(repeat, run), "moves/s")
+
+
+def bench_win_check(rows: int, cols: int, corpus: Dict[str, List[List[int]]], repeat: int, loops: int) -> Result:
+    states = []
+    for positions in corpus.values():
+        for moves in positions:
+            states.append(replay(rows, cols, moves).bitboard)
+
+    def run():
+        start = time.perf_counter()
+        for _ in range(loops):
+            for state in states:
+                for col in range(cols):
+                    state.wins_at(col)
+        return loops * len(states) * cols, time.perf_counter() - start
+
+    return rate(*best_of(repeat, run), "checks/s")
+
+
+def bench_mcts(rows: int, cols: int, corpus: Dict[str, List[List[int]]], repeat: int,
+               simulations: int) -> Dict[str, Result]:
+    results = {}
+    for phase, positions in corpus.items():
+        def run():
+            random.seed(CORPUS_SEED)
+            total, elapsed = 0, 0.0
+            for moves in positions:
+                game = replay(rows, cols, moves)
+                agent = MCTSAgent(simulation_limit=simulations, reuse_tree=False, seed=CORPUS_SEED)
+                start = time.perf_counter()
+                agent.get_action(game.board, game.get_valid_moves())
+                elapsed += time.perf_counter() - start
+                total += agent.search_info["simulations"]
+            return total, elapsed
+
+        results[phase] = rate(*best_of(repeat, run), "simulations/s")
+    return results
+
+
+def bench_mcts_tactics(rows: int, cols: int, repeat: int, simulations: int) -> Dict[str, Result]:
+    """
+    MCTS_VARIANTS ごとに、少ないシミュレーション回数で正解の手を選べた割合と、シミュレーション回数/秒。
+    正答率は repeat 回の平均（乱数の種は毎回変える）。
+    """
+    positions = build_tactics(rows, cols, TACTICS_POSITIONS)
+    results = {}
+    for name, params in MCTS_VARIANTS.items():
+        correct, total, elapsed = 0, 0, 0.0
+        for i in range(repeat):
+            random.seed(CORPUS_SEED + i)
+            for moves, answer in positions:
+                game = replay(rows, cols, moves)
+                agent = MCTSAgent(simulation_limit=simulations, reuse_tree=False, seed=CORPUS_SEED + i, **params)
+                start = time.perf_counter()
+                correct += agent.get_action(game.board, game.get_valid_moves()) == answer
+                elapsed += time.perf_counter() - start
+                total += agent.search_info["simulations"]
+        results[f"{name}.accuracy"] = {"value": correct / (repeat * len(positions)), "unit": "ratio",
+                                       "higher_is_better": True}
+        results[f"{name}.speed"] = rate(total, elapsed, "simulations/s")
+    return results
+
+
+def bench_minimax(rows: int, cols: int, corpus: Dict[str, List[List[int]]], repeat: int,
+                  max_depth: int) -> Dict[str, Result]:
+    """局面ごとに新しいエージェントで深さ1から max_depth まで探索する（置換表は深さ間で引き継ぐ）"""
+    results = {}
+    for phase, positions in corpus.items():
+        best_rate = None
+        best_times = None
+        for _ in range(repeat):
+            nodes, elapsed = 0, 0.0
+            depth_times = [0.0] * max_depth
+            for moves in positions:
+                game = replay(rows, cols, moves)
+                agent = MinimaxAgent(depth=1)
+                for depth in range(1, max_depth + 1):
+                    agent.depth = depth
+                    start = time.perf_counter()
+                    agent.get_action(game.board, game.get_valid_moves())
+                    t = time.perf_counter() - start
+                    nodes += agent.nodes
+                    elapsed += t
+                    depth_times[depth - 1] += t
+            r = nodes / elapsed
+            if best_rate is None or r > best_rate:
+                best_rate, best_times = r, depth_times
+        results[f"{phase}.nodes"] = {"value": best_rate, "unit": "nodes/s", "higher_is_better": True}
+        # 深さ d に到達するまでの累積時間（局面あたりの平均）
+        cumulative = np.cumsum(best_times) / len(positions)
+        for depth in range(1, max_depth + 1):
+            results[f"{phase}.time_to_depth_{depth}"] = latency(float(cumulative[depth - 1]) * 1000)
+    return results
+
+
+def bench_minimax_ponder(rows: int, cols: int, corpus: Dict[str, List[List[int]]], depth: int,
+                         ponder_nodes: int) -> Dict[str, Result]:
+    """
+    中盤の局面で AI (MinimaxAgent) が打ち、相手の手番の局面を ponder_nodes ノード先読みしてから、
+    相手が打った後の局面を depth まで探索する。先読みしない場合と比べた、その探索の置換表のヒット率と
+    ノード数の比（先読みありのノード数 / なしのノード数）。相手の手は深さ2の Minimax で決める。
+    先読みは時間ではなくノード数で打ち切るので、結果は毎回同じになる。
+    先読みした手番の前に終局した局面は数えない。数えられる局面が無ければ空の結果を返す。
+    """
+    hits = {False: [], True: []}
+    nodes = {False: 0, True: 0}
+    for moves in corpus["middlegame"]:
+        sample = {}
+        for ponder in (False, True):
+            game = replay(rows, cols, moves)
+            agent = MinimaxAgent(depth=depth)
+            game.step(agent.get_action(game.board, game.get_valid_moves()))
+            if game.is_terminal:
+                break
+            if ponder:
+                agent.ponder(game.board, time.perf_counter() + 60, lambda: agent.nodes >= ponder_nodes)
+            game.step(MinimaxAgent(depth=2, tt_size=0).get_action(game.board, game.get_valid_moves()))
+            if game.is_terminal:
+                break
+            agent.get_action(game.board, game.get_valid_moves())
+            sample[ponder] = (agent.search_info["tt_hit_rate"], agent.nodes)
+        if len(sample) < 2:
+            continue  # 先読みあり・なしの両方が揃った局面だけで比べる
+        for ponder, (hit_rate, searched) in sample.items():
+            hits[ponder].append(hit_rate)
+            nodes[ponder] += searched
+    if not hits[True] or not nodes[False]:
+        return {}
+    return {
+        "hit_rate": {"value": float(np.mean(hits[True])), "unit": "ratio", "higher_is_better": True},
+        "cold_hit_rate": {"value": float(np.mean(hits[False])), "unit": "ratio", "higher_is_better": True},
+        "node_ratio": {"value": nodes[True] / nodes[False], "unit": "ratio", "higher_is_better": False},
+    }
+
+
+def bench_api(repeat: int, moves: int) -> Dict[str, Result]:
+    """TestClient 経由で AI どうしの対局を進め、/ai-move の応答時間を測る"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    results = {}
+    with TestClient(app) as client:
+        for agent, params in (("minimax", {"minimax_depth": 4}), ("mcts", {"mcts_simulations": 500})):
+            config = {"p1_agent": agent, "p2_agent": agent, **params}
+            # 初回はワーカープロセスの起動を含むので計測しない
+            warmup = client.post("/games/start", json=config).json()["game_id"]
+            client.post(f"/games/{warmup}/ai-move")
+            samples = []
+            for _ in range(repeat):
+                game_id = client.post("/games/start", json=config).json()["game_id"]
+                for _ in range(moves):
+                    start = time.perf_counter()
+                    response = client.post(f"/games/{game_id}/ai-move")
+                    samples.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200 or response.json()["is_terminal"]:
+                        break
+                client.delete(f"/games/{game_id}")
+            results[f"{agent}.p50"] = latency(float(np.percentile(samples, 50)))
+            results[f"{agent}.p95"] = latency(float(np.percentile(samples, 95)))
+    return results
+
+
+def run_benchmarks(quick: bool = False, repeat: int = 3, include_api: bool = True) -> dict:
+    scale = 0.25 if quick else 1.0
+    results: Dict[str, Result] = {}
+
+    def log(name: str):
+        print(f"  {name}", file=sys.stderr, flush=True)
+
+    for rows, cols in BOARD_SIZES:
+        size = f"{rows}x{cols}"
+        corpus = build_corpus(rows, cols)
+        log(f"{size} engine")
+        results[f"engine.{size}"] = bench_engine(rows, cols, repeat, max(int(200 * scale), 10))
+        log(f"{size} win_check")
+        results[f"win_check.{size}"] = bench_win_check(rows, cols, corpus, repeat, max(int(2000 * scale), 50))
+        log(f"{size} mcts")
+        for name, r in bench_mcts(rows, cols, corpus, repeat, max(int(400 * scale), 50)).items():
+            results[f"mcts.{size}.{name}"] = r
+        log(f"{size} minimax")
+        for name, r in bench_minimax(rows, cols, corpus, repeat, 4 if quick else 5).items():
+            results[f"minimax.{size}.{name}"] = r
+    log("6x7 minimax_ponder")
+    for name, r in bench_minimax_ponder(6, 7, build_corpus(6, 7), 5 if quick else 6,
+                                            int(20000 * scale)).items():
+        results[f"minimax_ponder.6x7.{name}"] = r
+    log("6x7 mcts_tactics")
+    for name, r in bench_mcts_tactics(6, 7, repeat, max(int(200 * scale), 50)).items():
+        results[f"mcts_tactics.6x7.{name}"] = r
+    if include_api:
+        log("api")
+        for name, r in bench_api(repeat, 4 if quick else 8).items():
+            results[f"api.ai_move.{name}"] = r
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "repeat": repeat,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[dict]:
+    """
+    基準と比べた各指標の変化率。悪化が threshold (0.1 = 10%) を超えたものは regression とする。
+    変化率は「良くなった方向」を正にしてある。基準の値が0の指標は比べられないので除き、
+    小さいほど良い指標が0になったものは無限大の改善とする。
+    """
+    rows = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None or not base["value"]:
+            continue
+        ratio = cur["value"] / base["value"]
+        if base["higher_is_better"]:
+            change = ratio - 1
+        else:
+            change = 1 / ratio - 1 if ratio else float("inf")
+        rows.append({
+            "name": name,
+            "baseline": base["value"],
+            "current": cur["value"],
+            "unit": cur["unit"],
+            "change": change,
+            "regression": change < -threshold,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Engine and agent benchmarks")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a saved results file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown before flagging (default 0.1 = 10%%)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="smaller workloads for a fast check")
+    parser.add_argument("--no-api", action="store_true", help="skip the /ai-move latency benchmark")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(quick=args.quick, repeat=args.repeat, include_api=not args.no_api)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if not args.compare:
+        for name, r in current["results"].items():
+            print(f"{name:<48} {r['value']:>14.3f} {r['unit']}")
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['name']:<48} {row['baseline']:>14.1f} -> {row['current']:>14.1f} {row['unit']:<14} "
+              f"{row['change']:>+7.1%} {flag}")
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
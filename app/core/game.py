@@ -1,5 +1,7 @@
 import numpy as np
+import random
 from enum import Enum
+from functools import lru_cache
 from typing import List, Tuple, Optional
 
 class Player(int, Enum):
@@ -7,86 +9,413 @@ class Player(int, Enum):
     P1 = 1  # 先攻
     P2 = -1 # 後攻
 
+def connects_four(mask: int, pos: int, stride: int) -> bool:
+    """
+    ビット位置 pos に置かれた石を通る4方向のラインだけを調べ、
+    mask 上で4つ以上つながっているかを判定する。
+    各方向とも両側に最大3マスしか走査しないため、盤面サイズによらず定数時間。
+    """
+    for shift in (1, stride, stride - 1, stride + 1):  # 垂直, 水平, 右下がり, 右上がり
+        count = 1
+        p = pos - shift
+        while count < 4 and p >= 0 and (mask >> p) & 1:
+            count += 1
+            p -= shift
+        p = pos + shift
+        while count < 4 and (mask >> p) & 1:
+            count += 1
+            p += shift
+        if count >= 4:
+            return True
+    return False
+
+
+@lru_cache(maxsize=None)
+def line_windows(rows: int, cols: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    盤面上のすべての4マスの並び（ウィンドウ）を、平坦化したマス番号 (r * cols + c) で列挙する。
+    盤面サイズごとに一度だけ計算してキャッシュする（戻り値は読み取り専用）。
+
+    戻り値: (windows, cell_windows)
+      windows: (W + 1, 4)。水平・垂直・右下がり・右上がりの順。末尾の1行は
+               盤外のダミーマス (rows * cols) だけを指す番兵ウィンドウ
+      cell_windows: (rows * cols, M)。各マスを含むウィンドウ番号。不足分は番兵ウィンドウで埋める
+    """
+    windows = []
+    for r in range(rows):  # 水平
+        for c in range(cols - 3):
+            windows.append([r * cols + c + i for i in range(4)])
+    for c in range(cols):  # 垂直
+        for r in range(rows - 3):
+            windows.append([(r + i) * cols + c for i in range(4)])
+    for r in range(rows - 3):  # 右下がり (\)
+        for c in range(cols - 3):
+            windows.append([(r + i) * cols + c + i for i in range(4)])
+    for r in range(rows - 3):  # 右上がり (/)
+        for c in range(cols - 3):
+            windows.append([(r + 3 - i) * cols + c + i for i in range(4)])
+
+    n_cells = rows * cols
+    sentinel = len(windows)
+    windows.append([n_cells] * 4)
+    per_cell = [[] for _ in range(n_cells)]
+    for w, cells in enumerate(windows[:sentinel]):
+        for cell in cells:
+            per_cell[cell].append(w)
+    width = max((len(ws) for ws in per_cell), default=0) or 1
+    cell_windows = np.full((n_cells, width), sentinel, dtype=np.intp)
+    for cell, ws in enumerate(per_cell):
+        cell_windows[cell, :len(ws)] = ws
+
+    windows = np.array(windows, dtype=np.intp)
+    windows.setflags(write=False)
+    cell_windows.setflags(write=False)
+    return windows, cell_windows
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(rows: int, cols: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """
+    Zobristハッシュ用の乱数表 ([P1], [P2]) をビット位置ごとに返す。
+    プロセスや再起動をまたいでも同じ値になるよう、盤面サイズから決まる固定の種で生成する。
+    """
+    rng = random.Random(f"zobrist-{rows}x{cols}")
+    size = cols * (rows + 1)
+    return (
+        tuple(rng.getrandbits(64) for _ in range(size)),
+        tuple(rng.getrandbits(64) for _ in range(size)),
+    )
+
+
+class BitBoard:
+    """
+    ビットボードによる盤面表現。
+
+    列優先でビットを割り当て、各列の最上段の上に番兵ビットを1つ置く
+    (1列あたり rows + 1 ビット)。(col, h) のビット位置は col * stride + h で、
+    h は下から数えた段数。番兵があるため、シフトによる列のまたぎが起きず
+    任意の rows x cols でシフト&ANDによる4連判定がそのまま使える。
+
+    hash は局面のZobristハッシュで、play/undo のたびに差分更新される。
+    mirror_hash は左右反転した局面のハッシュで、同じく差分更新する。Connect 4 は左右対称なので、
+    置換表や定跡などの局面をキーにする表は canonical_hash（2つのうち小さい方）で引き、
+    手は canonical_move で正規形の向きとの間を変換する。
+    """
+
+    __slots__ = ("rows", "cols", "stride", "masks", "heights", "moves", "current_player", "hash",
+                 "mirror_hash", "_valid", "_zobrist")
+
+    def __init__(self, rows: int = 6, cols: int = 7):
+        self.rows = rows
+        self.cols = cols
+        self.stride = rows + 1
+        self.masks = [0, 0]  # [P1の石, P2の石]
+        self.heights = [0] * cols  # 各列に積まれている石の数
+        self.moves: List[int] = []
+        self.current_player = Player.P1
+        self.hash = 0
+        self.mirror_hash = 0
+        self._valid = list(range(cols)) if rows > 0 else []
+        self._zobrist = zobrist_keys(rows, cols)
+
+    # --- 盤面操作 ---
+
+    def can_play(self, col: int) -> bool:
+        return 0 <= col < self.cols and self.heights[col] < self.rows
+
+    def valid_moves(self) -> List[int]:
+        """合法手（列番号）のリスト。列が埋まった時点で差分更新しているため計算は不要"""
+        return list(self._valid)
+
+    def play(self, col: int) -> int:
+        """
+        現在の手番の石を col に落とし、手番を交代する。
+        置いた行番号（0 が最上段の配列座標）を返す。合法性はチェックしない。
+        """
+        h = self.heights[col]
+        side = 0 if self.current_player == Player.P1 else 1
+        pos = col * self.stride + h
+        self.masks[side] |= 1 << pos
+        self.hash ^= self._zobrist[side][pos]
+        self.mirror_hash ^= self._zobrist[side][(self.cols - 1 - col) * self.stride + h]
+        h += 1
+        self.heights[col] = h
+        if h == self.rows:
+            self._valid.remove(col)
+        self.moves.append(col)
+        self.current_player = Player.P2 if self.current_player == Player.P1 else Player.P1
+        return self.rows - h
+
+    def undo(self) -> int:
+        """直前の手を取り消し、その列番号を返す"""
+        col = self.moves.pop()
+        self.current_player = Player.P2 if self.current_player == Player.P1 else Player.P1
+        h = self.heights[col]
+        if h == self.rows:
+            self._valid = [c for c in range(self.cols) if self.heights[c] < self.rows or c == col]
+        h -= 1
+        self.heights[col] = h
+        side = 0 if self.current_player == Player.P1 else 1
+        pos = col * self.stride + h
+        self.masks[side] &= ~(1 << pos)
+        self.hash ^= self._zobrist[side][pos]
+        self.mirror_hash ^= self._zobrist[side][(self.cols - 1 - col) * self.stride + h]
+        return col
+
+    def copy(self) -> "BitBoard":
+        other = BitBoard.__new__(BitBoard)
+        other.rows = self.rows
+        other.cols = self.cols
+        other.stride = self.stride
+        other.masks = self.masks[:]
+        other.heights = self.heights[:]
+        other.moves = self.moves[:]
+        other.current_player = self.current_player
+        other.hash = self.hash
+        other.mirror_hash = self.mirror_hash
+        other._valid = self._valid[:]
+        other._zobrist = self._zobrist
+        return other
+
+    # --- 判定 ---
+
+    def mask_of(self, player: int) -> int:
+        return self.masks[0 if player == Player.P1 else 1]
+
+    @property
+    def occupied(self) -> int:
+        return self.masks[0] | self.masks[1]
+
+    def bottom_mask(self) -> int:
+        """各列の最下段のビットだけが立ったマスク"""
+        mask = 0
+        for c in range(self.cols):
+            mask |= 1 << (c * self.stride)
+        return mask
+
+    def board_mask(self) -> int:
+        """盤面上の全マス（番兵を除く）のビットが立ったマスク"""
+        return self.bottom_mask() * ((1 << self.rows) - 1)
+
+    def legal_mask(self) -> int:
+        """各列の次に石が入るマスのビット。加算の繰り上がりで一度に求める"""
+        return (self.occupied + self.bottom_mask()) & self.board_mask()
+
+    def has_won(self, player: int) -> bool:
+        """シフト&ANDで player の4連を判定する"""
+        return self.is_win_mask(self.mask_of(player), self.stride)
+
+    @staticmethod
+    def is_win_mask(mask: int, stride: int) -> bool:
+        for shift in (1, stride, stride - 1, stride + 1):  # 垂直, 水平, 右下がり, 右上がり
+            m = mask & (mask >> shift)
+            if m & (m >> (2 * shift)):
+                return True
+        return False
+
+    def wins_at(self, col: int) -> bool:
+        """col の一番上の石（直前に置いた石）を含む4連があるか"""
+        h = self.heights[col] - 1
+        if h < 0:
+            return False
+        pos = col * self.stride + h
+        mask = self.masks[0] if (self.masks[0] >> pos) & 1 else self.masks[1]
+        return connects_four(mask, pos, self.stride)
+
+    def is_winning_move(self, col: int, player: Optional[int] = None) -> bool:
+        """col に player（省略時は手番側）が石を置いたら4連になるか。盤面は変更しない"""
+        if player is None:
+            player = self.current_player
+        pos = col * self.stride + self.heights[col]
+        return connects_four(self.mask_of(player) | (1 << pos), pos, self.stride)
+
+    def is_full(self) -> bool:
+        return not self._valid
+
+    # --- 変換 ---
+
+    def to_array(self) -> np.ndarray:
+        """NumPy配列（0行目が最上段）に展開する"""
+        board = np.zeros((self.rows, self.cols), dtype=int)
+        p1 = self.masks[0]
+        for c in range(self.cols):
+            base = c * self.stride
+            for h in range(self.heights[c]):
+                board[self.rows - 1 - h][c] = Player.P1 if (p1 >> (base + h)) & 1 else Player.P2
+        return board
+
+    @classmethod
+    def from_array(cls, board: np.ndarray, current_player: Optional[int] = None) -> "BitBoard":
+        """
+        NumPy配列の盤面から生成する。手順は失われるため moves は空のまま。
+        current_player を省略した場合は駒数から推定する（先攻P1）。
+        """
+        rows, cols = board.shape
+        bb = cls(rows, cols)
+        p1_count = 0
+        p2_count = 0
+        for c in range(cols):
+            h = 0
+            for r in range(rows - 1, -1, -1):
+                v = board[r][c]
+                if v == Player.EMPTY:
+                    break
+                side = 0 if v == Player.P1 else 1
+                pos = c * bb.stride + h
+                bb.masks[side] |= 1 << pos
+                bb.hash ^= bb._zobrist[side][pos]
+                bb.mirror_hash ^= bb._zobrist[side][(cols - 1 - c) * bb.stride + h]
+                if side == 0:
+                    p1_count += 1
+                else:
+                    p2_count += 1
+                h += 1
+            bb.heights[c] = h
+        bb._valid = [c for c in range(cols) if bb.heights[c] < rows]
+        if current_player is None:
+            current_player = Player.P1 if p1_count == p2_count else Player.P2
+        bb.current_player = Player(current_player)
+        return bb
+
+    def key(self) -> int:
+        """局面を一意に表す整数。P1の石 + 占有マスク（番兵の繰り上がりで一意になる）"""
+        return self.masks[0] + self.occupied
+
+    # --- 左右対称 ---
+
+    def _mirror_mask(self, mask: int) -> int:
+        column = (1 << self.stride) - 1
+        mirrored = 0
+        for c in range(self.cols):
+            mirrored |= ((mask >> (c * self.stride)) & column) << ((self.cols - 1 - c) * self.stride)
+        return mirrored
+
+    @property
+    def mirrored(self) -> bool:
+        """正規形が左右反転した向きか（canonical_hash が mirror_hash のとき）"""
+        return self.mirror_hash < self.hash
+
+    @property
+    def canonical_hash(self) -> int:
+        """局面と左右反転した局面で共通のハッシュ"""
+        return min(self.hash, self.mirror_hash)
+
+    def canonical_key(self) -> int:
+        """局面と左右反転した局面で共通の、一意な整数（canonical_hash と同じ向きの key）"""
+        if not self.mirrored:
+            return self.key()
+        return self._mirror_mask(self.masks[0]) + self._mirror_mask(self.occupied)
+
+    def canonical_move(self, col: int) -> int:
+        """
+        この局面での列と、正規形の向きでの列を相互に変換する（反転は2回で元に戻るため、
+        どちらの向きにも同じ関数を使う）
+        """
+        return self.cols - 1 - col if self.mirrored else col
+
+    def is_symmetric(self) -> bool:
+        """左右対称な局面か。対称なら右半分の手は左半分の手と同じ結果になる"""
+        return self.hash == self.mirror_hash and self._mirror_mask(self.masks[0]) == self.masks[0] \
+            and self._mirror_mask(self.masks[1]) == self.masks[1]
+
+    def distinct_moves(self) -> List[int]:
+        """合法手のうち、左右対称な局面では左半分（と中央）だけ。結果の異なる手を1つずつ並べる"""
+        if not self.is_symmetric():
+            return self.valid_moves()
+        return [c for c in self.valid_moves() if c <= self.cols - 1 - c]
+
+
 class Connect4Game:
     def __init__(self, rows: int = 6, cols: int = 7):
         self.rows = rows
         self.cols = cols
-        self.board = np.zeros((rows, cols), dtype=int)
+        self._bb = BitBoard(rows, cols)
+        self._board_cache: Optional[np.ndarray] = None
         self.current_player = Player.P1
         self.winner = None
         self.is_terminal = False
 
+    @property
+    def board(self) -> np.ndarray:
+        """
+        NumPy形式の盤面 (0行目が最上段)。内部状態はビットボードで持ち、
+        参照されたときにだけ展開する（次の手が打たれるまでキャッシュ）。
+        """
+        if self._board_cache is None:
+            board = self._bb.to_array()
+            board.setflags(write=False)  # 内部状態と食い違わないよう読み取り専用
+            self._board_cache = board
+        return self._board_cache
+
+    @property
+    def bitboard(self) -> BitBoard:
+        return self._bb
+
+    @property
+    def moves(self) -> List[int]:
+        """これまでに打たれた列の履歴"""
+        return list(self._bb.moves)
+
+    @property
+    def last_move(self) -> Optional[int]:
+        return self._bb.moves[-1] if self._bb.moves else None
+
+    @property
+    def last_row(self) -> Optional[int]:
+        """直前の石が置かれた行 (0行目が最上段)"""
+        if not self._bb.moves:
+            return None
+        return self.rows - self._bb.heights[self._bb.moves[-1]]
+
     def reset(self):
-        self.board = np.zeros((self.rows, self.cols), dtype=int)
+        self._bb = BitBoard(self.rows, self.cols)
+        self._board_cache = None
         self.current_player = Player.P1
         self.winner = None
         self.is_terminal = False
         return self.board
 
     def get_valid_moves(self) -> List[int]:
-        """一番上の行が空いている列（インデックス）のリストを返す"""
+        """石を置ける列（インデックス）のリストを返す"""
         if self.is_terminal:
             return []
-        # 0行目（一番上）が0（空）である列を探す
-        return [c for c in range(self.cols) if self.board[0][c] == Player.EMPTY]
+        return self._bb.valid_moves()
 
     def step(self, col: int) -> Tuple[np.ndarray, Optional[Player], bool]:
         """
-        行動を実行し、(次状態, 勝者, 終了フラグ) を返す
+        行動を実行し、(次状態, 勝者, 終了フラグ) を返す。
+        次状態は board と同じ読み取り専用の配列
         """
-        if col not in self.get_valid_moves():
+        col = int(col)
+        if self.is_terminal or not self._bb.can_play(col):
             raise ValueError(f"Invalid move: Column {col} is full or out of bounds.")
 
-        # 重力の実装：一番下の空いている行を探す
-        for r in range(self.rows - 1, -1, -1):
-            if self.board[r][col] == Player.EMPTY:
-                self.board[r][col] = self.current_player
-                break
+        row = self._bb.play(col)
+        if self._board_cache is not None:
+            # 直前の盤面に置いた石を1つ足すだけにする（全マスを展開し直さない）。
+            # 以前の配列は呼び出し側が持っているかもしれないので書き換えない
+            board = self._board_cache.copy()
+            board[row, col] = self.current_player
+            board.setflags(write=False)
+            self._board_cache = board
 
-        # 勝敗判定
-        if self.check_win(self.current_player):
+        # 勝敗判定（置いた石を通るラインだけを見る）
+        if self._bb.wins_at(col):
             self.winner = self.current_player
             self.is_terminal = True
-        elif len(self.get_valid_moves()) == 0:
+        elif self._bb.is_full():
             # 引き分け
             self.winner = None # None means draw if terminal is True
             self.is_terminal = True
         else:
             # プレイヤー交代
-            self.current_player = Player.P2 if self.current_player == Player.P1 else Player.P1
+            self.current_player = self._bb.current_player
 
-        return self.board.copy(), self.winner, self.is_terminal
+        return self.board, self.winner, self.is_terminal
 
     def check_win(self, player: Player) -> bool:
         """指定されたプレイヤーが勝利条件（4つ並び）を満たしているか判定"""
-        # 水平、垂直、対角線方向をチェック
-        # Note: 可変サイズ対応のため汎用的なチェックを行います
-        
-        # 水平
-        for r in range(self.rows):
-            for c in range(self.cols - 3):
-                if np.all(self.board[r, c:c+4] == player):
-                    return True
-        
-        # 垂直
-        for r in range(self.rows - 3):
-            for c in range(self.cols):
-                if np.all(self.board[r:r+4, c] == player):
-                    return True
-        
-        # 右下がり対角線 (\)
-        for r in range(self.rows - 3):
-            for c in range(self.cols - 3):
-                if all(self.board[r+i][c+i] == player for i in range(4)):
-                    return True
-
-        # 左下がり対角線 (/)
-        for r in range(self.rows - 3):
-            for c in range(3, self.cols):
-                if all(self.board[r+i][c-i] == player for i in range(4)):
-                    return True
-        
-        return False
+        return self._bb.has_won(player)
 
     def render(self):
         """コンソールに盤面を表示"""
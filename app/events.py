@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from typing import Dict, Set, Tuple
+
+
+class GameEventHub:
+    """
+    ゲームごとのイベント（着手の差分、AIの探索の途中経過）を WebSocket の購読者へ配る。
+
+    publish はどのスレッドからでも呼べる（同期エンドポイントのスレッドプールや、
+    AIワーカーの途中経過を受け取るスレッドから呼ばれる）。各購読者のキューへは
+    そのイベントループ上で積む。購読はプロセス内だけで、複数のuvicornワーカー間では共有しない。
+    """
+
+    # 購読者1人あたりに溜めておくイベント数の上限。読み出しが追いつかない購読者の分は捨てる
+    MAX_QUEUED = 256
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, game_id: str) -> asyncio.Queue:
+        """イベントループ上で呼ぶ。このゲームのイベントが届くキューを返す"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.MAX_QUEUED)
+        with self._lock:
+            self._subscribers.setdefault(game_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, game_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(game_id)
+            if not subscribers:
+                return
+            subscribers.difference_update([s for s in subscribers if s[1] is queue])
+            if not subscribers:
+                del self._subscribers[game_id]
+
+    def has_subscribers(self, game_id: str) -> bool:
+        return game_id in self._subscribers
+
+    def publish(self, game_id: str, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(game_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                pass  # 購読者のイベントループが既に閉じている
+
+
+def _offer(queue: asyncio.Queue, event: dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+event_hub = GameEventHub()
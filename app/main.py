@@ -1,16 +1,59 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import math
+import os
+import time
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles # 追加
-from fastapi.responses import FileResponse # 追加
+from fastapi import Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse # 追加
 import numpy as np
-from app.schemas import GameConfig, GameState, MoveRequest
+from app.schemas import (
+    AgentType, AnalyzeBatchRequest, AnalyzeResult, GameConfig, GameState, MoveRequest, SearchInfo,
+)
+from app.analysis import (
+    MAX_BATCH_POSITIONS, analyze_chunk, check_playable, position_from_board, position_from_moves,
+)
 from app.managers import game_manager
-from app.core.game import Player
+from app.sessions import SessionConflict
+from app.core.game import Connect4Game, Player
+from app.events import event_hub
+from app.agents.base import BaseAgent
+from app.agents.evaluation import mirror_symmetric
+from app import metrics
+from app.workers import MoveTimeout, PoolSaturated, move_dispatcher
 
 
 
 app = FastAPI(title="Connect 4 AI Platform API")
 
+# AIの探索の途中経過を、そのゲームのWebSocket購読者へ流す
+move_dispatcher.on_progress = lambda game_id, info: event_hub.publish(game_id, {"type": "progress", **info})
+
+# メトリクス (/metrics)。MIRAI_METRICS=0 で無効にすると、探索統計のフックもリクエストの計測も行わない
+METRICS_ENABLED = os.environ.get("MIRAI_METRICS", "1") != "0"
+if METRICS_ENABLED:
+    BaseAgent.add_stats_hook(metrics.record_agent_stats)
+    metrics.registry.register(metrics.Gauge(
+        "mirai_active_sessions", "Game sessions held in memory", lambda: len(game_manager.store)))
+    metrics.registry.register(metrics.Gauge(
+        "mirai_session_memory_bytes", "Estimated memory used by sessions", lambda: game_manager.store.memory_bytes))
+    metrics.registry.register(metrics.Gauge(
+        "mirai_ai_moves_pending", "AI moves running or queued", lambda: move_dispatcher.pending))
+    metrics.registry.register(metrics.Gauge(
+        "mirai_pondering_sessions", "Sessions pondering on the opponent's turn", lambda: len(game_manager.pondering)))
+
+    @app.middleware("http")
+    async def record_request_latency(request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        # パスそのものではなくルートのテンプレート (/games/{game_id} など) で集計する
+        route = request.scope.get("route")
+        metrics.http_requests.observe(
+            time.perf_counter() - start,
+            method=request.method, route=route.path if route else "unmatched", status=response.status_code)
+        return response
+
 # フロントエンド開発を見越してCORSを許可
 app.add_middleware(
     CORSMiddleware,
@@ -31,7 +74,10 @@ async def read_index():
 @app.post("/games/start", response_model=GameState)
 def start_game(config: GameConfig):
     """新しいゲームセッションを作成します"""
-    game_id = game_manager.create_game(config)
+    try:
+        game_id = game_manager.create_game(config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     game = game_manager.get_game(game_id)
     
     return GameState(
@@ -43,6 +89,26 @@ def start_game(config: GameConfig):
         message="Game started"
     )
 
+def save_game(game_id: str, game):
+    try:
+        game_manager.save_game(game_id, game)
+    except SessionConflict:
+        raise HTTPException(status_code=409, detail="Game was updated by another request")
+
+def move_event(game: Connect4Game) -> dict:
+    """直前の手の差分 (WebSocketで配信する)"""
+    ply = len(game.moves)
+    return {
+        "type": "move",
+        "column": game.last_move,
+        "row": game.last_row,
+        "player": int(Player.P1 if ply % 2 == 1 else Player.P2),
+        "ply": ply,
+        "current_player": int(game.current_player),
+        "is_terminal": game.is_terminal,
+        "winner": None if game.winner is None else int(game.winner),
+    }
+
 @app.get("/games/{game_id}", response_model=GameState)
 def get_game_state(game_id: str):
     """現在の盤面状態を取得します"""
@@ -63,9 +129,46 @@ def get_game_state(game_id: str):
         current_player=game.current_player,
         winner=game.winner,
         is_terminal=game.is_terminal,
+        last_move=game.last_move,
         message=msg
     )
 
+def start_pondering(game_id: str, game: Connect4Game, player: int, agent: BaseAgent):
+    """
+    AI (player) が打った後、次が人間の手番なら、その局面で agent の先読みを始める（設定で有効な場合）。
+    同時に行う先読みの数はディスパッチャの枠で抑え、空きが無ければ先読みしない。
+    """
+    config = game_manager.get_config(game_id)
+    if config is None or not config.ponder or game.is_terminal:
+        return
+    if game_manager.get_agent(game_id, game.current_player) is not None:
+        return  # 相手もAI
+    ticket = move_dispatcher.start_ponder()
+    if ticket is None:
+        return
+    task = asyncio.create_task(_ponder(game_id, game, player, agent, ticket, config.ponder_budget_ms / 1000))
+    game_manager.pondering[game_id] = (task, ticket)
+
+async def _ponder(game_id: str, game: Connect4Game, player: int, agent: BaseAgent, ticket, budget: float):
+    try:
+        _, pondered = await move_dispatcher.ponder(agent, game.board, budget, ticket)
+    except Exception:
+        return  # 先読みの失敗（ワーカーの異常終了など）は対局に影響させない
+    finally:
+        game_manager.pondering.pop(game_id, None)
+    # 先読みの間にセッションが破棄・復元されたり、エージェントが差し替えられていたら捨てる。
+    # 人間の手が進んでいても、エージェントの木・置換表はその手前の局面からのものなので使える
+    if game_manager.get_game(game_id) is game and game_manager.get_agent(game_id, player) is agent:
+        game_manager.set_agent(game_id, player, pondered)
+
+async def finish_pondering(game_id: str):
+    """先読み中なら打ち切って、温めたエージェントが戻るのを待つ"""
+    entry = game_manager.pondering.get(game_id)
+    if entry is not None:
+        task, ticket = entry
+        ticket.stop()
+        await asyncio.wait({task})  # このリクエストが中断されても先読みのタスクは取り消さない
+
 @app.post("/games/{game_id}/move", response_model=GameState)
 def make_move(game_id: str, move: MoveRequest):
     """人間プレイヤーが手を打ちます"""
@@ -83,12 +186,18 @@ def make_move(game_id: str, move: MoveRequest):
         game.step(move.column)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    save_game(game_id, game)
+    game_manager.stop_pondering(game_id)  # AIの番になったので、先読みは次の ai-move までに戻らせる
+    event_hub.publish(game_id, move_event(game))
 
     return get_game_state(game_id)
 
 @app.post("/games/{game_id}/ai-move", response_model=GameState)
-def trigger_ai_move(game_id: str):
-    """現在の手番のAIに手を打たせます"""
+async def trigger_ai_move(game_id: str):
+    """
+    現在の手番のAIに手を打たせます。
+    探索はワーカープロセスで行うため、その間も他のリクエスト（状態取得など）は待たされません。
+    """
     game = game_manager.get_game(game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
@@ -96,21 +205,194 @@ def trigger_ai_move(game_id: str):
     if game.is_terminal:
         raise HTTPException(status_code=400, detail="Game is already finished")
 
-    # 現在のプレイヤー用のエージェントを取得
-    agent = game_manager.get_agent(game_id, game.current_player)
+    # 現在のプレイヤー用のエージェントを取得（先読み中なら、温めたものが戻るのを待ってから）
+    await finish_pondering(game_id)
+    player = game.current_player
+    agent = game_manager.get_agent(game_id, player)
     if not agent:
         raise HTTPException(status_code=400, detail="Current player is not an AI agent")
 
-    valid_moves = game.get_valid_moves()
-    action = agent.get_action(game.board, valid_moves)
-    
-    game.step(action)
-    
-    # 応答に「AIがどこに打ったか」を含めるため、state取得時にlast_moveを入れられると良いですが、
-    # 今回は盤面差分で判定します
-    return get_game_state(game_id)
+    if not game_manager.begin_ai_move(game_id):
+        raise HTTPException(status_code=409, detail="AI move already in progress")
+    still_running = None
+    try:
+        ply = len(game.moves)
+        try:
+            action, agent = await move_dispatcher.run(
+                agent, game.board, game.get_valid_moves(),
+                game_id=game_id if event_hub.has_subscribers(game_id) else None)
+        except PoolSaturated as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+        except MoveTimeout as e:
+            # 止められなかった探索（スレッド実行）が終わるまでは思考中のままにし、次の探索を重ねさせない
+            still_running = e.running
+            raise HTTPException(status_code=504, detail="AI move timed out")
+
+        # 計算中にゲームが削除・変更されていたら結果は捨てる
+        if game_manager.get_game(game_id) is not game or len(game.moves) != ply:
+            raise HTTPException(status_code=409, detail="Game changed during AI move")
+        game_manager.set_agent(game_id, player, agent)
+        agent.publish_stats(game.rows, game.cols)
+        game.step(action)
+        save_game(game_id, game)
+    finally:
+        if still_running is None:
+            game_manager.end_ai_move(game_id)
+        else:
+            still_running.add_done_callback(lambda _: game_manager.end_ai_move(game_id))
+    event_hub.publish(game_id, {**move_event(game), "search": agent.search_info})
+    start_pondering(game_id, game, player, agent)
+
+    state = get_game_state(game_id)
+    state.search = SearchInfo(**agent.search_info) # 到達した深さ/シミュレーション回数
+    return state
 
 @app.delete("/games/{game_id}")
 def delete_game(game_id: str):
     game_manager.delete_game(game_id)
-    return {"message": "Game session deleted"}
\ No newline at end of file
+    event_hub.publish(game_id, {"type": "deleted"})
+    return {"message": "Game session deleted"}
+
+@app.websocket("/games/{game_id}/ws")
+async def game_channel(websocket: WebSocket, game_id: str):
+    """
+    ゲームのイベントを配信するWebSocket。接続直後に現在の状態 ({"type": "state", ...}) を1回送り、
+    以降は着手ごとの差分 ({"type": "move", "column", "row", "player", ...}) と、
+    AIの思考中の途中経過 ({"type": "progress", "best_move", "simulations" / "depth", ...}) を送る。
+    """
+    await websocket.accept()
+    if not game_manager.get_game(game_id):
+        await websocket.close(code=4404, reason="Game not found")
+        return
+
+    queue = event_hub.subscribe(game_id)
+    # クライアントからのメッセージは使わないが、切断を検知するために読み続ける
+    receiver = asyncio.create_task(_drain_client(websocket))
+    try:
+        await websocket.send_json({"type": "state", **get_game_state(game_id).model_dump()})
+        while True:
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                break
+            event = getter.result()
+            await websocket.send_json(event)
+            if event["type"] == "deleted":
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        event_hub.unsubscribe(game_id, queue)
+
+async def _drain_client(websocket: WebSocket):
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: AnalyzeBatchRequest):
+    """
+    複数の局面をまとめて解析し、局面ごとの結果 (AnalyzeResult) を終わったものから
+    NDJSON (1行1結果) で返します。同じ局面は1回だけ解析し、結果の indices にまとめます。
+    解析はAI用のワーカープロセスに分けて並列に行います。
+    """
+    if len(request.positions) > MAX_BATCH_POSITIONS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_POSITIONS} positions per request")
+    config = request.config
+    try:
+        agent = game_manager.create_agent(request.agent, config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if agent is None or not agent.supports_analysis:
+        raise HTTPException(status_code=400, detail=f"Agent '{request.agent.value}' does not support analysis")
+
+    # 局面を解釈し、同じ局面（左右反転を含む）をまとめる。Minimax の評価は列数が偶数だと
+    # 左右対称でないので、その場合は左右反転した局面を別の局面として解析する
+    mirror = request.agent != AgentType.MINIMAX or mirror_symmetric(config.cols)
+    errors = []
+    unique = {}  # 正規形のキー -> (解析する盤面, そのままの向きの添字, 左右反転した向きの添字)
+    for i, position in enumerate(request.positions):
+        try:
+            if (position.moves is None) == (position.board is None):
+                raise ValueError("Specify exactly one of moves or board")
+            if position.moves is not None:
+                state = position_from_moves(config.rows, config.cols, position.moves)
+            else:
+                state = position_from_board(config.rows, config.cols, position.board)
+            check_playable(state)
+        except ValueError as e:
+            errors.append(AnalyzeResult(indices=[i], error=str(e)))
+            continue
+        key = state.canonical_key() if mirror else state.key()
+        if key not in unique:
+            unique[key] = (state.to_array(), [i], [], state.key())
+        elif state.key() == unique[key][3]:
+            unique[key][1].append(i)
+        else:
+            unique[key][2].append(i)
+
+    # 1回の投入で解析する局面数。ワーカーあたり数回に分けて、終わったものから返せるようにする
+    items = list(unique.values())
+    workers = move_dispatcher.workers
+    chunk_size = max(1, min(32, math.ceil(len(items) / (workers * 4))))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    async def run_chunk(chunk):
+        try:
+            # runs_in_thread のエージェント（NeuralMCTS）は、推論サービスを共有するためスレッドで解析する
+            results = await move_dispatcher.submit(analyze_chunk, request.agent, config, [item[0] for item in chunk],
+                                                   in_thread=getattr(agent, "runs_in_thread", False))
+        except Exception as e:
+            results = [(None, None, None, f"Analysis failed: {e}")] * len(chunk)
+        lines = []
+        for (board, indices, mirrored, _), (best, scores, search, error) in zip(chunk, results):
+            if scores is not None:
+                agent.publish_stats(config.rows, config.cols, search)
+            for group, flip in ((indices, False), (mirrored, True)):
+                if not group:
+                    continue
+                # 左右反転した向きで渡された局面には、列を反転して返す
+                to_col = (lambda col: config.cols - 1 - col) if flip else (lambda col: col)
+                result = AnalyzeResult(indices=group, best_move=to_col(best) if best is not None else None,
+                                       error=error)
+                if scores is not None:
+                    result.scores = [scores.get(to_col(col)) for col in range(config.cols)]
+                    result.search = SearchInfo(**search)
+                lines.append(result.model_dump_json() + "\n")
+        return lines
+
+    async def stream():
+        for result in errors:
+            yield result.model_dump_json() + "\n"
+        # 同時に投入するのはワーカー数の2倍まで（1リクエストでキューを埋め尽くさない）
+        pending = set()
+        remaining = iter(chunks)
+        try:
+            while True:
+                for chunk in remaining:
+                    pending.add(asyncio.ensure_future(run_chunk(chunk)))
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for line in task.result():
+                        yield line
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus のテキスト形式のメトリクス"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
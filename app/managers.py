@@ -1,58 +1,87 @@
 import uuid
 import numpy as np
-from typing import Dict, Optional
+from typing import Any, Dict, Optional, Set, Tuple
 
 from app.core.game import Connect4Game, Player
 from app.agents.base import BaseAgent
-from app.agents.random_agent import RandomAgent
-from app.agents.minimax_agent import MinimaxAgent
-from app.agents.mcts_agent import MCTSAgent
+from app.agents.factory import create_agent
 from app.schemas import GameConfig, AgentType
+from app.sessions import Session, SessionStore
 
 class GameManager:
-    def __init__(self):
-        # メモリ上でゲームセッションを保持 (再起動で消えます)
-        self.games: Dict[str, Connect4Game] = {}
-        self.agents: Dict[str, Dict[int, BaseAgent]] = {}
+    def __init__(self, store: Optional[SessionStore] = None):
+        # ゲームセッションの保持先。無操作の期限切れや上限超過で古いものから破棄される
+        # （MIRAI_SESSION_DB を指定すれば再起動後も残る）
+        self.store = store if store is not None else SessionStore.from_env()
+        self.store.agent_factory = self._create_agents
+        self.store.is_pinned = self.is_thinking
+        self.thinking: Set[str] = set()  # AIの手を計算中のゲーム
+        self.pondering: Dict[str, Tuple[Any, Any]] = {}  # 先読み中のゲーム -> (asyncio.Task, PonderTicket)
 
     def create_game(self, config: GameConfig) -> str:
         game_id = str(uuid.uuid4())
         game = Connect4Game(rows=config.rows, cols=config.cols)
-        self.games[game_id] = game
-        
-        # エージェントのセットアップ
-        self.agents[game_id] = {}
-        self._setup_agent(game_id, Player.P1, config.p1_agent, config)
-        self._setup_agent(game_id, Player.P2, config.p2_agent, config)
-        
+        self.store.add(Session(game_id, config, game, self._create_agents(config)))
         return game_id
 
-    def _setup_agent(self, game_id: str, player: int, agent_type: AgentType, config: GameConfig):
-        if agent_type == AgentType.HUMAN:
-            return # Humanはエージェントインスタンスを持たない
-
-        agent = None
-        if agent_type == AgentType.RANDOM:
-            agent = RandomAgent()
-        elif agent_type == AgentType.MINIMAX:
-            agent = MinimaxAgent(depth=config.minimax_depth)
-        elif agent_type == AgentType.MCTS:
-            agent = MCTSAgent(simulation_limit=config.mcts_simulations)
-        
-        if agent:
-            self.agents[game_id][player] = agent
+    def _create_agents(self, config: GameConfig) -> Dict[int, BaseAgent]:
+        agents = {}
+        for player, agent_type in ((Player.P1, config.p1_agent), (Player.P2, config.p2_agent)):
+            agent = self.create_agent(agent_type, config)
+            if agent:
+                agents[player] = agent
+        return agents
+
+    def create_agent(self, agent_type: AgentType, config: GameConfig) -> Optional[BaseAgent]:
+        return create_agent(agent_type, config)
 
     def get_game(self, game_id: str) -> Optional[Connect4Game]:
-        return self.games.get(game_id)
+        session = self.store.get(game_id)
+        return session.game if session else None
+
+    def get_config(self, game_id: str) -> Optional[GameConfig]:
+        session = self.store.get(game_id)
+        return session.config if session else None
 
     def get_agent(self, game_id: str, player: int) -> Optional[BaseAgent]:
-        return self.agents.get(game_id, {}).get(player)
+        session = self.store.get(game_id)
+        return session.agents.get(player) if session else None
+
+    def set_agent(self, game_id: str, player: int, agent: BaseAgent):
+        """別プロセスで探索して状態が更新されたエージェントを差し替える"""
+        session = self.store.get(game_id)
+        if session:
+            session.agents[player] = agent
+
+    def save_game(self, game_id: str, game: Connect4Game):
+        """
+        手を打った後に呼ぶ（ディスクへの保存とメモリ使用量の更新）。
+        他のリクエストやワーカーが先にゲームを変更していた場合は SessionConflict
+        """
+        self.store.save(game_id, game)
+
+    def is_thinking(self, game_id: str) -> bool:
+        return game_id in self.thinking
+
+    def begin_ai_move(self, game_id: str) -> bool:
+        """AIの手を計算中の印を付ける。既に計算中なら False"""
+        if game_id in self.thinking:
+            return False
+        self.thinking.add(game_id)
+        return True
+
+    def end_ai_move(self, game_id: str):
+        self.thinking.discard(game_id)
+
+    def stop_pondering(self, game_id: str):
+        """先読みに打ち切りを指示する（結果は先読みのタスクが戻ったときに反映される）"""
+        entry = self.pondering.get(game_id)
+        if entry is not None:
+            entry[1].stop()
 
     def delete_game(self, game_id: str):
-        if game_id in self.games:
-            del self.games[game_id]
-        if game_id in self.agents:
-            del self.agents[game_id]
+        self.stop_pondering(game_id)
+        self.store.delete(game_id)
 
 # シングルトンとしてインスタンス化
-game_manager = GameManager()
\ No newline at end of file
+game_manager = GameManager()
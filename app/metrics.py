@@ -0,0 +1,189 @@
+"""
+Prometheus のテキスト形式で出力する最小限のメトリクス（カウンタ、ゲージ、ヒストグラム）。
+
+値はこのプロセス内だけで集計する（複数のuvicornワーカーで動かす場合はワーカーごとの値になる）。
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """出力時に関数を呼んで値を取るゲージ"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._read = read
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self._read())}"]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = sorted(buckets)
+        # ラベルの組 -> (各バケットの件数 (累積ではない), 合計, 件数)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(e[0]), e[1], e[2])) for key, e in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + [math.inf], counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> List[float]:
+    return [start * factor ** i for i in range(count)]
+
+
+# --- このアプリのメトリクス ---
+
+registry = Registry()
+
+AGENT_LABELS = ("agent", "board")
+
+agent_moves = registry.register(Counter(
+    "mirai_agent_searches_total", "Agent searches (get_action / analyze calls)", AGENT_LABELS))
+agent_seconds = registry.register(Histogram(
+    "mirai_agent_search_seconds", "Wall time per agent search",
+    exponential_buckets(0.001, 2, 15), AGENT_LABELS))
+agent_nodes = registry.register(Histogram(
+    "mirai_agent_search_nodes", "Minimax nodes visited per search",
+    exponential_buckets(100, 4, 10), AGENT_LABELS))
+agent_simulations = registry.register(Histogram(
+    "mirai_agent_search_simulations", "MCTS simulations per search",
+    exponential_buckets(100, 2, 12), AGENT_LABELS))
+agent_rollouts = registry.register(Counter(
+    "mirai_agent_rollouts_total", "MCTS rollouts played", AGENT_LABELS))
+agent_depth = registry.register(Histogram(
+    "mirai_agent_search_depth", "Depth reached per search (Minimax: completed depth, MCTS: deepest selection)",
+    [1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 20, 30, 42], AGENT_LABELS))
+agent_batch_size = registry.register(Histogram(
+    "mirai_agent_nn_batch_size", "Mean network batch size per search (NeuralMCTS)",
+    [1, 2, 4, 8, 16, 32, 64, 128], AGENT_LABELS))
+agent_tt_hit_rate = registry.register(Histogram(
+    "mirai_agent_tt_hit_rate", "Transposition table hit rate per search",
+    [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0], AGENT_LABELS))
+
+http_requests = registry.register(Histogram(
+    "mirai_http_request_seconds", "HTTP request latency",
+    exponential_buckets(0.001, 2, 15), ("method", "route", "status")))
+
+
+def record_agent_stats(agent, stats: dict):
+    """BaseAgent.add_stats_hook に登録するフック"""
+    labels = {"agent": stats["agent"], "board": f"{stats['rows']}x{stats['cols']}"}
+    agent_moves.inc(**labels)
+    if stats.get("elapsed_ms") is not None:
+        agent_seconds.observe(stats["elapsed_ms"] / 1000, **labels)
+    if stats.get("nodes") is not None:
+        agent_nodes.observe(stats["nodes"], **labels)
+    if stats.get("simulations") is not None:
+        agent_simulations.observe(stats["simulations"], **labels)
+    if stats.get("rollouts") is not None:
+        agent_rollouts.inc(stats["rollouts"], **labels)
+    depth = stats.get("max_depth", stats.get("depth"))
+    if depth is not None:
+        agent_depth.observe(depth, **labels)
+    if stats.get("tt_hit_rate") is not None:
+        agent_tt_hit_rate.observe(stats["tt_hit_rate"], **labels)
+    if stats.get("batch_size") is not None:
+        agent_batch_size.observe(stats["batch_size"], **labels)
@@ -1,12 +1,23 @@
-from pydantic import BaseModel
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Literal, Union
 from enum import Enum
 
+# solver_threshold の上限。6x7 の無作為な局面では、空き20マスの読み切りは純Pythonで多くが0.2秒以内（最長で1秒弱）
+MAX_SOLVER_THRESHOLD = 20
+# Lazy SMP (minimax_workers >= 2) を使える列数の上限。共有置換表は最善手を4ビットで持つ（15は「手なし」）
+MAX_SHARED_TT_COLS = 14
+
 class AgentType(str, Enum):
     HUMAN = "human"
     RANDOM = "random"
     MINIMAX = "minimax"
     MCTS = "mcts"
+    NEURAL = "neural"  # 方策・価値ネットワークで導く MCTS (PUCT)。学習済みの重み (MIRAI_NN_MODEL) が必要
+
+class ParallelMode(str, Enum):
+    NONE = "none"  # 1プロセスで逐次探索
+    ROOT = "root"  # 各ワーカーが同じ局面から独立に木を育て、ルートの統計を合算
+    LEAF = "leaf"  # 葉からのロールアウトをまとめてワーカーに配る
 
 class GameConfig(BaseModel):
     rows: int = 6
@@ -16,11 +27,57 @@ class GameConfig(BaseModel):
     
     # AI設定用パラメータ（オプション）
     minimax_depth: int = 4
+    minimax_tt_size: int = 1 << 18  # Minimaxの置換表のスロット数上限（0で無効）
+    minimax_workers: int = 1  # 2以上で Lazy SMP（プロセスプールで並列に探索し、共有メモリの置換表を使う）
     mcts_simulations: int = 1000
+    mcts_parallel: ParallelMode = ParallelMode.NONE  # "root" / "leaf" でプロセスプールを使った並列探索
+    mcts_workers: Optional[int] = None  # 並列探索の分割数（未指定ならワーカープロセス数）
+    mcts_rollout_batch: int = 1  # 1シミュレーションあたりNumPyでまとめて行うロールアウト数
+    mcts_rave: bool = False  # 選択で AMAF 統計を混ぜる (RAVE)
+    mcts_heavy_playouts: bool = False  # ロールアウトで即勝ちを打ち、相手の即勝ちを塞ぐ
+    neural_simulations: int = 400  # NeuralMCTS: 1手あたりネットワークで評価する葉の数
+    neural_batch_size: int = 8  # NeuralMCTS: 1回の探索で同時に評価待ちにする葉の数
+
+    # 1手あたりの思考時間 (ミリ秒)。指定するとMCTSは期限まで反復し、Minimaxは反復深化で
+    # 期限内に完了した最深の結果を使う（mcts_simulations / minimax_depth の代わり）
+    time_budget_ms: Optional[int] = None
+
+    # 盤面サイズに対応する定跡ファイル (books/{rows}x{cols}.book) があれば、探索の前に引く。
+    # 定跡は深い探索の結果なので、浅い設定（弱いAI）でも序盤は最善手を打つようになる。既定では使わない
+    use_opening_book: bool = False
+
+    # 空きマスがこの数以下になったら、Minimax / MCTS は探索の代わりに終局まで読み切って打つ（0で無効）。
+    # 読み切りの手間は空きマスの数に対して指数的に増えるため上限を設ける
+    solver_threshold: int = Field(12, ge=0, le=MAX_SOLVER_THRESHOLD)
+
+    # AIが打った後、人間の手番の間も相手の応手に備えて探索を続ける（先読み）。
+    # 1回の先読みは ponder_budget_ms で打ち切り、人間が打つかゲームが削除されたらその時点で止める
+    ponder: bool = False
+    ponder_budget_ms: int = 5000
+
+    @model_validator(mode="after")
+    def check_shared_table(self) -> "GameConfig":
+        if self.minimax_workers > 1 and self.cols > MAX_SHARED_TT_COLS:
+            raise ValueError(f"minimax_workers > 1 supports at most {MAX_SHARED_TT_COLS} columns")
+        return self
 
 class MoveRequest(BaseModel):
     column: int
 
+class SearchInfo(BaseModel):
+    depth: Optional[int] = None        # Minimax: 完了した探索深さ
+    nodes: Optional[int] = None        # Minimax: 訪れたノード数
+    simulations: Optional[int] = None  # MCTS: 実行したシミュレーション回数
+    rollouts: Optional[int] = None     # MCTS: 行ったロールアウト回数
+    max_depth: Optional[int] = None    # MCTS: 選択で到達した最大の深さ
+    elapsed_ms: Optional[float] = None
+    tt_hit_rate: Optional[float] = None  # 置換表のヒット率
+    book: Optional[bool] = None  # 探索せずに定跡手を返した
+    solved: Optional[bool] = None  # 終盤ソルバーで読み切った
+    result: Optional[str] = None  # 読み切った結果（手番側から見て "win" / "loss" / "draw"）
+    cache_hit: Optional[bool] = None  # 読み切りの結果をキャッシュから使った
+    batch_size: Optional[float] = None  # NeuralMCTS: 探索中のネットワークの順伝播の平均局面数
+
 class GameState(BaseModel):
     game_id: str
     board: List[List[int]]  # Numpy配列はJSON化できないためリスト変換
@@ -28,4 +85,22 @@ class GameState(BaseModel):
     winner: Optional[int]
     is_terminal: bool
     last_move: Optional[int] = None
-    message: str
\ No newline at end of file
+    message: str
+    search: Optional[SearchInfo] = None  # AIの手の場合、その探索の統計
+
+class AnalyzePosition(BaseModel):
+    # 初期局面からの手順（"3342" のような0始まりの列番号の文字列、または列番号のリスト）か、盤面のどちらか
+    moves: Optional[Union[str, List[int]]] = None
+    board: Optional[List[List[int]]] = None  # GameState.board と同じ形式 (0行目が最上段)
+
+class AnalyzeBatchRequest(BaseModel):
+    positions: List[AnalyzePosition]
+    agent: AgentType = AgentType.MINIMAX
+    config: GameConfig = GameConfig()  # 盤面サイズと探索パラメータ（p1_agent / p2_agent は使わない）
+
+class AnalyzeResult(BaseModel):
+    indices: List[int]  # この結果に対応する positions の添字（同じ局面はまとめて1回だけ解析する）
+    best_move: Optional[int] = None
+    scores: Optional[List[Optional[float]]] = None  # 手番側から見た列ごとの評価値（打てない列は null）
+    search: Optional[SearchInfo] = None
+    error: Optional[str] = None
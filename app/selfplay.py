@@ -0,0 +1,289 @@
+"""
+自己対局による学習データの生成（ヘッドレス）。
+
+    python -m app.selfplay "mcts:simulation_limit=800,heavy_playouts=true" --games 100000 \
+        --output data/selfplay --workers 8
+
+エージェントは arena と同じ "種類:引数=値,..." の書式で指定し、先手・後手とも同じ設定で対局する。
+局面ごとに次の3つを記録する:
+- board: 手番側から見た盤面 (int8, 自分 1 / 相手 -1 / 空き 0。0行目が最上段)
+- policy: ルートの列ごとの訪問回数の分布 (float32)。訪問回数を出さないエージェント
+  (Minimax など) や定跡・読み切りの手では、打った列に 1。訪問回数がすべて0なら合法手に一様
+- value: その局の結果を手番側から見たもの (int8, 勝ち 1 / 引き分け 0 / 負け -1)
+
+出力ディレクトリには、シャードごとに np.load(..., mmap_mode="r") で開ける
+{シャード番号}.board.npy / .policy.npy / .value.npy と、目録の index.json を置く。
+シャードは対局の区切りで書き出すので、途中で止めても同じコマンドで続きから再開できる
+（index.json の games 局目から。--games は合計の局数）。
+
+メモリの使用量は対局数によらず一定に保つ:
+- ワーカーに投入する対局は workers * 2 局まで先行させ、結果は投入順に受け取る
+- 書き出し前のバッファは1シャード分
+- 重複の除去は局面の正規形ハッシュ（左右反転を同一視）の固定サイズの表で行う。
+  表の同じ位置に別の局面が入ると古い方は忘れるため、重複を取りこぼすことはある
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.arena import make_agent, parse_spec
+from app.core.game import Connect4Game, Player
+from app.workers import default_workers, mark_worker
+
+INDEX_VERSION = 1
+FIELDS = ("board", "policy", "value")
+
+# 1局分の記録 (board, policy, value, 正規形ハッシュ) 。各配列の先頭の次元が局面
+GameRecord = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+# --- 対局（ワーカー側） ---
+
+def play_selfplay_game(spec: str, seed: int, rows: int, cols: int,
+                       random_plies: int, sample_plies: int) -> GameRecord:
+    """
+    1局を打って記録を返す。最初の random_plies 手はランダムに打ち（記録しない）、
+    続く sample_plies 手は訪問回数に比例した確率で選ぶ（対局ごとに局面を散らすため）。
+    """
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+    rng = random.Random(seed)
+    agents = {Player.P1: make_agent(spec, seed), Player.P2: make_agent(spec, seed + 1)}
+    game = Connect4Game(rows=rows, cols=cols)
+    boards, policies, movers, keys = [], [], [], []
+    while not game.is_terminal:
+        valid = game.get_valid_moves()
+        ply = len(game.moves)
+        if ply < random_plies:
+            game.step(rng.choice(valid))
+            continue
+        mover = game.current_player
+        agent = agents[mover]
+        action = agent.get_action(game.board, valid)
+        policy = np.zeros(cols, dtype=np.float32)
+        if agent.root_visits:
+            for col, n in agent.root_visits.items():
+                policy[col] = n
+            total = policy.sum()
+            if total > 0:
+                policy /= total
+            else:
+                # 1回もシミュレーションせずに戻った（時間切れなど）ときは合法手に一様
+                policy[valid] = 1 / len(valid)
+            if ply < random_plies + sample_plies:
+                action = rng.choices(range(cols), weights=policy.tolist())[0]
+        else:
+            policy[action] = 1
+        boards.append((game.board * int(mover)).astype(np.int8))
+        policies.append(policy)
+        movers.append(int(mover))
+        keys.append(game.bitboard.canonical_hash)
+        game.step(action)
+
+    winner = 0 if game.winner is None else int(game.winner)
+    values = np.array([winner * mover for mover in movers], dtype=np.int8)
+    return (np.array(boards, dtype=np.int8).reshape(-1, rows, cols),
+            np.array(policies, dtype=np.float32).reshape(-1, cols),
+            values,
+            np.array(keys, dtype=np.uint64))
+
+
+# --- パイプライン（親プロセス側） ---
+
+def generate_games(executor, task: Callable[[int], tuple], first: int, count: int,
+                   window: int) -> Iterator[GameRecord]:
+    """
+    first 局目から count 局を投入し、結果を投入順に返す。
+    未完了の対局は window 局までしか先行させない（結果がたまり続けないように）
+    """
+    pending: "deque[Future]" = deque()
+    next_game = first
+    end = first + count
+    while next_game < end or pending:
+        while next_game < end and len(pending) < window:
+            pending.append(executor.submit(play_selfplay_game, *task(next_game)))
+            next_game += 1
+        yield pending.popleft().result()
+
+
+class SeenTable:
+    """
+    正規形ハッシュの固定サイズの表（直接マップ）。位置 hash % size に最後に見たハッシュを持つ。
+    0 は空きとして扱う（ハッシュが 0 の局面は重複を除去しない）。
+    """
+
+    def __init__(self, slots: np.ndarray):
+        self.slots = slots
+
+    @classmethod
+    def empty(cls, size: int) -> "SeenTable":
+        return cls(np.zeros(max(size, 1), dtype=np.uint64))
+
+    def filter(self, keys: np.ndarray) -> np.ndarray:
+        """keys のうち初めて見たものの bool マスクを返し、表に登録する（同じ局内の重複も除く）"""
+        fresh = np.ones(len(keys), dtype=bool)
+        size = len(self.slots)
+        for i, key in enumerate(keys.tolist()):
+            slot = key % size
+            if key and self.slots[slot] == key:
+                fresh[i] = False
+            else:
+                self.slots[slot] = key
+        return fresh
+
+
+def deduplicate(games: Iterable[GameRecord], seen: SeenTable) -> Iterator[Tuple[GameRecord, int]]:
+    """既に出た局面を除いた (1局分の記録, 元の局面数) を返す"""
+    for board, policy, value, keys in games:
+        fresh = seen.filter(keys)
+        yield (board[fresh], policy[fresh], value[fresh], keys[fresh]), len(keys)
+
+
+class ShardWriter:
+    """
+    局面をシャードにまとめて書き出し、書き出すたびに index.json と重複除去の表を更新する。
+    バッファが shard_size 局面以上になったら、その局の区切りで書き出す。
+    """
+
+    def __init__(self, path: str, index: dict, seen: SeenTable, shard_size: int):
+        self.path = path
+        self.index = index
+        self.seen = seen
+        self.shard_size = max(shard_size, 1)
+        self._buffer: Dict[str, List[np.ndarray]] = {name: [] for name in FIELDS}
+        self._buffered = 0
+        self._games = 0  # バッファにある局数
+        self._raw_positions = 0  # 重複を除く前の局面数
+
+    def add(self, record: GameRecord, raw_positions: int):
+        for name, array in zip(FIELDS, record):
+            if len(array):
+                self._buffer[name].append(array)
+        self._buffered += len(record[0])
+        self._games += 1
+        self._raw_positions += raw_positions
+        if self._buffered >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self._games:
+            return
+        shards = self.index["shards"]
+        if self._buffered:
+            name = f"{len(shards):05d}"
+            for field in FIELDS:
+                _atomic_save(os.path.join(self.path, f"{name}.{field}.npy"), np.concatenate(self._buffer[field]))
+            shards.append({"name": name, "positions": self._buffered})
+        self.index["games"] += self._games
+        self.index["positions"] += self._buffered
+        self.index["raw_positions"] += self._raw_positions
+        # 表は書き出した局までの状態で保存する（再開時にバッファの分を重複と見なさないように）
+        _atomic_save(os.path.join(self.path, "seen.npy"), self.seen.slots)
+        _atomic_write_json(os.path.join(self.path, "index.json"), self.index)
+        self._buffer = {name: [] for name in FIELDS}
+        self._buffered = self._games = self._raw_positions = 0
+
+
+def run_selfplay(spec: str, games: int, output: str, rows: int = 6, cols: int = 7, seed: int = 0,
+                 workers: Optional[int] = None, shard_size: int = 1 << 16, random_plies: int = 2,
+                 sample_plies: int = 8, seen_slots: int = 1 << 22) -> dict:
+    """
+    output に合計 games 局分のデータを作る（既にあれば続きから）。更新後の index を返す。
+    再開時は盤面サイズ・エージェント・シードなどの設定が一致している必要がある。
+    """
+    parse_spec(spec)  # ワーカーに投げる前に書式を確認する
+    settings = {"agent": spec, "rows": rows, "cols": cols, "seed": seed,
+                "random_plies": random_plies, "sample_plies": sample_plies}
+    os.makedirs(output, exist_ok=True)
+    index_path = os.path.join(output, "index.json")
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported self-play index version {index.get('version')!r} in {output}")
+        changed = {k: (index["settings"].get(k), v) for k, v in settings.items() if index["settings"].get(k) != v}
+        if changed:
+            raise ValueError(f"Self-play settings differ from the existing data in {output}: {changed}")
+        seen = SeenTable(np.load(os.path.join(output, "seen.npy")))
+    else:
+        index = {"version": INDEX_VERSION, "settings": settings, "games": 0, "positions": 0,
+                 "raw_positions": 0, "shards": []}
+        seen = SeenTable.empty(seen_slots)
+
+    first = index["games"]
+    remaining = max(games - first, 0)
+    workers = workers or default_workers()
+    writer = ShardWriter(output, index, seen, shard_size)
+    start = time.perf_counter()
+
+    def task(game: int) -> tuple:
+        # シードは局番号だけで決まるので、並列度を変えても再開しても結果は同じ
+        return spec, seed * 1_000_003 + game * 2, rows, cols, random_plies, sample_plies
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=mark_worker) as executor:
+        records = deduplicate(generate_games(executor, task, first, remaining, workers * 2), seen)
+        for done, (record, raw) in enumerate(records, 1):
+            writer.add(record, raw)
+            rate = done / (time.perf_counter() - start)
+            print(f"\r{first + done}/{games} games ({rate:.1f} games/s)", end="", file=sys.stderr, flush=True)
+        writer.flush()
+    if remaining:
+        print(file=sys.stderr)
+    return index
+
+
+def open_dataset(path: str) -> List[Dict[str, np.ndarray]]:
+    """書き出したシャードを {"board", "policy", "value"} のメモリマップ配列として開く（学習用）"""
+    with open(os.path.join(path, "index.json")) as f:
+        index = json.load(f)
+    return [{field: np.load(os.path.join(path, f"{shard['name']}.{field}.npy"), mmap_mode="r") for field in FIELDS}
+            for shard in index["shards"]]
+
+
+def _atomic_save(path: str, array: np.ndarray):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)  # 途中で止めても壊れたファイルを残さない
+
+
+def _atomic_write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate self-play training data")
+    parser.add_argument("agent", help='agent spec, e.g. "mcts:simulation_limit=800"')
+    parser.add_argument("--games", type=int, required=True, help="total games (an existing output is resumed)")
+    parser.add_argument("--output", required=True, help="output directory")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="worker processes (default: MIRAI_WORKERS or CPU count)")
+    parser.add_argument("--shard-size", type=int, default=1 << 16, help="positions per shard")
+    parser.add_argument("--random-plies", type=int, default=2, help="random opening moves (not recorded)")
+    parser.add_argument("--sample-plies", type=int, default=8,
+                        help="moves after the random opening sampled from the visit distribution")
+    parser.add_argument("--seen-slots", type=int, default=1 << 22, help="size of the deduplication table")
+    args = parser.parse_args(argv)
+
+    index = run_selfplay(args.agent, args.games, args.output, rows=args.rows, cols=args.cols, seed=args.seed,
+                         workers=args.workers, shard_size=args.shard_size, random_plies=args.random_plies,
+                         sample_plies=args.sample_plies, seen_slots=args.seen_slots)
+    print(f"{index['games']} games, {index['positions']} positions "
+          f"({index['raw_positions'] - index['positions']} duplicates dropped), {len(index['shards'])} shards")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
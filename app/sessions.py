@@ -0,0 +1,293 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.game import Connect4Game
+from app.agents.base import BaseAgent
+from app.schemas import GameConfig
+
+# 盤面以外のゲームオブジェクトの固定費（バイト、概算）
+GAME_BYTES = 2000
+
+
+class SessionConflict(Exception):
+    """保存しようとしたゲームが、別のワーカーによって先に進められていた"""
+    pass
+
+
+def encode_moves(moves: Iterable[int]) -> bytes:
+    """手の履歴を1手1バイトで表す（列数は255以下を想定）"""
+    return bytes(moves)
+
+
+def decode_moves(data: bytes) -> List[int]:
+    return list(data)
+
+
+def replay(config: GameConfig, moves: Iterable[int]) -> Connect4Game:
+    """設定と手の履歴からゲームを復元する"""
+    game = Connect4Game(rows=config.rows, cols=config.cols)
+    for col in moves:
+        game.step(col)
+    return game
+
+
+class Session:
+    """1つの対局（ゲーム本体、AIエージェント、最終アクセス時刻）"""
+    __slots__ = ("game_id", "config", "game", "agents", "last_access", "touched_at", "saved_moves", "size")
+
+    def __init__(self, game_id: str, config: GameConfig, game: Connect4Game, agents: Dict[int, BaseAgent]):
+        self.game_id = game_id
+        self.config = config
+        self.game = game
+        self.agents = agents
+        self.last_access = time.monotonic()
+        self.touched_at = 0.0  # ディスク上の最終アクセス時刻を最後に更新した時刻 (time.monotonic)
+        self.saved_moves = 0  # ディスクに保存済みの手数
+        self.size = 0  # メモリ使用量の概算（バイト）
+
+    def estimate_size(self) -> int:
+        self.size = GAME_BYTES + self.game.rows * self.game.cols * 8 + sum(
+            agent.memory_estimate() for agent in self.agents.values())
+        return self.size
+
+
+class SQLiteBackend:
+    """
+    セッションをSQLiteに保存する。1局は (設定のJSON, 手の履歴) の1行だけで、
+    読み込み時に手を再生して盤面を復元する。複数のuvicornワーカーで同じファイルを共有できる。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " game_id TEXT PRIMARY KEY,"
+            " config TEXT NOT NULL,"
+            " moves BLOB NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._lock = threading.Lock()
+
+    def load(self, game_id: str) -> Optional[Tuple[GameConfig, List[int]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT config, moves FROM sessions WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        return GameConfig.model_validate_json(row[0]), decode_moves(row[1])
+
+    def insert(self, game_id: str, config: GameConfig):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (game_id, config, moves, updated_at) VALUES (?, ?, ?, ?)",
+                (game_id, config.model_dump_json(), b"", time.time()))
+
+    def update(self, game_id: str, moves: List[int], expected_moves: int) -> bool:
+        """保存済みの手数が expected_moves のときだけ更新する（他のワーカーとの競合検出）"""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE sessions SET moves = ?, updated_at = ? WHERE game_id = ? AND length(moves) = ?",
+                (encode_moves(moves), time.time(), game_id, expected_moves))
+        return cur.rowcount == 1
+
+    def touch(self, game_id: str):
+        """最終アクセス時刻を更新する（手を打たずに読まれているだけのセッションを purge させない）"""
+        with self._lock:
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE game_id = ?", (time.time(), game_id))
+
+    def delete(self, game_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE game_id = ?", (game_id,))
+
+    def purge(self, older_than: float) -> int:
+        """最終アクセスが older_than (UNIX時刻) より前のセッションを削除する"""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (older_than,))
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SessionStore:
+    """
+    セッションをメモリ上に保持するLRUキャッシュ。
+
+    - 最後にアクセスされてから ttl 秒経ったセッションは破棄する
+    - セッション数が max_sessions を、メモリ使用量の概算が max_bytes を超えたら
+      最も長くアクセスされていないものから追い出す（AIが思考中のものは除く）
+    - backend を指定すると、手を打つたびにディスクへ保存する。追い出されたセッションや
+      他のワーカーが作ったセッションは、アクセス時に手を再生して復元する
+
+    backend があるとき、期限切れで外すのはこのワーカーのメモリ上のコピーだけにする
+    （他のワーカーが使っているかもしれない）。ディスク上の行は、どのワーカーからのアクセスでも
+    更新される最終アクセス時刻 (updated_at) が ttl を過ぎたものを purge で消す。
+    """
+
+    # ディスク上の期限切れセッションを掃除する間隔（秒）
+    PURGE_INTERVAL = 60.0
+    # アクセス時にディスク上の最終アクセス時刻を更新する最短の間隔（秒）。purge はこの分の遅れを見込む
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, ttl: Optional[float] = 3600.0, max_sessions: Optional[int] = 10000,
+                 max_bytes: Optional[int] = None, backend: Optional[SQLiteBackend] = None):
+        self.ttl = ttl or None
+        self.max_sessions = max_sessions or None
+        self.max_bytes = max_bytes or None
+        self.backend = backend
+        # 設定からエージェントを作る関数（復元時に使う）。GameManager が設定する
+        self.agent_factory: Optional[Callable[[GameConfig], Dict[int, BaseAgent]]] = None
+        # 追い出してはいけないセッションか（AIが思考中など）
+        self.is_pinned: Callable[[str], bool] = lambda game_id: False
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self._last_purge = 0.0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """
+        環境変数から作る。
+        MIRAI_SESSION_TTL: 無操作で破棄するまでの秒数（0で無期限、既定3600）
+        MIRAI_SESSION_MAX: メモリ上に保持するセッション数の上限（0で無制限、既定10000）
+        MIRAI_SESSION_MAX_MB: メモリ使用量の概算の上限（MB、既定は無制限）
+        MIRAI_SESSION_DB: 指定するとそのパスのSQLiteにセッションを保存する
+        """
+        db = os.environ.get("MIRAI_SESSION_DB")
+        max_mb = float(os.environ.get("MIRAI_SESSION_MAX_MB", 0))
+        return cls(
+            ttl=float(os.environ.get("MIRAI_SESSION_TTL", 3600)),
+            max_sessions=int(os.environ.get("MIRAI_SESSION_MAX", 10000)),
+            max_bytes=int(max_mb * 1024 * 1024),
+            backend=SQLiteBackend(db) if db else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def add(self, session: Session):
+        with self._lock:
+            if self.backend is not None:
+                self.backend.insert(session.game_id, session.config)
+                session.touched_at = time.monotonic()
+            self._put(session)
+            self._evict()
+
+    def get(self, game_id: str) -> Optional[Session]:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(game_id)
+            if self.backend is not None:
+                session = self._sync(game_id, session)
+            if session is None:
+                return None
+            session.last_access = time.monotonic()
+            if self.backend is not None and session.last_access - session.touched_at >= self.TOUCH_INTERVAL:
+                self.backend.touch(game_id)
+                session.touched_at = session.last_access
+            self._sessions.move_to_end(game_id)
+            return session
+
+    def save(self, game_id: str, game: Connect4Game):
+        """
+        game に手を打った後に呼ぶ。ディスクへの保存とメモリ使用量の再計算を行う。
+        その間にセッションが破棄・再読み込みされていたり、他のワーカーが先に手を進めていたら SessionConflict
+        """
+        with self._lock:
+            session = self._sessions.get(game_id)
+            if session is None or session.game is not game:
+                raise SessionConflict(game_id)
+            moves = game.moves
+            if self.backend is not None and len(moves) != session.saved_moves:
+                if not self.backend.update(game_id, moves, session.saved_moves):
+                    # 次回のアクセスでディスクから読み直させる
+                    self._drop(game_id)
+                    raise SessionConflict(game_id)
+                session.saved_moves = len(moves)
+                session.touched_at = time.monotonic()
+            old = session.size
+            self._bytes += session.estimate_size() - old
+            self._evict()
+
+    def delete(self, game_id: str):
+        with self._lock:
+            self._drop(game_id)
+            if self.backend is not None:
+                self.backend.delete(game_id)
+
+    def _put(self, session: Session):
+        self._drop(session.game_id)
+        self._sessions[session.game_id] = session
+        self._bytes += session.estimate_size()
+
+    def _drop(self, game_id: str) -> Optional[Session]:
+        session = self._sessions.pop(game_id, None)
+        if session is not None:
+            self._bytes -= session.size
+        return session
+
+    def _sync(self, game_id: str, session: Optional[Session]) -> Optional[Session]:
+        """ディスク上の内容とメモリ上のセッションを一致させる"""
+        stored = self.backend.load(game_id)
+        if stored is None:
+            # 他のワーカーで削除された、または期限切れで掃除された
+            self._drop(game_id)
+            return None
+        config, moves = stored
+        if session is not None and len(moves) == session.saved_moves:
+            return session
+        # 未読み込み、または他のワーカーで手が進んでいる。エージェントの探索状態はそのまま引き継ぐ
+        agents = session.agents if session is not None else self.agent_factory(config)
+        session = Session(game_id, config, replay(config, moves), agents)
+        session.saved_moves = len(moves)
+        self._put(session)
+        self._evict()
+        return session
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        # 古い順に並んでいるので先頭から見て、期限内か思考中のものが出てきたらそれ以降は見ない
+        while self._sessions:
+            game_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl or self.is_pinned(game_id):
+                break
+            self._drop(game_id)
+        if self.backend is not None and now - self._last_purge >= self.PURGE_INTERVAL:
+            self._last_purge = now
+            self.backend.purge(time.time() - self.ttl - self.TOUCH_INTERVAL)
+
+    def _evict(self):
+        """
+        上限を超えている間、古いものから追い出す。ディスクに保存していればメモリから外すだけで、
+        保存していなければそのセッションは失われる
+        """
+        count, size = len(self._sessions), self._bytes
+        victims = []
+        # 上限内なら先頭も見ずに終わる。超えていれば、古い順に超過分だけ選んでから外す
+        for game_id, session in self._sessions.items():
+            over_count = self.max_sessions is not None and count > self.max_sessions
+            over_bytes = self.max_bytes is not None and size > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            if self.is_pinned(game_id):
+                continue
+            victims.append(game_id)
+            count -= 1
+            size -= session.size
+        for game_id in victims:
+            self._drop(game_id)
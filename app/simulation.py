@@ -1,8 +1,35 @@
 import time
+from typing import Callable, List, Optional, Tuple
 from app.core.game import Connect4Game, Player
+from app.agents.base import BaseAgent
 from app.agents.random_agent import RandomAgent
 from app.agents.minimax_agent import MinimaxAgent
 
+# 1手ごとに呼ぶコールバック: (ゲーム, 打ったプレイヤー, 列, 思考時間[秒])
+MoveCallback = Callable[[Connect4Game, int, int, float], None]
+
+
+def play_game(agent1: BaseAgent, agent2: BaseAgent, rows: int = 6, cols: int = 7,
+              on_move: Optional[MoveCallback] = None) -> Tuple[Optional[Player], List[int], List[float]]:
+    """
+    agent1 (先手) と agent2 (後手) を1局対戦させ、(勝者, 手順, 各手の思考時間[秒]) を返す。
+    表示や待ち時間は入れない（必要なら on_move で行う）。
+    """
+    game = Connect4Game(rows=rows, cols=cols)
+    times: List[float] = []
+    while not game.is_terminal:
+        player = game.current_player
+        agent = agent1 if player == Player.P1 else agent2
+        start = time.perf_counter()
+        action = agent.get_action(game.board, game.get_valid_moves())
+        elapsed = time.perf_counter() - start
+        game.step(action)
+        times.append(elapsed)
+        if on_move is not None:
+            on_move(game, player, action, elapsed)
+    return game.winner, game.moves, times
+
+
 def run_console_simulation(rows=6, cols=7, delay=0.5):
     print(f"=== Starting Simulation: Board {rows}x{cols} ===")
     
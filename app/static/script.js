@@ -2,6 +2,7 @@ let currentGameId = null;
 let gameState = null;
 let config = {};
 let aiTurnTimeout = null; // 【追加】タイマーIDを保持する変数
+let gameSocket = null; // AIの思考の途中経過を受け取るWebSocket
 
 const API_BASE = ""; 
 
@@ -16,7 +17,12 @@ function resetGameState() {
         clearTimeout(aiTurnTimeout);
         aiTurnTimeout = null;
     }
-    // 2. IDを無効化（通信中の処理が戻ってきたときに無視させるため）
+    // 2. 前のゲームのWebSocketを閉じる
+    if (gameSocket) {
+        gameSocket.close();
+        gameSocket = null;
+    }
+    // 3. IDを無効化（通信中の処理が戻ってきたときに無視させるため）
     currentGameId = null;
     gameState = null;
     statusDiv.innerText = "Resetting...";
@@ -54,6 +60,7 @@ async function startGame() {
         // ここで正式に新しいIDをセット
         gameState = newGameState;
         currentGameId = gameState.game_id;
+        openGameSocket(currentGameId);
         
         renderBoard();
         checkNextTurn();
@@ -62,6 +69,24 @@ async function startGame() {
     }
 }
 
+// ゲームのイベントを受け取るWebSocketを開く（AIの思考中の途中経過を表示するため）
+function openGameSocket(gameId) {
+    const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${location.host}${API_BASE}/games/${gameId}/ws`);
+    socket.onmessage = (message) => {
+        if (currentGameId !== gameId) return;
+        const event = JSON.parse(message.data);
+        if (event.type === 'progress') {
+            const progress = event.depth !== undefined
+                ? `depth ${event.depth}`
+                : `${event.simulations} simulations`;
+            statusDiv.innerHTML = `AI (Player ${gameState.current_player === 1 ? '1' : '2'}) is thinking... ` +
+                `best: column ${event.best_move} (${progress}) <span class="thinking">●</span>`;
+        }
+    };
+    gameSocket = socket;
+}
+
 async function makeHumanMove(col) {
     if (!currentGameId || gameState.is_terminal) return;
     
@@ -0,0 +1,321 @@
+import os
+import atexit
+import asyncio
+import copy
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, Tuple
+
+# プロセスプールはリクエストごとに作らず、プロセス内で1つを使い回す
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+# このプロセスがプールのワーカーかどうか（ワーカー内でさらにプールを作らないため）
+_in_worker = False
+
+
+def mark_worker():
+    """プロセスプールの initializer に渡し、そのプロセスをワーカーとして印を付ける"""
+    global _in_worker
+    _in_worker = True
+
+
+def in_worker() -> bool:
+    return _in_worker
+
+
+def default_workers() -> int:
+    """ワーカープロセス数。環境変数 MIRAI_WORKERS があればそれを、なければCPUコア数を使う"""
+    env = os.environ.get("MIRAI_WORKERS")
+    if env:
+        return max(int(env), 1)
+    return os.cpu_count() or 1
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=default_workers(), initializer=mark_worker)
+        return _executor
+
+
+def reset_executor():
+    """ワーカーが異常終了した (BrokenProcessPool) 場合などに、次回呼び出しで作り直させる"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_executor():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+
+# --- AIの手の計算をリクエスト処理から切り離すためのディスパッチャ ---
+
+class PoolSaturated(Exception):
+    """実行中と待機中の計算が上限に達している"""
+    def __init__(self, pending: int):
+        super().__init__(f"AI worker pool is saturated ({pending} moves pending)")
+        self.pending = pending
+
+
+class MoveTimeout(Exception):
+    """
+    AIの手の計算が制限時間を超えた。running はまだ止まっていない計算（スレッド実行など、
+    中断できなかった場合）の Future で、呼び出し側はそれが終わるまで同じエージェントを使わせないこと
+    """
+    def __init__(self, running: Optional[asyncio.Future] = None):
+        super().__init__()  # ワーカーから pickle で戻すときに running を引数として復元させない
+        self.running = running
+
+
+def _raise_move_timeout(signum, frame):
+    raise MoveTimeout()
+
+
+# AI用ワーカーから親プロセスへ探索の途中経過を送るキュー（ワーカー側で初期化時に設定される）
+_progress_queue = None
+# 先読みの打ち切り指示（共有メモリ上の枠ごとのフラグ）。親プロセスとワーカーで同じ配列を見る
+_ponder_flags = None
+
+
+def _init_move_worker(progress_queue, ponder_flags):
+    global _progress_queue, _ponder_flags
+    mark_worker()
+    _progress_queue = progress_queue
+    _ponder_flags = ponder_flags
+
+
+def _put_progress(game_id: str, info: dict):
+    _progress_queue.put((game_id, info))
+
+
+def _compute_move(agent, board, valid_moves, timeout: Optional[float],
+                  progress: Optional[Callable[[dict], None]] = None, alarm: bool = True) -> Tuple[int, Any]:
+    """
+    ワーカープロセス側で実行する。探索状態（MCTSの木や置換表）を引き継ぐため、
+    更新後のエージェントも一緒に返す。制限時間を超えたら SIGALRM で探索を中断する
+    （スレッドで実行するときは alarm=False。制限時間は agent.move_deadline として終盤ソルバーが見る）。
+    """
+    alarm = alarm and timeout is not None and hasattr(signal, "setitimer")
+    if alarm:
+        signal.signal(signal.SIGALRM, _raise_move_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    agent.on_progress = progress
+    agent.move_deadline = None if timeout is None else time.perf_counter() + timeout
+    try:
+        action = agent.get_action(board, valid_moves)
+    finally:
+        agent.on_progress = None  # コールバックは親プロセスへ送り返せないため外す
+        agent.move_deadline = None
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return action, agent
+
+
+def _compute_move_on_copy(agent, *args) -> Tuple[int, Any]:
+    """
+    スレッドで実行するときは、渡されたエージェントのコピーで探索する（プロセス実行では pickle が同じ役割）。
+    時間切れや失敗で結果を捨てても、セッションのエージェントは探索の途中の状態にならない
+    """
+    return _compute_move(copy.deepcopy(agent), *args)
+
+
+def _ponder_stopped(slot: int) -> bool:
+    return bool(_ponder_flags[slot])
+
+
+def _ponder(agent, board, budget: float, slot: int) -> Tuple[int, Any]:
+    """ワーカー側で先読みを行い、(探索量, 探索状態を温めたエージェント) を返す"""
+    deadline = time.perf_counter() + budget
+    done = agent.ponder(board, deadline, partial(_ponder_stopped, slot))
+    return done, agent
+
+
+def _ponder_on_copy(agent, *args) -> Tuple[int, Any]:
+    """スレッドで先読みするときは、_compute_move_on_copy と同じくコピーで行う"""
+    return _ponder(copy.deepcopy(agent), *args)
+
+
+class PonderTicket:
+    """実行中の先読み1件。stop() で打ち切りを指示する（ワーカー側は次の確認で戻る）"""
+
+    def __init__(self, slot: int):
+        self.slot = slot
+
+    def stop(self):
+        _ponder_flags[self.slot] = 1
+
+
+class MoveDispatcher:
+    """
+    AIの手の計算を専用のプロセスプールで実行する。
+
+    - MIRAI_AI_EXECUTOR: "process"（既定）または "thread"（プロセス間でエージェントを受け渡さない）
+    - MIRAI_AI_WORKERS: 計算に使うワーカープロセス数（既定はCPUコア数）
+    - MIRAI_AI_QUEUE: ワーカーが埋まっているときに待たせる数の上限。超えたら PoolSaturated
+    - MIRAI_AI_TIMEOUT: 1手あたりの制限時間（秒）。超えたら MoveTimeout
+    - MIRAI_PONDER_SLOTS: 同時に行う先読みの数の上限（既定はワーカー数の半分、最低1）。
+      埋まっているときは先読みしない
+
+    自前でプロセスプールを使うエージェント（並列MCTS）は、二重にプロセスを使わないよう
+    スレッドで実行する。runs_in_thread が真のエージェント（推論サービスを共有する NeuralMCTS）も
+    スレッドで実行する。
+
+    run() に game_id を渡すと、探索の途中経過が on_progress(game_id, info) で通知される
+    （ワーカープロセスからはキュー経由で、親プロセスの受信スレッドが呼び出す）。
+    """
+
+    def __init__(self):
+        self.mode = os.environ.get("MIRAI_AI_EXECUTOR", "process")
+        self.workers = max(int(os.environ.get("MIRAI_AI_WORKERS", 0)) or default_workers(), 1)
+        self.max_queue = int(os.environ.get("MIRAI_AI_QUEUE", self.workers * 2))
+        timeout = os.environ.get("MIRAI_AI_TIMEOUT", "30")
+        self.timeout = float(timeout) if timeout else None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.on_progress: Optional[Callable[[str, dict], None]] = None
+        self._progress_queue = None
+        self._progress_thread: Optional[threading.Thread] = None
+        self.ponder_slots = max(int(os.environ.get("MIRAI_PONDER_SLOTS", 0)) or self.workers // 2, 1)
+        self._free_slots = list(range(self.ponder_slots))
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _ensure_ponder_flags(self):
+        # ワーカーに初期化時に渡すため、プロセスプールより先に作る
+        global _ponder_flags
+        if _ponder_flags is None:
+            _ponder_flags = multiprocessing.Array("b", self.ponder_slots, lock=False)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            self._ensure_ponder_flags()
+            if self._executor is None:
+                self._progress_queue = multiprocessing.Queue()
+                self._progress_thread = threading.Thread(
+                    target=self._drain_progress, args=(self._progress_queue,), daemon=True)
+                self._progress_thread.start()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_move_worker,
+                    initargs=(self._progress_queue, _ponder_flags))
+            return self._executor
+
+    def _drain_progress(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            self._emit(*item)
+
+    def _emit(self, game_id: str, info: dict):
+        if self.on_progress is not None:
+            self.on_progress(game_id, info)
+
+    async def run(self, agent, board, valid_moves, game_id: Optional[str] = None) -> Tuple[int, Any]:
+        """
+        (選んだ列, 更新後のエージェント) を返す。渡した agent 自体は書き換えない。
+        時間切れの MoveTimeout でも計算が止まっていなければ、止まるまで実行中の数に含める
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise PoolSaturated(self._pending)
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if (self.mode == "thread" or getattr(agent, "uses_process_pool", False)
+                    or getattr(agent, "runs_in_thread", False)):
+                progress = partial(self._emit, game_id) if game_id else None
+                future = loop.run_in_executor(
+                    None, _compute_move_on_copy, agent, board, valid_moves, self.timeout, progress, False)
+            else:
+                executor = self._get_executor()
+                progress = partial(_put_progress, game_id) if game_id else None
+                future = loop.run_in_executor(
+                    executor, _compute_move, agent, board, valid_moves, self.timeout, progress)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        if self.timeout is None:
+            return await future
+        # ワーカー側の中断が効かない場合（スレッド実行など）に備えて、こちらでも待ち時間を区切る。
+        # 実行中のスレッドは止められないので、future は取り消さずに呼び出し側へ渡す
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout + 1.0)
+        except asyncio.TimeoutError:
+            raise MoveTimeout(future)
+
+    def _release(self, future: Optional[asyncio.Future] = None):
+        if future is not None and not future.cancelled():
+            future.exception()  # 時間切れで誰も待たなくなった計算の例外を、未取得として警告させない
+        with self._lock:
+            self._pending -= 1
+
+    def start_ponder(self) -> Optional[PonderTicket]:
+        """先読みの枠を確保する。空きが無ければ None（その局面では先読みしない）"""
+        with self._lock:
+            self._ensure_ponder_flags()
+            if not self._free_slots:
+                return None
+            slot = self._free_slots.pop()
+        _ponder_flags[slot] = 0
+        return PonderTicket(slot)
+
+    async def ponder(self, agent, board, budget: float, ticket: PonderTicket) -> Tuple[int, Any]:
+        """
+        agent.ponder を最長 budget 秒、AI用のワーカーで実行し、(探索量, 更新後のエージェント) を返す。
+        run() と同じく渡した agent 自体は書き換えない。終わったら枠を返す。
+        自前でプロセスプールを使うエージェントや runs_in_thread のものはスレッドで実行する
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            if (self.mode == "thread" or getattr(agent, "uses_process_pool", False)
+                    or getattr(agent, "runs_in_thread", False)):
+                return await loop.run_in_executor(None, _ponder_on_copy, agent, board, budget, ticket.slot)
+            executor = self._get_executor()
+            return await loop.run_in_executor(executor, _ponder, agent, board, budget, ticket.slot)
+        finally:
+            with self._lock:
+                self._free_slots.append(ticket.slot)
+
+    async def submit(self, fn, *args, in_thread: bool = False):
+        """
+        fn(*args) をAI用のワーカーで実行する（局面解析のまとめ処理など）。
+        in_thread が真ならワーカープロセスではなくスレッドで実行する（runs_in_thread のエージェント用）。
+        呼び出し側で同時に投入する数を workers 程度に抑えること。
+        """
+        loop = asyncio.get_running_loop()
+        executor = None if self.mode == "thread" or in_thread else self._get_executor()
+        return await loop.run_in_executor(executor, fn, *args)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            queue, self._progress_queue = self._progress_queue, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if queue is not None:
+            queue.put(None)
+
+
+move_dispatcher = MoveDispatcher()
+
+
+atexit.register(shutdown_executor)
+atexit.register(move_dispatcher.shutdown)